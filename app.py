@@ -1,14 +1,40 @@
 import os
+import re
+import sys
+import gzip
 import json
+import gc
+import mmap
+import struct
+import time
+import select
+import signal
+import socket
+import uuid
+import random
+import shutil
+import sqlite3
 import hashlib
+import threading
+import mimetypes
 import subprocess
+from collections import OrderedDict, deque
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, List, Callable, Optional
-from datetime import datetime
+from typing import Dict, Any, List, Callable, ContextManager, Iterator, Optional, Tuple
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, flash, session
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from flask import Flask, render_template, request, redirect, url_for, send_from_directory, send_file, flash, session, abort, g, has_request_context
 from werkzeug.utils import secure_filename
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import check_password_hash, generate_password_hash, safe_join
 
 # Try to import MySQL, but don't fail if not available
 try:
@@ -29,6 +55,11 @@ for d in [UPLOAD_DIR, PROCESSED_DIR, TEMPLATES_DIR]:
 	os.makedirs(d, exist_ok=True)
 
 app = Flask(__name__, template_folder=str(TEMPLATES_DIR), static_folder='static')
+# Proxies confiáveis à frente do app (Render: 1); o ProxyFix usa só esses hops do
+# X-Forwarded-For para o remote_addr, e valores forjados pelo cliente ficam de fora
+PROXY_HOPS = int(os.environ.get('PROXY_HOPS', 1))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
 # Use a secure secret key from environment or generate a random one
 app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24).hex())
 # Allow up to 16 MB per upload (reduced for mobile stability)
@@ -47,10 +78,373 @@ os.makedirs(STATIC_DIR / 'css', exist_ok=True)
 os.makedirs(STATIC_DIR / 'js', exist_ok=True)
 os.makedirs(STATIC_DIR / 'images', exist_ok=True)
 
+# Assets estáticos: `flask --app app assets` (no build da imagem) minifica, gera nomes com
+# hash do conteúdo e variantes .gz/.br em static/dist; sem manifest, servidos como estão
+ASSET_DIST_DIR = STATIC_DIR / 'dist'
+ASSET_MANIFEST_PATH = ASSET_DIST_DIR / 'manifest.json'
+ASSET_SOURCES = ['css/*.css', 'js/*.js']
+ASSET_CACHE_SECONDS = 365 * 24 * 3600
+HTML_COMPRESS_MIN_BYTES = 1024
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+def minify_css(text: str) -> str:
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    # Espaço antes de ':' é mantido (seletor descendente, ex.: "a :hover")
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+def minify_js(text: str) -> str:
+    """Conservador: só comentários de linha inteira, indentação e linhas vazias"""
+    text = re.sub(r'^\s*/\*.*?\*/\s*$', '', text, flags=re.S | re.M)
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+def build_assets() -> Dict[str, str]:
+    """Gera static/dist e o manifest (nome original -> nome com hash)"""
+    shutil.rmtree(ASSET_DIST_DIR, ignore_errors=True)
+    manifest: Dict[str, str] = {}
+    for pattern in ASSET_SOURCES:
+        for source in sorted(STATIC_DIR.glob(pattern)):
+            name = source.relative_to(STATIC_DIR).as_posix()
+            minify = minify_css if source.suffix == '.css' else minify_js
+            data = minify(source.read_text(encoding='utf-8')).encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            hashed = Path(name).with_name(f"{source.stem}.{digest}{source.suffix}").as_posix()
+            target = ASSET_DIST_DIR / hashed
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(data)
+            target.with_name(target.name + '.gz').write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+            if BROTLI_AVAILABLE:
+                target.with_name(target.name + '.br').write_bytes(brotli.compress(data, quality=11))
+            manifest[name] = hashed
+    ASSET_MANIFEST_PATH.write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+def load_asset_manifest() -> Dict[str, str]:
+    try:
+        return json.loads(ASSET_MANIFEST_PATH.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+ASSET_MANIFEST = load_asset_manifest()
+
+@app.template_global()
+def asset_url(name: str) -> str:
+    """URL com hash (cache imutável) quando o build existe; senão o arquivo original"""
+    hashed = ASSET_MANIFEST.get(name)
+    if hashed is None:
+        return url_for('static', filename=name)
+    return url_for('asset', filename=hashed)
+
+@app.route('/assets/<path:filename>')
+def asset(filename: str):
+    path = safe_join(str(ASSET_DIST_DIR), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    
+    # Variante pré-comprimida que o cliente aceitar (br > gzip)
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if candidate in request.accept_encodings and os.path.isfile(path + suffix):
+            encoding, path = candidate, path + suffix
+            break
+    
+    response = send_file(path, mimetype=mimetype, conditional=True, max_age=ASSET_CACHE_SECONDS)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # O nome muda junto com o conteúdo
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_CACHE_SECONDS}, immutable'
+    return response
+
+@app.after_request
+def compress_html(response):
+    """Comprime as páginas HTML (br quando disponível, senão gzip)"""
+    if (response.mimetype != 'text/html' or response.direct_passthrough
+            or response.status_code != 200 or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < HTML_COMPRESS_MIN_BYTES:
+        return response
+    accepted = request.accept_encodings
+    if BROTLI_AVAILABLE and 'br' in accepted:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif 'gzip' in accepted:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.cli.command('assets')
+def assets_command():
+    """Minify, fingerprint and precompress static assets into static/dist"""
+    manifest = build_assets()
+    print(f"Built {len(manifest)} assets in {ASSET_DIST_DIR} (brotli: {BROTLI_AVAILABLE})")
+
+class ScratchSpace:
+    """Arquivos intermediários em tmpfs (limitado por orçamento de memória) com fallback em disco"""
+    
+    # Sobras de workers mortos deixam de contar no orçamento após esse tempo
+    STALE_SECONDS = 3600
+    
+    def __init__(self, memory_dir: Optional[Path], disk_dir: Path, memory_budget: int):
+        self.memory_dir = memory_dir
+        self.disk_dir = disk_dir
+        self.memory_budget = memory_budget
+        os.makedirs(self.disk_dir, exist_ok=True)
+        if self.memory_dir is not None:
+            try:
+                os.makedirs(self.memory_dir, exist_ok=True)
+            except OSError as e:
+                print(f"Scratch tmpfs unavailable ({e}), using disk only")
+                self.memory_dir = None
+    
+    def memory_usage(self) -> int:
+        """Bytes ocupados no tmpfs (compartilhado entre os workers)"""
+        if self.memory_dir is None:
+            return 0
+        total = 0
+        now = time.time()
+        for entry in os.scandir(self.memory_dir):
+            try:
+                stat = entry.stat()
+                if now - stat.st_mtime > self.STALE_SECONDS:
+                    os.unlink(entry.path)
+                    continue
+                total += stat.st_size
+            except FileNotFoundError:
+                continue
+        return total
+    
+    def _choose_dir(self, size_hint: int) -> Path:
+        if self.memory_dir is not None and self.memory_usage() + size_hint <= self.memory_budget:
+            return self.memory_dir
+        return self.disk_dir
+    
+    @contextmanager
+    def directory(self) -> Iterator[Path]:
+        """Diretório temporário em disco (segmentos grandes), removido ao sair do bloco"""
+        tmp_dir = self.disk_dir / uuid.uuid4().hex
+        tmp_dir.mkdir()
+        try:
+            yield tmp_dir
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    @contextmanager
+    def path(self, suffix: str = '', size_hint: int = 0) -> Iterator[Path]:
+        """Caminho temporário (não criado) removido ao sair do bloco"""
+        tmp_path = self._choose_dir(size_hint) / f"{uuid.uuid4().hex}{suffix}"
+        try:
+            yield tmp_path
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+    
+    def publish(self, tmp_path: Path, dst: Path) -> None:
+        """Publica o resultado em dst atomicamente com os.replace"""
+        try:
+            os.replace(tmp_path, dst)
+        except OSError:
+            # tmpfs e processed/ em sistemas de arquivos diferentes: copia para
+            # um temporário ao lado do destino e então troca atomicamente
+            staging = dst.with_name(f".{dst.name}.{uuid.uuid4().hex}.tmp")
+            try:
+                shutil.copyfile(tmp_path, staging)
+                os.replace(staging, dst)
+            finally:
+                if staging.exists():
+                    staging.unlink()
+
+SCRATCH_MEMORY_BUDGET = int(os.environ.get('SCRATCH_MEMORY_BUDGET', 256 * 1024 * 1024))
+SCRATCH = ScratchSpace(
+    memory_dir=Path('/dev/shm/trend-scratch') if os.path.isdir('/dev/shm') else None,
+    disk_dir=PROCESSED_DIR / '.scratch',
+    memory_budget=SCRATCH_MEMORY_BUDGET,
+)
+
+class ToolCancelled(Exception):
+    """O job foi abandonado (cliente desconectou) e seus subprocessos encerrados"""
+
+class ToolJob:
+    """Prazo e cancelamento compartilhados por todos os subprocessos de um job"""
+    
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self._procs: set = set()
+        self._lock = threading.Lock()
+    
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+    
+    def track(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            self._procs.add(proc)
+    
+    def untrack(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            self._procs.discard(proc)
+    
+    def cancel(self) -> None:
+        self.cancelled.set()
+        with self._lock:
+            procs = list(self._procs)
+        for proc in procs:
+            kill_process_group(proc)
+
+# Nenhuma ferramenta externa roda sem limite: prazo padrão, CPU e memória por processo (0 desativa)
+TOOL_DEFAULT_TIMEOUT = float(os.environ.get('TOOL_DEFAULT_TIMEOUT', int(os.environ.get('GUNICORN_TIMEOUT', 120))))
+TOOL_JOB_DEADLINE = float(os.environ.get('TOOL_JOB_DEADLINE', 0.9 * int(os.environ.get('GUNICORN_TIMEOUT', 120))))
+TOOL_CPU_SECONDS = int(os.environ.get('TOOL_CPU_SECONDS', 600))
+TOOL_MEMORY_LIMIT = int(os.environ.get('TOOL_MEMORY_LIMIT', 4 * 1024 * 1024 * 1024))
+TOOL_KILL_GRACE = 2.0
+
+_tool_jobs = threading.local()
+
+def current_tool_job() -> Optional[ToolJob]:
+    return getattr(_tool_jobs, 'job', None)
+
+@contextmanager
+def tool_job(seconds: float = TOOL_JOB_DEADLINE) -> Iterator[ToolJob]:
+    """Todo run_tool desta thread dentro do bloco respeita o prazo e o cancelamento do job"""
+    job = ToolJob(seconds)
+    previous = current_tool_job()
+    _tool_jobs.job = job
+    try:
+        yield job
+    finally:
+        _tool_jobs.job = previous
+        job.finished.set()
+
+def kill_process_group(proc: subprocess.Popen) -> None:
+    """SIGTERM no grupo inteiro (ffmpeg/exiftool e filhos), SIGKILL se não sair a tempo"""
+    if proc.poll() is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=TOOL_KILL_GRACE)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+def spawn_tool(cmd: List[str], stdout: Any = subprocess.PIPE, text: bool = True,
+               job: Optional[ToolJob] = None) -> subprocess.Popen:
+    """Inicia a ferramenta em grupo de processos próprio, com limites de CPU e memória"""
+    job = job or current_tool_job()
+    if job is not None and job.cancelled.is_set():
+        raise ToolCancelled(cmd[0])
+    proc = subprocess.Popen(cmd, stdout=stdout, stderr=subprocess.PIPE, text=text, start_new_session=True)
+    # prlimit logo após o spawn em vez de preexec_fn (inseguro com threads, ex.: encode
+    # segmentado); os primeiros milissegundos ficam sem limite, irrelevante para ffmpeg/exiftool
+    if resource is not None and hasattr(resource, 'prlimit'):
+        try:
+            if TOOL_CPU_SECONDS:
+                resource.prlimit(proc.pid, resource.RLIMIT_CPU, (TOOL_CPU_SECONDS, TOOL_CPU_SECONDS))
+            if TOOL_MEMORY_LIMIT:
+                resource.prlimit(proc.pid, resource.RLIMIT_AS, (TOOL_MEMORY_LIMIT, TOOL_MEMORY_LIMIT))
+        except (ProcessLookupError, PermissionError, ValueError):
+            pass
+    if job is not None:
+        job.track(proc)
+    return proc
+
+def wait_tool(proc: subprocess.Popen, timeout: Optional[float] = None,
+              job: Optional[ToolJob] = None) -> subprocess.CompletedProcess:
+    """Espera o processo respeitando o prazo; mata o grupo ao estourar ou ao cancelar o job"""
+    job = job or current_tool_job()
+    limit = timeout if timeout is not None else TOOL_DEFAULT_TIMEOUT
+    if job is not None:
+        limit = min(limit, job.remaining())
+    deadline = time.monotonic() + limit
+    try:
+        while True:
+            try:
+                stdout, stderr = proc.communicate(timeout=max(0.0, min(0.5, deadline - time.monotonic())))
+                if job is not None and job.cancelled.is_set():
+                    raise ToolCancelled(proc.args[0])
+                return subprocess.CompletedProcess(proc.args, proc.returncode, stdout, stderr)
+            except subprocess.TimeoutExpired:
+                pass
+            if job is not None and job.cancelled.is_set():
+                kill_process_group(proc)
+                proc.communicate()
+                raise ToolCancelled(proc.args[0])
+            if time.monotonic() >= deadline:
+                print(f"Tool deadline exceeded after {limit:.1f}s, killing: {proc.args[0]}")
+                kill_process_group(proc)
+                proc.communicate()
+                raise subprocess.TimeoutExpired(proc.args, limit)
+    finally:
+        if job is not None:
+            job.untrack(proc)
+
+def run_tool(cmd: List[str], timeout: Optional[float] = None, stdout: Any = subprocess.PIPE,
+             text: bool = True, job: Optional[ToolJob] = None) -> subprocess.CompletedProcess:
+    """subprocess.run para ferramentas externas: prazo, kill do grupo, rlimits e cancelamento"""
+    return wait_tool(spawn_tool(cmd, stdout=stdout, text=text, job=job), timeout=timeout, job=job)
+
+def watch_client_disconnect(job: ToolJob) -> None:
+    """Cancela o job se o cliente fechar a conexão (socket do request no worker do gunicorn)"""
+    sock = request.environ.get('gunicorn.socket')
+    if sock is None:
+        return
+    
+    def watch() -> None:
+        while not job.finished.is_set():
+            try:
+                readable, _, _ = select.select([sock], [], [], 1.0)
+                if not readable:
+                    continue
+                # Corpo já lido: socket legível sem dados significa conexão fechada
+                if sock.recv(1, socket.MSG_PEEK) == b'':
+                    break
+                return
+            except (OSError, ValueError):
+                break
+        if not job.finished.is_set():
+            print("Client disconnected, cancelling processing")
+            job.cancel()
+    
+    threading.Thread(target=watch, daemon=True).start()
+
+def run_exiftool_rewrite(target: Path, tag_args: List[str]) -> subprocess.CompletedProcess:
+    """Reescreve metadados de um arquivo via scratch + os.replace (substitui -overwrite_original)"""
+    with SCRATCH.path(suffix=target.suffix, size_hint=target.stat().st_size) as tmp_path:
+        cmd = ["exiftool", "-m", *tag_args, "-o", str(tmp_path), str(target)]
+        proc = run_tool(cmd)
+        if proc.returncode == 0 and tmp_path.exists():
+            # Regravações do exiftool costumam deixar o moov no fim
+            if target.suffix.lower() in ('.mov', '.mp4'):
+                make_faststart(tmp_path)
+            SCRATCH.publish(tmp_path, target)
+        return proc
+
+# Precomputed hashes: hashing at import would cost a full KDF run per worker boot
+ADMIN_PASSWORD_HASH = os.environ.get(
+    'ADMIN_PASSWORD_HASH',
+    'scrypt:32768:8:1$LobLMngYvZ5KnqMz$52d868f787b6fd0fc15478f6e9a072a249f6e208e0ce699bd00705d3ea194decb0077af4e73fd43239f522032b26573d370f3a76ec32bf1b9ff884b76d7a521a'
+)
+FREITAS_PASSWORD_HASH = os.environ.get(
+    'FREITAS_PASSWORD_HASH',
+    'scrypt:32768:8:1$CTOJ467tATI8wqQS$e578b6bbb6f241be487213faabc89c264f4115018c65dab71b1ebfd2f4aedc49f931aad6a821f023d5a13e89dd58c6f802b838d811baf4c7a349b76e39256686'
+)
+
 # Simple hardcoded users (admin/admin123)
 USERS = {
     'admin': {
-        'password_hash': generate_password_hash('admin123'),
+        'password_hash': ADMIN_PASSWORD_HASH,
         'is_admin': True
     }
 }
@@ -66,134 +460,296 @@ if MYSQL_AVAILABLE:
         'autocommit': True
     }
     
-    _mysql_initialized = False
+    class TimedCursor(pymysql.cursors.Cursor):
+        """Cursor que registra a latência de cada query no pool"""
+        
+        def execute(self, query, args=None):
+            start = time.perf_counter()
+            try:
+                return super().execute(query, args)
+            finally:
+                MYSQL_POOL.record_latency(time.perf_counter() - start)
     
-    def init_mysql():
-        """Initialize MySQL safely"""
-        global _mysql_initialized
-        if _mysql_initialized:
-            return True
+    class TimedDictCursor(pymysql.cursors.DictCursorMixin, TimedCursor):
+        pass
+    
+    class MySQLPool:
+        """Pool simples de conexões por worker, com métricas de uso e latência"""
+        
+        def __init__(self, config: Dict[str, Any], max_idle: int = 4, latency_window: int = 1000):
+            self.config = dict(config, cursorclass=TimedCursor)
+            self.max_idle = max_idle
+            self._idle: List[Any] = []
+            self._lock = threading.Lock()
+            self._latencies = deque(maxlen=latency_window)
+            self.created = 0
+            self.in_use = 0
+            self.queries = 0
+        
+        @contextmanager
+        def connection(self) -> Iterator[Any]:
+            """Conexão reutilizada do pool (ou nova); descartada se der erro"""
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+                self.in_use += 1
+            try:
+                if conn is not None:
+                    conn.ping(reconnect=True)
+                else:
+                    conn = pymysql.connect(**self.config)
+                    with self._lock:
+                        self.created += 1
+            except Exception:
+                with self._lock:
+                    self.in_use -= 1
+                raise
             
+            healthy = True
+            try:
+                yield conn
+            except Exception:
+                healthy = False
+                raise
+            finally:
+                with self._lock:
+                    self.in_use -= 1
+                    if healthy and len(self._idle) < self.max_idle:
+                        self._idle.append(conn)
+                        conn = None
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+        
+        def reset(self) -> None:
+            """Esquece conexões herdadas via fork (o socket pertence ao processo pai)"""
+            self._lock = threading.Lock()
+            self._idle = []
+            self.in_use = 0
+        
+        def record_latency(self, seconds: float) -> None:
+            with self._lock:
+                self._latencies.append(seconds)
+                self.queries += 1
+        
+        def latency_percentiles(self) -> Dict[str, Optional[float]]:
+            """p50/p95/p99 (ms) das últimas queries deste worker"""
+            with self._lock:
+                samples = sorted(self._latencies)
+            result: Dict[str, Optional[float]] = {}
+            for name, pct in (('p50', 50), ('p95', 95), ('p99', 99)):
+                if not samples:
+                    result[name] = None
+                    continue
+                index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+                result[name] = round(samples[index] * 1000, 2)
+            result['samples'] = len(samples)
+            return result
+        
+        def snapshot(self) -> Dict[str, int]:
+            with self._lock:
+                return {
+                    'pid': os.getpid(),
+                    'created': self.created,
+                    'in_use': self.in_use,
+                    'idle': len(self._idle),
+                    'max_idle': self.max_idle,
+                    'queries': self.queries,
+                }
+    
+    MYSQL_POOL = MySQLPool(DB_CONFIG)
+    # Workers do gunicorn (preload_app) não podem reutilizar conexões do master
+    os.register_at_fork(after_in_child=MYSQL_POOL.reset)
+    
+    USERS_INDEXES = {
+        'idx_instagram': 'instagram',
+        'idx_created_at_id': 'created_at, id',
+    }
+    
+    # Colunas exibidas no admin (nunca o password_hash)
+    ADMIN_USER_COLUMNS = "id, username, email, instagram, is_admin, created_at"
+    ADMIN_PAGE_SIZE = 50
+    
+    def migrate_mysql() -> bool:
+        """Create/upgrade the schema and seed users. Runs once per deploy via
+        `flask --app app migrate`, never inside request handlers."""
         try:
             print(f"Connecting to MySQL: {DB_CONFIG['host']}:{DB_CONFIG['database']}")
-            conn = pymysql.connect(**DB_CONFIG)
-            cursor = conn.cursor()
+            with MYSQL_POOL.connection() as conn:
+                cursor = conn.cursor()
             
-            # Show all tables to debug
-            cursor.execute("SHOW TABLES")
-            tables = cursor.fetchall()
-            print(f"Existing tables: {tables}")
+                # Show all tables to debug
+                cursor.execute("SHOW TABLES")
+                tables = cursor.fetchall()
+                print(f"Existing tables: {tables}")
             
-            # Create users table with more detailed logging
-            print("Creating users table...")
-            try:
+                # Create users table with more detailed logging
+                print("Creating users table...")
+                try:
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS users (
+                            id INT AUTO_INCREMENT PRIMARY KEY,
+                            username VARCHAR(50) UNIQUE NOT NULL,
+                            password_hash VARCHAR(255) NOT NULL,
+                            email VARCHAR(255) UNIQUE NOT NULL,
+                            instagram VARCHAR(100) NOT NULL,
+                            whatsapp VARCHAR(20) NOT NULL,
+                            is_admin BOOLEAN DEFAULT FALSE,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            created_by VARCHAR(50),
+                            INDEX idx_username (username),
+                            INDEX idx_email (email),
+                            INDEX idx_instagram (instagram),
+                            INDEX idx_created_at_id (created_at, id)
+                        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                    ''')
+                    print("Users table created or already exists")
+                except Exception as table_error:
+                    print(f"Error creating table: {table_error}")
+                
+                # Verificar e adicionar colunas se necessário
+                try:
+                    # Verificar se as novas colunas existem
+                    cursor.execute("SHOW COLUMNS FROM users LIKE 'email'")
+                    if not cursor.fetchone():
+                        cursor.execute("ALTER TABLE users ADD COLUMN email VARCHAR(255) UNIQUE")
+                        print("Added email column")
+                    
+                    cursor.execute("SHOW COLUMNS FROM users LIKE 'instagram'")
+                    if not cursor.fetchone():
+                        cursor.execute("ALTER TABLE users ADD COLUMN instagram VARCHAR(100)")
+                        print("Added instagram column")
+                    
+                    cursor.execute("SHOW COLUMNS FROM users LIKE 'whatsapp'")
+                    if not cursor.fetchone():
+                        cursor.execute("ALTER TABLE users ADD COLUMN whatsapp VARCHAR(20)")
+                        print("Added whatsapp column")
+                
+                    # Índices para a paginação por keyset e busca por prefixo no admin
+                    for index_name, index_columns in USERS_INDEXES.items():
+                        cursor.execute("SHOW INDEX FROM users WHERE Key_name = %s", (index_name,))
+                        if not cursor.fetchone():
+                            cursor.execute(f"CREATE INDEX {index_name} ON users ({index_columns})")
+                            print(f"Added index {index_name}")
+                    
+                except Exception as alter_error:
+                    print(f"Error updating table structure: {alter_error}")
+                
+                # Fila durável da camada de workers (JOB_QUEUE_BACKEND=mysql)
                 cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        username VARCHAR(50) UNIQUE NOT NULL,
-                        password_hash VARCHAR(255) NOT NULL,
-                        email VARCHAR(255) UNIQUE NOT NULL,
-                        instagram VARCHAR(100) NOT NULL,
-                        whatsapp VARCHAR(20) NOT NULL,
-                        is_admin BOOLEAN DEFAULT FALSE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        created_by VARCHAR(50),
-                        INDEX idx_username (username),
-                        INDEX idx_email (email)
+                    CREATE TABLE IF NOT EXISTS processing_jobs (
+                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                        username VARCHAR(50) NOT NULL,
+                        upload_name VARCHAR(255) NOT NULL,
+                        processed_name VARCHAR(255) NOT NULL,
+                        processed_key VARCHAR(255),
+                        is_video BOOLEAN NOT NULL,
+                        size BIGINT NOT NULL,
+                        status VARCHAR(16) NOT NULL,
+                        attempts INT NOT NULL DEFAULT 0,
+                        worker_id VARCHAR(128),
+                        lease_expires_at DOUBLE,
+                        messages TEXT,
+                        error TEXT,
+                        created_at DOUBLE NOT NULL,
+                        updated_at DOUBLE NOT NULL,
+                        INDEX idx_jobs_status (status, lease_expires_at, id),
+                        INDEX idx_jobs_user_status (username, status, id)
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
                 ''')
-                print("Users table created or already exists")
-            except Exception as table_error:
-                print(f"Error creating table: {table_error}")
-                
-            # Verificar e adicionar colunas se necessário
-            try:
-                # Verificar se as novas colunas existem
-                cursor.execute("SHOW COLUMNS FROM users LIKE 'email'")
-                if not cursor.fetchone():
-                    cursor.execute("ALTER TABLE users ADD COLUMN email VARCHAR(255) UNIQUE")
-                    print("Added email column")
-                    
-                cursor.execute("SHOW COLUMNS FROM users LIKE 'instagram'")
+                cursor.execute("SHOW COLUMNS FROM processing_jobs LIKE 'processed_key'")
                 if not cursor.fetchone():
-                    cursor.execute("ALTER TABLE users ADD COLUMN instagram VARCHAR(100)")
-                    print("Added instagram column")
-                    
-                cursor.execute("SHOW COLUMNS FROM users LIKE 'whatsapp'")
+                    cursor.execute("ALTER TABLE processing_jobs ADD COLUMN processed_key VARCHAR(255) AFTER processed_name, "
+                                   "ADD INDEX idx_jobs_user_status (username, status, id)")
+                    print("Added processed_key to processing_jobs")
+                
+                # Histórico de arquivos por usuário (página "Meus arquivos")
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS processed_files (
+                        public_name VARCHAR(255) PRIMARY KEY,
+                        storage_key VARCHAR(255) NOT NULL,
+                        username VARCHAR(50) NOT NULL,
+                        status VARCHAR(16) NOT NULL,
+                        is_video BOOLEAN NOT NULL,
+                        source_size BIGINT NOT NULL,
+                        output_size BIGINT,
+                        created_at DOUBLE NOT NULL,
+                        started_at DOUBLE,
+                        finished_at DOUBLE,
+                        error TEXT,
+                        source_sha256 CHAR(64),
+                        profile VARCHAR(32),
+                        INDEX idx_files_user_created (username, created_at),
+                        INDEX idx_files_user_hash (username, source_sha256)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                ''')
+                cursor.execute("SHOW COLUMNS FROM processed_files LIKE 'source_sha256'")
                 if not cursor.fetchone():
-                    cursor.execute("ALTER TABLE users ADD COLUMN whatsapp VARCHAR(20)")
-                    print("Added whatsapp column")
-                    
-            except Exception as alter_error:
-                print(f"Error updating table structure: {alter_error}")
+                    cursor.execute("ALTER TABLE processed_files ADD COLUMN source_sha256 CHAR(64), "
+                                   "ADD COLUMN profile VARCHAR(32), ADD INDEX idx_files_user_hash (username, source_sha256)")
+                    print("Added source_sha256/profile to processed_files")
                 
-            # Verify table exists
-            cursor.execute("SHOW TABLES LIKE 'users'")
-            if not cursor.fetchone():
-                print("ERROR: Users table was not created!")
-                conn.close()
-                return False
+                # Verify table exists
+                cursor.execute("SHOW TABLES LIKE 'users'")
+                if not cursor.fetchone():
+                    print("ERROR: Users table was not created!")
+                    return False
                 
-            # Create admin user if not exists
-            print("Checking for admin user...")
-            cursor.execute('SELECT COUNT(*) FROM users WHERE username = %s', ('admin',))
-            admin_count = cursor.fetchone()[0]
-            print(f"Admin count: {admin_count}")
+                # Create admin user if not exists
+                print("Checking for admin user...")
+                cursor.execute('SELECT COUNT(*) FROM users WHERE username = %s', ('admin',))
+                admin_count = cursor.fetchone()[0]
+                print(f"Admin count: {admin_count}")
             
-            if admin_count == 0:
-                print("Creating admin user...")
-                try:
-                    admin_hash = generate_password_hash('admin123')
-                    cursor.execute('''
-                        INSERT INTO users (username, password_hash, email, instagram, whatsapp, is_admin, created_by)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ''', ('admin', admin_hash, 'admin@trendapp.com', '@admin', '11999999999', True, 'system'))
-                    print("Admin user created")
-                except Exception as user_error:
-                    print(f"Error creating admin: {user_error}")
+                if admin_count == 0:
+                    print("Creating admin user...")
+                    try:
+                        admin_hash = ADMIN_PASSWORD_HASH
+                        cursor.execute('''
+                            INSERT INTO users (username, password_hash, email, instagram, whatsapp, is_admin, created_by)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        ''', ('admin', admin_hash, 'admin@trendapp.com', '@admin', '11999999999', True, 'system'))
+                        print("Admin user created")
+                    except Exception as user_error:
+                        print(f"Error creating admin: {user_error}")
             
-            # Also create 'freitas' user if requested
-            print("Checking for freitas user...")
-            cursor.execute('SELECT COUNT(*) FROM users WHERE username = %s', ('freitas',))
-            if cursor.fetchone()[0] == 0:
-                print("Creating freitas user...")
-                try:
-                    freitas_hash = generate_password_hash('diferentona157')
-                    cursor.execute('''
-                        INSERT INTO users (username, password_hash, email, instagram, whatsapp, is_admin, created_by)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ''', ('freitas', freitas_hash, 'freitas@trendapp.com', '@freitas', '11888888888', True, 'system'))
-                    print("Freitas user created")
-                except Exception as freitas_error:
-                    print(f"Error creating freitas: {freitas_error}")
+                # Also create 'freitas' user if requested
+                print("Checking for freitas user...")
+                cursor.execute('SELECT COUNT(*) FROM users WHERE username = %s', ('freitas',))
+                if cursor.fetchone()[0] == 0:
+                    print("Creating freitas user...")
+                    try:
+                        freitas_hash = FREITAS_PASSWORD_HASH
+                        cursor.execute('''
+                            INSERT INTO users (username, password_hash, email, instagram, whatsapp, is_admin, created_by)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        ''', ('freitas', freitas_hash, 'freitas@trendapp.com', '@freitas', '11888888888', True, 'system'))
+                        print("Freitas user created")
+                    except Exception as freitas_error:
+                        print(f"Error creating freitas: {freitas_error}")
             
-            conn.commit()
-            cursor.close()
-            conn.close()
+                conn.commit()
+                cursor.close()
             
-            _mysql_initialized = True
-            print("MySQL initialized successfully")
-            return True
+                print("MySQL migrated successfully")
+                return True
             
         except Exception as e:
-            print(f"MySQL initialization failed: {e}")
+            print(f"MySQL migration failed: {e}")
             return False
     
     def get_mysql_user(username: str) -> Optional[Dict[str, Any]]:
         """Get user from MySQL"""
         try:
-            if not init_mysql():
-                return None
-                
-            conn = pymysql.connect(**DB_CONFIG)
-            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            with MYSQL_POOL.connection() as conn:
+                cursor = conn.cursor(TimedDictCursor)
             
-            cursor.execute('SELECT * FROM users WHERE username = %s', (username,))
-            user = cursor.fetchone()
+                cursor.execute('SELECT * FROM users WHERE username = %s', (username,))
+                user = cursor.fetchone()
             
-            cursor.close()
-            conn.close()
-            return user
+                cursor.close()
+                return user
             
         except Exception as e:
             print(f"Error getting MySQL user {username}: {e}")
@@ -202,32 +758,27 @@ if MYSQL_AVAILABLE:
     def create_mysql_user(username: str, password: str, email: str, instagram: str = None, whatsapp: str = None, is_admin: bool = False, created_by: str = 'admin') -> bool:
         """Create user in MySQL"""
         try:
-            if not init_mysql():
-                return False
-                
-            conn = pymysql.connect(**DB_CONFIG)
-            cursor = conn.cursor()
+            with MYSQL_POOL.connection() as conn:
+                cursor = conn.cursor()
             
-            # Check if user or email already exists
-            cursor.execute("SELECT COUNT(*) FROM users WHERE username = %s OR email = %s", (username, email))
-            if cursor.fetchone()[0] > 0:
-                print(f"User {username} or email {email} already exists")
-                cursor.close()
-                conn.close()
-                return False
+                # Check if user or email already exists
+                cursor.execute("SELECT COUNT(*) FROM users WHERE username = %s OR email = %s", (username, email))
+                if cursor.fetchone()[0] > 0:
+                    print(f"User {username} or email {email} already exists")
+                    cursor.close()
+                    return False
                 
-            password_hash = generate_password_hash(password)
+                password_hash = generate_password_hash(password)
             
-            cursor.execute('''
-                INSERT INTO users (username, password_hash, email, instagram, whatsapp, is_admin, created_by)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (username, password_hash, email, instagram, whatsapp, is_admin, created_by))
+                cursor.execute('''
+                    INSERT INTO users (username, password_hash, email, instagram, whatsapp, is_admin, created_by)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ''', (username, password_hash, email, instagram, whatsapp, is_admin, created_by))
             
-            conn.commit()
-            cursor.close()
-            conn.close()
-            print(f"User {username} created successfully")
-            return True
+                conn.commit()
+                cursor.close()
+                print(f"User {username} created successfully")
+                return True
             
         except Exception as e:
             print(f"Error creating MySQL user {username}: {e}")
@@ -236,30 +787,26 @@ if MYSQL_AVAILABLE:
     def delete_mysql_user(username: str) -> bool:
         """Delete user from MySQL"""
         try:
-            if not init_mysql():
-                return False
-                
             # Don't allow deleting the main admin
             if username == 'admin':
                 print("Cannot delete main admin user")
                 return False
                 
-            conn = pymysql.connect(**DB_CONFIG)
-            cursor = conn.cursor()
+            with MYSQL_POOL.connection() as conn:
+                cursor = conn.cursor()
             
-            cursor.execute("DELETE FROM users WHERE username = %s", (username,))
-            deleted = cursor.rowcount > 0
+                cursor.execute("DELETE FROM users WHERE username = %s", (username,))
+                deleted = cursor.rowcount > 0
             
-            conn.commit()
-            cursor.close()
-            conn.close()
+                conn.commit()
+                cursor.close()
             
-            if deleted:
-                print(f"User {username} deleted successfully")
-            else:
-                print(f"User {username} not found")
+                if deleted:
+                    print(f"User {username} deleted successfully")
+                else:
+                    print(f"User {username} not found")
                 
-            return deleted
+                return deleted
             
         except Exception as e:
             print(f"Error deleting MySQL user {username}: {e}")
@@ -268,49 +815,675 @@ if MYSQL_AVAILABLE:
     def update_mysql_user_admin(username: str, is_admin: bool) -> bool:
         """Update user admin status"""
         try:
-            if not init_mysql():
-                return False
-                
-            conn = pymysql.connect(**DB_CONFIG)
-            cursor = conn.cursor()
+            with MYSQL_POOL.connection() as conn:
+                cursor = conn.cursor()
             
-            cursor.execute("UPDATE users SET is_admin = %s WHERE username = %s", (is_admin, username))
-            updated = cursor.rowcount > 0
+                cursor.execute("UPDATE users SET is_admin = %s WHERE username = %s", (is_admin, username))
+                updated = cursor.rowcount > 0
             
-            conn.commit()
-            cursor.close()
-            conn.close()
+                conn.commit()
+                cursor.close()
             
-            if updated:
-                print(f"User {username} admin status updated to {is_admin}")
-            else:
-                print(f"User {username} not found")
+                if updated:
+                    print(f"User {username} admin status updated to {is_admin}")
+                else:
+                    print(f"User {username} not found")
                 
-            return updated
+                return updated
             
         except Exception as e:
             print(f"Error updating MySQL user {username}: {e}")
             return False
     
-    def get_all_mysql_users() -> List[Dict[str, Any]]:
-        """Get all users from MySQL"""
+    def get_mysql_users_page(search: str = '', before: Optional[Tuple[datetime, int]] = None, limit: int = ADMIN_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[Tuple[datetime, int]]]:
+        """Página de usuários por keyset em (created_at, id), com busca por prefixo.
+        Retorna os usuários e o cursor da próxima página (None na última)."""
         try:
-            if not init_mysql():
-                return []
-                
-            conn = pymysql.connect(**DB_CONFIG)
-            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            conditions = []
+            params: List[Any] = []
+            if search:
+                prefix = escape_like(search) + '%'
+                instagram_prefix = prefix if search.startswith('@') else '@' + prefix
+                conditions.append("(username LIKE %s OR email LIKE %s OR instagram LIKE %s)")
+                params.extend([prefix, prefix, instagram_prefix])
+            if before:
+                conditions.append("(created_at < %s OR (created_at = %s AND id < %s))")
+                params.extend([before[0], before[0], before[1]])
             
-            cursor.execute('SELECT * FROM users ORDER BY created_at DESC')
-            users = cursor.fetchall()
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            query = f"SELECT {ADMIN_USER_COLUMNS} FROM users {where} ORDER BY created_at DESC, id DESC LIMIT %s"
+            params.append(limit + 1)
             
-            cursor.close()
-            conn.close()
-            return users
+            with MYSQL_POOL.connection() as conn:
+                cursor = conn.cursor(TimedDictCursor)
+            
+                cursor.execute(query, params)
+                users = list(cursor.fetchall())
+            
+                cursor.close()
+            
+            next_cursor = None
+            if len(users) > limit:
+                users = users[:limit]
+                next_cursor = (users[-1]['created_at'], users[-1]['id'])
+            return users, next_cursor
             
         except Exception as e:
-            print(f"Error getting MySQL users: {e}")
-            return []
+            print(f"Error getting MySQL users page: {e}")
+            return [], None
+
+def escape_like(value: str) -> str:
+    """Escapa curingas do LIKE para busca literal por prefixo"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def encode_user_cursor(cursor: Optional[Tuple[datetime, int]]) -> Optional[str]:
+    """Cursor (created_at, id) serializado para a query string"""
+    if not cursor:
+        return None
+    created_at, user_id = cursor
+    return f"{created_at:%Y%m%d%H%M%S}-{user_id}"
+
+def decode_user_cursor(value: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Inverso de encode_user_cursor; valores inválidos voltam para a primeira página"""
+    if not value:
+        return None
+    try:
+        stamp, user_id = value.split('-', 1)
+        return datetime.strptime(stamp, '%Y%m%d%H%M%S'), int(user_id)
+    except ValueError:
+        return None
+
+class SharedSQLiteStore:
+    """Estado compartilhado entre os workers do gunicorn em um arquivo SQLite local"""
+    
+    SCHEMA: List[str] = []
+    
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._local = threading.local()
+    
+    def _connection(self) -> sqlite3.Connection:
+        # Uma conexão por processo e thread (workers via fork; heartbeats e servidores com threads)
+        local = self._local
+        if getattr(local, 'conn', None) is None or local.pid != os.getpid():
+            conn = sqlite3.connect(str(self.db_path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            self._migrate(conn)
+            local.conn = conn
+            local.pid = os.getpid()
+        return local.conn
+    
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """Migrações pontuais; subclasses checam antes (sem lock) e aplicam em BEGIN IMMEDIATE"""
+    
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transação com lock de escrita (BEGIN IMMEDIATE)"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+class RateLimiter(SharedSQLiteStore):
+    """Token buckets em SQLite, compartilhados entre os workers do gunicorn"""
+    
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)",
+    ]
+    
+    def consume(self, key: str, capacity: float, refill_per_second: float) -> float:
+        """Consome um token; retorna 0 se permitido ou os segundos até o próximo token"""
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * refill_per_second)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - tokens) / refill_per_second
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, tokens, now)
+            )
+        return retry_after
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+RATE_LIMITER = RateLimiter(Path(os.environ.get('RATE_LIMIT_DB', '/tmp/trend-ratelimit.sqlite3')))
+
+# endpoint: [(escopo, capacidade, tokens por segundo)] — só para POST
+RATE_LIMITS = {
+    'login': [('ip', 10, 1 / 6)],
+    'register': [('ip', 5, 1 / 60)],
+    'upload': [('ip', 10, 1 / 15), ('user', 6, 1 / 20)],
+    'upload_check': [('user', 30, 1 / 2)],
+}
+
+def client_ip() -> str:
+    """IP do cliente (já resolvido pelo ProxyFix, ver PROXY_HOPS)"""
+    return request.remote_addr or 'unknown'
+
+@app.before_request
+def enforce_rate_limits():
+    """Rejeita com 429 antes de qualquer hash de senha ou leitura do upload"""
+    if not RATE_LIMIT_ENABLED or request.method != 'POST':
+        return None
+    limits = RATE_LIMITS.get(request.endpoint)
+    if not limits:
+        return None
+    
+    retry_after = 0.0
+    for scope, capacity, rate in limits:
+        if scope == 'user':
+            identity = session.get('username')
+            if not identity:
+                continue
+        else:
+            identity = client_ip()
+        try:
+            retry_after = max(retry_after, RATE_LIMITER.consume(f"{request.endpoint}:{scope}:{identity}", capacity, rate))
+        except sqlite3.Error as e:
+            # Falha no armazenamento não deve derrubar o login
+            print(f"Rate limiter unavailable: {e}")
+            return None
+    
+    if retry_after > 0:
+        response = app.response_class('Muitas tentativas. Aguarde alguns instantes e tente novamente.', status=429, mimetype='text/plain')
+        response.headers['Retry-After'] = str(int(retry_after) + 1)
+        return response
+    return None
+
+class ProcessingRejected(Exception):
+    """Job recusado pelo agendador; a mensagem é exibida ao usuário"""
+
+class FairScheduler(SharedSQLiteStore):
+    """Fila justa por usuário (weighted fair queueing) para o processamento de mídia.
+    
+    Cada job recebe uma etiqueta virtual de término: início = max(tempo virtual,
+    último término do usuário) e término = início + custo / peso. Sempre roda o
+    job elegível com a menor etiqueta, então usuários se alternam e fotos (custo
+    baixo) passam à frente de transcodificações longas.
+    """
+    
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS tickets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            start_tag REAL NOT NULL,
+            finish_tag REAL NOT NULL,
+            size INTEGER NOT NULL,
+            state TEXT NOT NULL,
+            pid INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_tickets_state_finish ON tickets (state, finish_tag, id)",
+        "CREATE TABLE IF NOT EXISTS user_tags (username TEXT PRIMARY KEY, last_finish REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS clock (id INTEGER PRIMARY KEY CHECK (id = 1), vtime REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS daily_usage (username TEXT NOT NULL, day TEXT NOT NULL, bytes INTEGER NOT NULL, PRIMARY KEY (username, day))",
+        "CREATE TABLE IF NOT EXISTS service_stats (id INTEGER PRIMARY KEY CHECK (id = 1), seconds_per_cost REAL NOT NULL)",
+    ]
+    
+    # Tickets aguardando há mais que isso foram abandonados (slot() desiste em wait_timeout);
+    # tickets em execução só saem com o dono morto, por mais longo que seja o job
+    STALE_SECONDS = 2 * int(os.environ.get('GUNICORN_TIMEOUT', 120))
+    
+    # Peso da última medição na média móvel do tempo por unidade de custo
+    SERVICE_EWMA_ALPHA = 0.2
+    
+    def __init__(self, db_path: Path, slots: int, per_user_concurrency: int = 0, daily_byte_quota: int = 0,
+                 wait_timeout: float = 60.0, seconds_per_cost: float = 3.0):
+        super().__init__(db_path)
+        self.slots = max(1, slots)
+        self.per_user_concurrency = per_user_concurrency
+        self.daily_byte_quota = daily_byte_quota
+        self.wait_timeout = wait_timeout
+        self.initial_seconds_per_cost = seconds_per_cost
+    
+    @staticmethod
+    def job_cost(is_video: bool, size: int) -> float:
+        """Custo estimado: fotos valem 1, vídeos crescem com o tamanho (MB)"""
+        if not is_video:
+            return 1.0
+        return 4.0 + size / (1024 * 1024)
+    
+    def _reap(self, conn: sqlite3.Connection) -> None:
+        """Remove tickets de workers que morreram e esperas abandonadas"""
+        conn.execute(
+            "DELETE FROM tickets WHERE state = 'waiting' AND created_at < ?", (time.time() - self.STALE_SECONDS,)
+        )
+        for ticket_id, pid in conn.execute("SELECT id, pid FROM tickets").fetchall():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                conn.execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
+            except PermissionError:
+                pass
+    
+    def _check_quota(self, conn: sqlite3.Connection, username: str, size: int) -> None:
+        day = datetime.now().strftime('%Y-%m-%d')
+        row = conn.execute(
+            "SELECT bytes FROM daily_usage WHERE username = ? AND day = ?", (username, day)
+        ).fetchone()
+        if (row[0] if row else 0) + size > self.daily_byte_quota:
+            raise ProcessingRejected('Limite diário de processamento atingido. Tente novamente amanhã.')
+    
+    def check_quota(self, username: str, size: int) -> None:
+        """Checagem prévia (antes de gravar o upload); a que vale é a de enqueue(),
+        na mesma transação que debita o uso"""
+        if self.daily_byte_quota:
+            self._check_quota(self._connection(), username, size)
+    
+    def charge(self, username: str, size: int) -> None:
+        """Checa e debita a cota numa transação, sem passar pela fila justa (modo fila:
+        quem processa são os workers)"""
+        if not self.daily_byte_quota:
+            return
+        with self.transaction() as conn:
+            self._check_quota(conn, username, size)
+            self._charge(conn, username, size)
+    
+    def _charge(self, conn: sqlite3.Connection, username: str, size: int) -> None:
+        day = datetime.now().strftime('%Y-%m-%d')
+        conn.execute(
+            "INSERT INTO daily_usage (username, day, bytes) VALUES (?, ?, ?) "
+            "ON CONFLICT(username, day) DO UPDATE SET bytes = bytes + excluded.bytes",
+            (username, day, size)
+        )
+    
+    def enqueue(self, username: str, cost: float, size: int, weight: float = 1.0) -> int:
+        with self.transaction() as conn:
+            if self.daily_byte_quota:
+                self._check_quota(conn, username, size)
+            row = conn.execute("SELECT vtime FROM clock WHERE id = 1").fetchone()
+            vtime = row[0] if row else 0.0
+            row = conn.execute("SELECT last_finish FROM user_tags WHERE username = ?", (username,)).fetchone()
+            start_tag = max(vtime, row[0] if row else 0.0)
+            finish_tag = start_tag + cost / weight
+            conn.execute(
+                "INSERT OR REPLACE INTO user_tags (username, last_finish) VALUES (?, ?)", (username, finish_tag)
+            )
+            cursor = conn.execute(
+                "INSERT INTO tickets (username, start_tag, finish_tag, size, state, pid, created_at) "
+                "VALUES (?, ?, ?, ?, 'waiting', ?, ?)",
+                (username, start_tag, finish_tag, size, os.getpid(), time.time())
+            )
+            if self.daily_byte_quota:
+                self._charge(conn, username, size)
+            return cursor.lastrowid
+    
+    def try_dispatch(self, ticket_id: int) -> bool:
+        """Marca o ticket como em execução se for o próximo elegível"""
+        with self.transaction() as conn:
+            self._reap(conn)
+            running = dict(conn.execute(
+                "SELECT username, COUNT(*) FROM tickets WHERE state = 'running' GROUP BY username"
+            ).fetchall())
+            if sum(running.values()) >= self.slots:
+                return False
+            for candidate_id, username, start_tag in conn.execute(
+                "SELECT id, username, start_tag FROM tickets WHERE state = 'waiting' ORDER BY finish_tag, id"
+            ).fetchall():
+                if self.per_user_concurrency and running.get(username, 0) >= self.per_user_concurrency:
+                    continue
+                if candidate_id != ticket_id:
+                    return False
+                conn.execute("UPDATE tickets SET state = 'running' WHERE id = ?", (ticket_id,))
+                conn.execute(
+                    "INSERT INTO clock (id, vtime) VALUES (1, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET vtime = MAX(vtime, excluded.vtime)",
+                    (start_tag,)
+                )
+                return True
+            return False
+    
+    def queue_depth(self) -> int:
+        """Jobs aguardando ou em execução em todos os workers"""
+        return self._connection().execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+    
+    def seconds_per_cost(self) -> float:
+        row = self._connection().execute("SELECT seconds_per_cost FROM service_stats WHERE id = 1").fetchone()
+        return row[0] if row else self.initial_seconds_per_cost
+    
+    def record_service(self, cost: float, seconds: float) -> None:
+        """Atualiza a média móvel do tempo de processamento por unidade de custo"""
+        with self.transaction() as conn:
+            row = conn.execute("SELECT seconds_per_cost FROM service_stats WHERE id = 1").fetchone()
+            current = row[0] if row else self.initial_seconds_per_cost
+            conn.execute(
+                "INSERT OR REPLACE INTO service_stats (id, seconds_per_cost) VALUES (1, ?)",
+                (current + self.SERVICE_EWMA_ALPHA * (seconds / cost - current),)
+            )
+    
+    def load(self) -> Dict[str, Any]:
+        """Jobs em andamento e a espera estimada para um job novo de custo mínimo.
+        Jobs rodando contam metade do custo (em média, metade já foi feita)."""
+        # Sem o reap, tickets de workers mortos recusariam uploads até o próximo dispatch
+        with self.transaction() as conn:
+            self._reap(conn)
+            running, waiting, backlog = conn.execute(
+                "SELECT COALESCE(SUM(state = 'running'), 0), COALESCE(SUM(state = 'waiting'), 0), "
+                "COALESCE(SUM((finish_tag - start_tag) * CASE state WHEN 'running' THEN 0.5 ELSE 1 END), 0) "
+                "FROM tickets"
+            ).fetchone()
+        seconds_per_cost = self.seconds_per_cost()
+        # Só há espera quando todos os slots estão ocupados
+        wait = backlog * seconds_per_cost / self.slots if running + waiting >= self.slots else 0.0
+        max_wait = self.max_wait(TOOL_JOB_DEADLINE, seconds_per_cost)
+        return {
+            'running': running,
+            'waiting': waiting,
+            'seconds_per_cost': round(seconds_per_cost, 3),
+            'estimated_wait': round(wait, 1),
+            'max_wait': round(max_wait, 1),
+        }
+    
+    def max_wait(self, budget: float, seconds_per_cost: Optional[float] = None) -> float:
+        """Espera máxima aceitável: a do próprio slot(), sem estourar o orçamento do
+        request com o processamento de uma foto no ritmo observado"""
+        if seconds_per_cost is None:
+            seconds_per_cost = self.seconds_per_cost()
+        return max(0.0, min(self.wait_timeout, budget - seconds_per_cost * self.job_cost(False, 0)))
+    
+    def release(self, ticket_id: int, refund: bool = False) -> None:
+        with self.transaction() as conn:
+            if refund and self.daily_byte_quota:
+                row = conn.execute("SELECT username, size FROM tickets WHERE id = ?", (ticket_id,)).fetchone()
+                if row:
+                    self._charge(conn, row[0], -row[1])
+            conn.execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
+    
+    @contextmanager
+    def slot(self, username: str, is_video: bool, size: int, max_wait: Optional[float] = None,
+             calibrate: bool = True) -> Iterator[int]:
+        """Aguarda a vez do job na fila justa (até max_wait, padrão wait_timeout) e libera
+        o slot ao terminar; calibrate=False para trabalho que não é processamento (previews)"""
+        cost = self.job_cost(is_video, size)
+        ticket_id = self.enqueue(username, cost, size)
+        deadline = time.monotonic() + (self.wait_timeout if max_wait is None else max_wait)
+        try:
+            delay = 0.05
+            while not self.try_dispatch(ticket_id):
+                if time.monotonic() >= deadline:
+                    self.release(ticket_id, refund=True)
+                    raise ProcessingRejected('Servidor ocupado no momento. Tente novamente em instantes.')
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+        except ProcessingRejected:
+            raise
+        except BaseException:
+            self.release(ticket_id, refund=True)
+            raise
+        started = time.monotonic()
+        try:
+            yield ticket_id
+        finally:
+            self.release(ticket_id)
+        # Só jobs concluídos calibram a estimativa (cancelados/falhos distorcem o tempo)
+        if calibrate:
+            self.record_service(cost, time.monotonic() - started)
+
+PROCESSING_SCHEDULER = FairScheduler(
+    Path(os.environ.get('SCHEDULER_DB', '/tmp/trend-scheduler.sqlite3')),
+    slots=int(os.environ.get('PROCESSING_SLOTS', os.environ.get('WEB_CONCURRENCY', 2))),
+    per_user_concurrency=int(os.environ.get('PER_USER_CONCURRENCY', 1)),
+    daily_byte_quota=int(os.environ.get('DAILY_BYTE_QUOTA', 0)),
+    wait_timeout=float(os.environ.get('QUEUE_WAIT_TIMEOUT', 60)),
+    seconds_per_cost=float(os.environ.get('SECONDS_PER_COST', 3.0)),
+)
+
+@contextmanager
+def processing_slot(username: str, is_video: bool, size: int, deadline: float,
+                    calibrate: bool = True) -> Iterator[ToolJob]:
+    """Slot da fila justa e tool_job num só orçamento (deadline, em time.monotonic()): a
+    espera pela vez desconta do prazo das ferramentas, e o request inteiro cabe no timeout
+    do gunicorn"""
+    max_wait = PROCESSING_SCHEDULER.max_wait(deadline - time.monotonic())
+    with PROCESSING_SCHEDULER.slot(username, is_video=is_video, size=size, max_wait=max_wait,
+                                   calibrate=calibrate):
+        with tool_job(deadline - time.monotonic()) as job:
+            yield job
+
+LOAD_SHEDDING_ENABLED = os.environ.get('LOAD_SHEDDING_ENABLED', '1') != '0'
+
+@app.before_request
+def shed_load():
+    """Recusa uploads na hora com 503 quando a fila de processamento não daria conta a
+    tempo, em vez de deixá-los esperando até o timeout; páginas e login não passam por aqui"""
+    if not LOAD_SHEDDING_ENABLED or request.endpoint != 'upload' or request.method != 'POST':
+        return None
+    # No modo fila o upload só registra o job; o backlog fica com os workers
+    if PROCESSING_MODE == 'queue':
+        return None
+    try:
+        load = PROCESSING_SCHEDULER.load()
+    except sqlite3.Error as e:
+        print(f"Admission control unavailable: {e}")
+        return None
+    if load['estimated_wait'] <= load['max_wait']:
+        return None
+    
+    print(f"Shedding upload: estimated wait {load['estimated_wait']}s > {load['max_wait']}s "
+          f"({load['running']} running, {load['waiting']} waiting)")
+    response = app.response_class('Servidor ocupado no momento. Tente novamente em instantes.', status=503, mimetype='text/plain')
+    response.headers['Retry-After'] = str(int(load['estimated_wait'] - load['max_wait']) + 1)
+    return response
+
+# Contabilidade de memória (MEMORY_TRACKING=1): RSS no início/fim e pico de cada request e
+# de cada etapa do pipeline. O pico (VmHWM) é zerado no início via /proc/self/clear_refs;
+# com threads os números são do processo inteiro, não só do request
+MEMORY_TRACKING = os.environ.get('MEMORY_TRACKING', '0') == '1'
+TRACEMALLOC_FRAMES = int(os.environ.get('TRACEMALLOC_FRAMES', 10))
+_tracemalloc_baseline: Dict[str, Any] = {'snapshot': None}
+
+def read_memory() -> Dict[str, int]:
+    """RSS atual e pico (VmHWM) do processo, em bytes"""
+    memory = {'rss': 0, 'peak': 0}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    memory['rss'] = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    memory['peak'] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return memory
+
+def reset_peak_memory() -> None:
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def format_mb(value: int) -> str:
+    return f"{value / (1024 * 1024):+.1f}MB" if value < 0 else f"{value / (1024 * 1024):.1f}MB"
+
+@contextmanager
+def memory_stage(name: str) -> Iterator[None]:
+    """Registra RSS e pico de uma etapa no log do request (no-op sem MEMORY_TRACKING)"""
+    if not MEMORY_TRACKING:
+        yield
+        return
+    before = read_memory()
+    reset_peak_memory()
+    try:
+        yield
+    finally:
+        after = read_memory()
+        if has_request_context():
+            # A etapa zerou o pico: guarda o maior visto para o total do request
+            g.memory_peak = max(g.get('memory_peak', 0), before['peak'], after['peak'])
+        print(f"Memory stage {name}: rss {format_mb(before['rss'])} -> {format_mb(after['rss'])} "
+              f"(delta {format_mb(after['rss'] - before['rss'])}), peak {format_mb(after['peak'])}")
+
+@app.before_request
+def start_memory_accounting():
+    if MEMORY_TRACKING:
+        reset_peak_memory()
+        g.memory_start = read_memory()
+
+@app.teardown_request
+def finish_memory_accounting(error=None):
+    start = g.pop('memory_start', None)
+    if start is None:
+        return
+    end = read_memory()
+    peak = max(end['peak'], g.pop('memory_peak', 0))
+    print(f"Memory {request.method} {request.path}: rss {format_mb(start['rss'])} -> {format_mb(end['rss'])} "
+          f"(delta {format_mb(end['rss'] - start['rss'])}), peak {format_mb(peak)}")
+
+# Profiling sob demanda: um request é amostrado se um admin mandar o header X-Profile: 1
+# ou pela taxa PROFILE_SAMPLE_RATE. Uma thread lê a pilha da thread do request a cada
+# PROFILE_INTERVAL e o perfil (pilhas agregadas) fica em PROFILE_DIR com o ID do request.
+# Desligado, o custo é só a checagem do header
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', str(PROCESSED_DIR / '.profiles')))
+
+class StackSampler:
+    """Profiler por amostragem de uma thread (pilhas no formato 'raiz;...;folha')"""
+    
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                stack = ';'.join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                self.samples += 1
+    
+    def start(self) -> None:
+        self._thread.start()
+    
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+def save_profile(profile: Dict[str, Any]) -> None:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    (PROFILE_DIR / f"{profile['id']}.json").write_text(json.dumps(profile))
+    # Mantém só os PROFILE_KEEP mais recentes
+    files = sorted(PROFILE_DIR.glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in files[PROFILE_KEEP:]:
+        old.unlink(missing_ok=True)
+
+def list_profiles(limit: int = 20) -> List[Dict[str, Any]]:
+    """Perfis mais recentes (sem as pilhas), para o painel admin"""
+    if not PROFILE_DIR.exists():
+        return []
+    profiles = []
+    for path in sorted(PROFILE_DIR.glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)[:limit]:
+        try:
+            profile = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        profile.pop('stacks', None)
+        # Perfis antigos eram salvos com o X-Request-ID como nome
+        profile.setdefault('id', path.stem)
+        profile['started'] = datetime.fromtimestamp(profile['started_at'])
+        profiles.append(profile)
+    return profiles
+
+def load_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    path = PROFILE_DIR / f"{secure_filename(profile_id)}.json"
+    try:
+        profile = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    profile.setdefault('id', path.stem)
+    return profile
+
+def build_flame_tree(stacks: Dict[str, int]) -> Dict[str, Any]:
+    """Árvore {name, value, children} a partir das pilhas agregadas"""
+    root: Dict[str, Any] = {'name': 'all', 'value': 0, 'children': {}}
+    for stack, count in stacks.items():
+        root['value'] += count
+        node = root
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'name': name, 'value': 0, 'children': {}})
+            node['value'] += count
+    
+    def finish(node: Dict[str, Any]) -> Dict[str, Any]:
+        node['children'] = sorted((finish(child) for child in node['children'].values()), key=lambda n: n['name'])
+        return node
+    return finish(root)
+
+def profile_stats(stacks: Dict[str, int], limit: int = 50) -> List[Dict[str, Any]]:
+    """Funções ordenadas pelo tempo total (inclusivo); self = amostras em que era a folha"""
+    total: Dict[str, int] = {}
+    own: Dict[str, int] = {}
+    for stack, count in stacks.items():
+        names = stack.split(';')
+        for name in set(names):
+            total[name] = total.get(name, 0) + count
+        own[names[-1]] = own.get(names[-1], 0) + count
+    rows = [{'name': name, 'total': value, 'self': own.get(name, 0)} for name, value in total.items()]
+    rows.sort(key=lambda row: (row['total'], row['self']), reverse=True)
+    return rows[:limit]
+
+@app.before_request
+def start_profiling():
+    wanted = request.headers.get('X-Profile') == '1' and session.get('is_admin')
+    if not wanted and not (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+        return
+    # Nome do arquivo gerado no servidor; o X-Request-ID do cliente só vai dentro do perfil,
+    # senão um cliente poderia sobrescrever o perfil de outro request reusando o ID
+    g.profile_id = new_file_id()
+    g.profile_request_id = request.headers.get('X-Request-ID', '')[:64] or None
+    g.profile_started = time.time()
+    g.profiler = StackSampler(threading.get_ident())
+    g.profiler.start()
+
+@app.after_request
+def tag_profiled_response(response):
+    if 'profiler' in g:
+        response.headers['X-Profile-ID'] = g.profile_id
+    return response
+
+@app.teardown_request
+def finish_profiling(error=None):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    profiler.stop()
+    duration = time.time() - g.profile_started
+    try:
+        save_profile({
+            'id': g.profile_id,
+            'request_id': g.profile_request_id,
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'started_at': g.profile_started,
+            'duration': round(duration, 3),
+            'interval': profiler.interval,
+            'samples': profiler.samples,
+            'stacks': profiler.stacks,
+        })
+        print(f"Profile {g.profile_id} saved: {request.method} {request.path} {duration:.3f}s, {profiler.samples} samples")
+    except OSError as e:
+        print(f"Error saving profile {g.profile_id}: {e}")
 
 def login_required(fn: Callable) -> Callable:
 	def wrapper(*args, **kwargs):
@@ -414,6 +1587,30 @@ EXIF_MAP = {
 	"gps_longitude": ("EXIF:GPSLongitude", None),
 }
 
+# Pré-processamento no navegador (index.js): fotos acima da resolução da trend são
+# reduzidas e recomprimidas em JPEG antes do envio
+CLIENT_MAX_EDGE = int(os.environ.get('CLIENT_MAX_EDGE', TREND_META['exif_image_width']))
+CLIENT_JPEG_QUALITY = float(os.environ.get('CLIENT_JPEG_QUALITY', 0.9))
+CLIENT_RECOMPRESS_BYTES = int(os.environ.get('CLIENT_RECOMPRESS_BYTES', 4 * 1024 * 1024))
+
+# Versão do processamento para o reaproveitamento por hash: se TREND_META mudar,
+# saídas antigas deixam de valer para o mesmo arquivo de origem
+PROCESSING_PROFILE = hashlib.sha1(json.dumps(TREND_META, sort_keys=True).encode()).hexdigest()[:12]
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+DEFAULT_GPS_LATITUDE = "22 deg 58' 46.24\" S"
+DEFAULT_GPS_LONGITUDE = "43 deg 24' 42.09\" W"
+
+# Tags relidas do arquivo de imagem processado na mesma execução do exiftool
+IMAGE_VERIFY_TAGS = ["FileType", "Make", "Model", "Orientation", "GPSLatitude", "GPSLongitude"]
+
+# Metadados básicos aplicados a todo vídeo processado
+VIDEO_BASIC_TAGS = [
+    "-Keys:Copyright=Meta AI",
+    "-Keys:Model=2Q37S02H6H006X",
+    "-Keys:Comment=app=Meta AI&device=Ray-Ban Meta Smart Glasses&id=31602281-4A5C-417D-A0F4-108B7FD05B0E",
+]
+
 def build_exiftool_write_args(meta: Dict[str, Any]) -> List[str]:
 	args: List[str] = []
 	for key, (exif_tag, override_value) in EXIF_MAP.items():
@@ -430,55 +1627,478 @@ def build_exiftool_write_args(meta: Dict[str, Any]) -> List[str]:
 	args.append(f"-XMP-dc:Description={desc_json}")
 	return args
 
-def run_exiftool_write(src: Path, dst: Path, meta: Dict[str, Any], is_video: bool = False) -> subprocess.CompletedProcess:
-    """Aplica todos os metadados da trend usando exiftool"""
-    # Primeiro, copia o arquivo para preservar a estrutura original
-    import shutil
+def parse_exiftool_json(output: str) -> Dict[str, Any]:
+    """Extrai o primeiro objeto da saída `exiftool -json` (vazio se inválida)"""
+    try:
+        data = json.loads(output)
+    except (TypeError, ValueError):
+        return {}
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        return data[0]
+    return {}
+
+def print_verified_tags(tags: Dict[str, Any]) -> None:
+    """Exibe as tags lidas de volta do arquivo processado"""
+    if not tags:
+        print("  ✗ No metadata read back from output")
+        return
+    for tag in IMAGE_VERIFY_TAGS:
+        value = tags.get(tag)
+        if value not in (None, ""):
+            print(f"  ✓ {tag}: {value}")
+        else:
+            print(f"  ✗ {tag}: Not found or empty")
+
+class MediaProbe:
+    """Fatos de container e streams de um arquivo, vindos de uma única inspeção
+    (exiftool -json -G1 em paralelo com ffprobe para vídeos)"""
+    
+    def __init__(self, path: Path, tags: Dict[str, Any], streams: List[Dict[str, Any]], container: Dict[str, Any]):
+        self.path = path
+        self.tags = tags
+        self.streams = streams
+        self.container = container
+    
+    def tag(self, name: str) -> Any:
+        """Tag do exiftool; 'Grupo:Nome' exato ou apenas 'Nome' em qualquer grupo"""
+        if ':' in name:
+            return self.tags.get(name)
+        for key, value in self.tags.items():
+            if key.rsplit(':', 1)[-1] == name:
+                return value
+        return None
+    
+    @property
+    def file_type(self) -> str:
+        return str(self.tag('FileType') or '')
+    
+    @property
+    def compressor_id(self) -> str:
+        return str(self.tag('CompressorID') or '')
+    
+    @property
+    def video_stream(self) -> Optional[Dict[str, Any]]:
+        return next((s for s in self.streams if s.get('codec_type') == 'video'), None)
+    
+    @property
+    def audio_stream(self) -> Optional[Dict[str, Any]]:
+        return next((s for s in self.streams if s.get('codec_type') == 'audio'), None)
+    
+    @property
+    def width(self) -> int:
+        stream = self.video_stream or {}
+        return int(stream.get('width') or self.tag('ImageWidth') or 0)
+    
+    @property
+    def height(self) -> int:
+        stream = self.video_stream or {}
+        return int(stream.get('height') or self.tag('ImageHeight') or 0)
     
+    @property
+    def duration(self) -> float:
+        try:
+            return float(self.container.get('duration') or 0)
+        except (TypeError, ValueError):
+            return 0.0
+
+MEDIA_PROBE_CACHE_SIZE = 256
+_media_probe_cache: "OrderedDict[tuple, MediaProbe]" = OrderedDict()
+# Workers gthread: requests em threads do mesmo processo dividem o cache
+_media_probe_lock = threading.Lock()
+
+def probe_media(path: Path, with_streams: Optional[bool] = None) -> MediaProbe:
+    """Inspeciona o arquivo uma vez; o cache por (caminho, tamanho, mtime, inode)
+    garante que nenhuma etapa volte a inspecionar um arquivo que não mudou"""
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+    with _media_probe_lock:
+        cached = _media_probe_cache.get(key)
+        if cached is not None:
+            _media_probe_cache.move_to_end(key)
+            return cached
+    
+    if with_streams is None:
+        with_streams = path.suffix.lstrip('.').lower() in VIDEO_EXTENSIONS
+    
+    exif_proc = spawn_tool(["exiftool", "-json", "-G1", "-a", str(path)])
+    ffprobe_proc = None
+    if with_streams:
+        try:
+            ffprobe_proc = spawn_tool(
+                ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", str(path)]
+            )
+        except FileNotFoundError:
+            print("ffprobe not available, probing with exiftool only")
+    
+    exif_out = wait_tool(exif_proc).stdout
+    tags = parse_exiftool_json(exif_out)
+    streams: List[Dict[str, Any]] = []
+    container: Dict[str, Any] = {}
+    if ffprobe_proc is not None:
+        ffprobe_out = wait_tool(ffprobe_proc).stdout
+        try:
+            ffprobe_data = json.loads(ffprobe_out or '{}')
+            streams = ffprobe_data.get('streams', [])
+            container = ffprobe_data.get('format', {})
+        except ValueError:
+            pass
+    
+    probe = MediaProbe(path, tags, streams, container)
+    with _media_probe_lock:
+        _media_probe_cache[key] = probe
+        while len(_media_probe_cache) > MEDIA_PROBE_CACHE_SIZE:
+            _media_probe_cache.popitem(last=False)
+    return probe
+
+# Leitor nativo das poucas tags que a verificação usa (JPEG APP1, HEIF meta, QuickTime moov):
+# lê só os bytes necessários via mmap, sem processo; None = container não suportado
+TIFF_TAGS = {0x010F: 'IFD0:Make', 0x0110: 'IFD0:Model', 0x8298: 'IFD0:Copyright'}
+TIFF_EXIF_IFD = 0x8769
+TIFF_GPS_IFD = 0x8825
+QUICKTIME_KEYS = {
+    'com.apple.quicktime.make': 'Keys:Make',
+    'com.apple.quicktime.model': 'Keys:Model',
+    'com.apple.quicktime.copyright': 'Keys:Copyright',
+    'com.apple.quicktime.comment': 'Keys:Comment',
+    'com.apple.quicktime.location.ISO6709': 'Keys:GPSCoordinates',
+    'com.apple.quicktime.software': 'Keys:Software',
+    'com.apple.quicktime.creationdate': 'Keys:CreationDate',
+}
+HEIF_BRANDS = {b'heic', b'heix', b'heim', b'heis', b'mif1', b'msf1', b'avif'}
+
+def iter_boxes(buf: Any, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(tipo, início do conteúdo, fim) das caixas ISO-BMFF entre start e end"""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buf, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type, pos + header, pos + size
+        pos += size
+
+def find_box(buf: Any, start: int, end: int, path: List[bytes]) -> Optional[Tuple[int, int]]:
+    for box_type, body, box_end in iter_boxes(buf, start, end):
+        if box_type == path[0]:
+            return (body, box_end) if len(path) == 1 else find_box(buf, body, box_end, path[1:])
+    return None
+
+def parse_tiff(buf: Any, base: int, end: int) -> Dict[str, Any]:
+    """IFD0, Exif e GPS de um bloco TIFF (o conteúdo do Exif)"""
+    tags: Dict[str, Any] = {}
+    order = {b'II': '<', b'MM': '>'}.get(bytes(buf[base:base + 2]))
+    if order is None:
+        return tags
+    type_sizes = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+    
+    def entries(offset: int) -> Iterator[Tuple[int, int, int, int]]:
+        if offset <= 0 or base + offset + 2 > end:
+            return
+        count = struct.unpack_from(order + 'H', buf, base + offset)[0]
+        for i in range(count):
+            entry = base + offset + 2 + 12 * i
+            if entry + 12 > end:
+                return
+            tag, kind, n = struct.unpack_from(order + 'HHI', buf, entry)
+            length = type_sizes.get(kind, 1) * n
+            data = entry + 8 if length <= 4 else base + struct.unpack_from(order + 'I', buf, entry + 8)[0]
+            if data + length <= end:
+                yield tag, kind, n, data
+    
+    def value(kind: int, n: int, data: int) -> Any:
+        if kind == 2:
+            return bytes(buf[data:data + n]).split(b'\0', 1)[0].decode('utf-8', 'replace').strip()
+        if kind == 5:
+            parts = [struct.unpack_from(order + 'II', buf, data + 8 * i) for i in range(n)]
+            return [num / den if den else 0.0 for num, den in parts]
+        if kind in (3, 4):
+            return struct.unpack_from(order + ('H' if kind == 3 else 'I'), buf, data)[0]
+        return None
+    
+    ifd0 = struct.unpack_from(order + 'I', buf, base + 4)[0]
+    for tag, kind, n, data in entries(ifd0):
+        if tag in TIFF_TAGS:
+            tags[TIFF_TAGS[tag]] = value(kind, n, data)
+        elif tag == TIFF_GPS_IFD:
+            gps = {t: value(k, c, d) for t, k, c, d in entries(value(kind, n, data) or 0)}
+            for ref_tag, coord_tag, name in ((1, 2, 'GPSLatitude'), (3, 4, 'GPSLongitude')):
+                coord = gps.get(coord_tag)
+                if isinstance(coord, list) and len(coord) == 3:
+                    deg, minutes, seconds = coord
+                    tags[f'GPS:{name}'] = f"{int(deg)} deg {int(minutes)}' {seconds:.2f}\""
+                    tags[f'GPS:{name}Ref'] = gps.get(ref_tag)
+    return tags
+
+def read_jpeg_tags(buf: Any) -> Dict[str, Any]:
+    tags: Dict[str, Any] = {'File:FileType': 'JPEG'}
+    pos = 2
+    while pos + 4 <= len(buf) and buf[pos] == 0xFF:
+        marker = buf[pos + 1]
+        if marker == 0xDA:  # início dos dados da imagem: acabaram os metadados
+            break
+        length = struct.unpack_from('>H', buf, pos + 2)[0]
+        segment, segment_end = pos + 4, min(pos + 2 + length, len(buf))
+        if marker == 0xE1 and bytes(buf[segment:segment + 6]) == b'Exif\0\0':
+            tags.update(parse_tiff(buf, segment + 6, segment_end))
+        elif marker == 0xFE:
+            tags['File:Comment'] = bytes(buf[segment:segment_end]).decode('utf-8', 'replace')
+        pos = segment_end
+    return tags
+
+def read_heif_tags(buf: Any, major_brand: bytes) -> Dict[str, Any]:
+    """Exif de um HEIC: item 'Exif' em meta/iinf, localizado por meta/iloc"""
+    tags: Dict[str, Any] = {'File:FileType': 'HEIC', 'File:MajorBrand': major_brand.decode('latin-1').strip()}
+    meta = find_box(buf, 0, len(buf), [b'meta'])
+    if meta is None:
+        return tags
+    meta_start = meta[0] + 4  # meta é full box
+    
+    exif_item = None
+    iinf = find_box(buf, meta_start, meta[1], [b'iinf'])
+    if iinf is not None:
+        version = buf[iinf[0]]
+        entries_start = iinf[0] + (6 if version == 0 else 8)
+        for box_type, body, _ in iter_boxes(buf, entries_start, iinf[1]):
+            if box_type != b'infe' or buf[body] < 2:
+                continue
+            id_size = 2 if buf[body] == 2 else 4
+            item_id = int.from_bytes(buf[body + 4:body + 4 + id_size], 'big')
+            item_type = bytes(buf[body + 4 + id_size + 2:body + 4 + id_size + 6])
+            if item_type == b'Exif':
+                exif_item = item_id
+                break
+    iloc = find_box(buf, meta_start, meta[1], [b'iloc'])
+    if exif_item is None or iloc is None:
+        return tags
+    
+    pos = iloc[0]
+    version = buf[pos]
+    offset_size, length_size = buf[pos + 4] >> 4, buf[pos + 4] & 0x0F
+    base_offset_size, index_size = buf[pos + 5] >> 4, (buf[pos + 5] & 0x0F if version in (1, 2) else 0)
+    pos += 6
+    
+    # Contagens vêm do arquivo: toda leitura fica dentro da caixa iloc e cada contagem é
+    # limitada pelos bytes restantes, senão um arquivo forjado roda bilhões de iterações
+    def read(size: int) -> int:
+        nonlocal pos
+        if pos + size > iloc[1]:
+            raise ValueError('iloc truncated')
+        number = int.from_bytes(buf[pos:pos + size], 'big') if size else 0
+        pos += size
+        return number
+    
+    id_size = 4 if version == 2 else 2
+    item_header = id_size + (2 if version in (1, 2) else 0) + 2 + base_offset_size + 2
+    extent_size = index_size + offset_size + length_size
+    item_count = read(id_size)
+    if item_count * item_header > iloc[1] - pos:
+        raise ValueError('iloc item count exceeds box')
+    for _ in range(item_count):
+        item_id = read(id_size)
+        construction_method = read(2) & 0x0F if version in (1, 2) else 0
+        read(2)  # data_reference_index
+        base_offset = read(base_offset_size)
+        extent_count = read(2)
+        if extent_count * extent_size > iloc[1] - pos:
+            raise ValueError('iloc extent count exceeds box')
+        extents = []
+        if extent_count:
+            # Só a primeira extensão interessa; as demais são puladas de uma vez
+            read(index_size)
+            extents.append((base_offset + read(offset_size), read(length_size)))
+            pos += (extent_count - 1) * extent_size
+        if item_id == exif_item and construction_method == 0 and extents:
+            start, length = extents[0]
+            # Conteúdo do item: deslocamento até o cabeçalho TIFF (32 bits) + TIFF
+            tiff_offset = struct.unpack_from('>I', buf, start)[0]
+            tags.update(parse_tiff(buf, start + 4 + tiff_offset, min(start + length, len(buf))))
+            break
+    return tags
+
+def read_quicktime_tags(buf: Any, major_brand: bytes) -> Dict[str, Any]:
+    """Keys (moov/meta keys+ilst) e o codec da trilha de vídeo (stsd)"""
+    tags: Dict[str, Any] = {
+        'File:FileType': 'MOV' if major_brand == b'qt  ' else 'MP4',
+        'QuickTime:MajorBrand': major_brand.decode('latin-1').strip(),
+    }
+    moov = find_box(buf, 0, len(buf), [b'moov'])
+    if moov is None:
+        return tags
+    
+    meta = find_box(buf, moov[0], moov[1], [b'meta'])
+    if meta is not None:
+        start = meta[0]
+        # QuickTime: meta é caixa comum; MP4/ISO: full box (4 bytes de versão/flags)
+        if bytes(buf[start + 4:start + 8]) not in (b'hdlr', b'keys', b'ilst'):
+            start += 4
+        keys: List[str] = []
+        keys_box = find_box(buf, start, meta[1], [b'keys'])
+        if keys_box is not None:
+            count = struct.unpack_from('>I', buf, keys_box[0] + 4)[0]
+            pos = keys_box[0] + 8
+            for _ in range(count):
+                size = struct.unpack_from('>I', buf, pos)[0]
+                # count vem do arquivo: entrada malformada encerra a leitura (size 0 não avança)
+                if size < 8 or pos + size > keys_box[1]:
+                    break
+                keys.append(bytes(buf[pos + 8:pos + size]).decode('utf-8', 'replace'))
+                pos += size
+        ilst = find_box(buf, start, meta[1], [b'ilst'])
+        if ilst is not None:
+            for box_type, body, box_end in iter_boxes(buf, ilst[0], ilst[1]):
+                index = int.from_bytes(box_type, 'big') - 1
+                data = find_box(buf, body, box_end, [b'data'])
+                if not 0 <= index < len(keys) or keys[index] not in QUICKTIME_KEYS or data is None:
+                    continue
+                raw = bytes(buf[data[0] + 8:data[1]])
+                tags[QUICKTIME_KEYS[keys[index]]] = raw.decode('utf-8', 'replace')
+    
+    for box_type, body, box_end in iter_boxes(buf, moov[0], moov[1]):
+        if box_type != b'trak':
+            continue
+        hdlr = find_box(buf, body, box_end, [b'mdia', b'hdlr'])
+        if hdlr is None or bytes(buf[hdlr[0] + 8:hdlr[0] + 12]) != b'vide':
+            continue
+        stsd = find_box(buf, body, box_end, [b'mdia', b'minf', b'stbl', b'stsd'])
+        if stsd is not None and stsd[0] + 16 <= stsd[1]:
+            tags['QuickTime:CompressorID'] = bytes(buf[stsd[0] + 12:stsd[0] + 16]).decode('latin-1')
+        break
+    return tags
+
+def read_quick_tags(path: Path) -> Optional[Dict[str, Any]]:
+    """Tags de verificação lidas direto do arquivo; None se o formato não for suportado
+    ou estiver malformado (o chamador cai para o exiftool)"""
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf[:3] == b'\xff\xd8\xff':
+                return read_jpeg_tags(buf)
+            if buf[4:8] == b'ftyp':
+                major_brand = bytes(buf[8:12])
+                if major_brand in HEIF_BRANDS:
+                    return read_heif_tags(buf, major_brand)
+                return read_quicktime_tags(buf, major_brand)
+    except (OSError, ValueError, IndexError, struct.error):
+        pass
+    return None
+
+def quick_probe(path: Path) -> MediaProbe:
+    """MediaProbe só com as tags de verificação (sem streams); exiftool como fallback"""
+    tags = read_quick_tags(path)
+    if tags is None:
+        return probe_media(path)
+    return MediaProbe(path, tags, [], {})
+
+# Faststart: com o moov antes do mdat o player começa sem baixar o arquivo inteiro.
+# Encodes usam -movflags +faststart; cópias e regravações do exiftool passam por make_faststart
+FASTSTART_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+def top_level_boxes(buf: Any) -> List[Tuple[bytes, int, int]]:
+    """(tipo, início da caixa, fim) das caixas de topo do arquivo"""
+    boxes = []
+    start = 0
+    for box_type, _, box_end in iter_boxes(buf, 0, len(buf)):
+        boxes.append((box_type, start, box_end))
+        start = box_end
+    return boxes
+
+def is_faststart(path: Path) -> Optional[bool]:
+    """True se o moov vem antes do primeiro mdat; None se não for QuickTime/MP4"""
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            types = [box_type for box_type, _, _ in top_level_boxes(buf)]
+    except (OSError, ValueError, struct.error):
+        return None
+    if b'moov' not in types or b'mdat' not in types:
+        return None
+    return types.index(b'moov') < types.index(b'mdat')
+
+def shift_chunk_offsets(moov: bytearray, start: int, end: int, lo: int, hi: int, shift: int) -> bool:
+    """Soma shift aos offsets de chunk (stco/co64) que apontam para [lo, hi).
+    False se um offset de 32 bits estourar (o chamador mantém o arquivo como está)."""
+    for box_type, body, box_end in iter_boxes(moov, start, end):
+        if box_type in FASTSTART_CONTAINERS:
+            if not shift_chunk_offsets(moov, body, box_end, lo, hi, shift):
+                return False
+        elif box_type in (b'stco', b'co64'):
+            fmt, width = ('>I', 4) if box_type == b'stco' else ('>Q', 8)
+            count = struct.unpack_from('>I', moov, body + 4)[0]
+            for pos in range(body + 8, min(box_end, body + 8 + count * width), width):
+                offset = struct.unpack_from(fmt, moov, pos)[0]
+                if lo <= offset < hi:
+                    offset += shift
+                    if width == 4 and offset > 0xFFFFFFFF:
+                        return False
+                    struct.pack_into(fmt, moov, pos, offset)
+    return True
+
+def make_faststart(path: Path) -> bool:
+    """Move o moov para antes do mdat sem recodificar (equivalente ao qt-faststart).
+    Retorna True se o arquivo já estava ou ficou em faststart."""
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            boxes = top_level_boxes(buf)
+            types = [box_type for box_type, _, _ in boxes]
+            if b'moov' not in types or b'mdat' not in types:
+                return False
+            moov_index, mdat_index = types.index(b'moov'), types.index(b'mdat')
+            if moov_index < mdat_index:
+                return True
+            # Insere antes do mdat (e do wide/free que o acompanha, reservado para o cabeçalho de 64 bits)
+            insert_index = mdat_index
+            if insert_index > 0 and types[insert_index - 1] in (b'wide', b'free'):
+                insert_index -= 1
+            insert_at = boxes[insert_index][1]
+            _, moov_start, moov_end = boxes[moov_index]
+            moov = bytearray(buf[moov_start:moov_end])
+            # Tudo entre o ponto de inserção e o moov antigo anda len(moov) bytes para frente
+            if not shift_chunk_offsets(moov, 0, len(moov), insert_at, moov_start, len(moov)):
+                print(f"Faststart skipped for {path.name}: chunk offsets exceed 32 bits")
+                return False
+            with SCRATCH.path(suffix=path.suffix, size_hint=len(buf)) as tmp_path:
+                with open(tmp_path, 'wb') as out:
+                    out.write(buf[:insert_at])
+                    out.write(moov)
+                    out.write(buf[insert_at:moov_start])
+                    out.write(buf[moov_end:])
+                SCRATCH.publish(tmp_path, path)
+    except (OSError, ValueError, IndexError, struct.error) as e:
+        print(f"Faststart failed for {path.name}: {e}")
+        return False
+    print(f"Faststart: moov moved before mdat in {path.name}")
+    return True
+
+def run_exiftool_write(src: Path, dst: Path, meta: Dict[str, Any], is_video: bool = False, probe: Optional[MediaProbe] = None) -> subprocess.CompletedProcess:
+    """Aplica todos os metadados da trend usando exiftool"""
     if is_video:
         # Para vídeos, vamos APENAS copiar o arquivo original SEM conversão
         # e aplicar os metadados EXATOS do IMG_5975.MOV
         print(f"Processing video file: {src} -> {dst}")
         print("IMPORTANT: Copying original video WITHOUT conversion to preserve format")
         
-        try:
-            # Copiar o arquivo original SEM conversão
-            shutil.copy2(src, dst)
-            print(f"Video file copied successfully: {dst}")
-            
-            # Verificar se o arquivo foi copiado corretamente
-            if not dst.exists():
-                print(f"ERROR: Failed to copy video file to {dst}")
-                return subprocess.CompletedProcess(args=[], returncode=1, stdout="", stderr="Failed to copy video file")
-        except Exception as e:
-            print(f"Error copying video file: {e}")
-            return subprocess.CompletedProcess(args=[], returncode=1, stdout="", stderr=f"Error copying video file: {e}")
-        
-        # Verificar o tipo de arquivo copiado
-        file_type_proc = subprocess.run(
-            ["exiftool", "-s", "-s", "-s", "-FileType", "-CompressorID", str(dst)], 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, 
-            text=True
-        )
-        if file_type_proc.returncode == 0:
-            print(f"Original video file info: {file_type_proc.stdout.strip()}")
-        
-        # Processamento básico para arquivos de vídeo
-        print("Processing video file...")
+        # Tipo de arquivo original (da inspeção já feita no upload)
+        probe = probe or probe_media(src)
+        print(f"Original video file info: {probe.file_type} {probe.compressor_id}".rstrip())
         
-        # Aplicar metadados básicos mesmo sabendo que pode não funcionar na trend
+        # Aplicar metadados básicos mesmo sabendo que pode não funcionar na trend.
+        # A cópia com metadados é gravada no scratch e publicada atomicamente em dst.
         try:
-            basic_cmd = [
-                "exiftool", "-m", "-overwrite_original",
-                "-Keys:Copyright=Meta AI",
-                "-Keys:Model=2Q37S02H6H006X",
-                "-Keys:Comment=app=Meta AI&device=Ray-Ban Meta Smart Glasses&id=31602281-4A5C-417D-A0F4-108B7FD05B0E",
-                str(dst)
-            ]
-            
-            print("Applying optimization...")
-            result = subprocess.run(basic_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            with SCRATCH.path(suffix=dst.suffix, size_hint=src.stat().st_size) as tmp_path:
+                basic_cmd = ["exiftool", "-m", *VIDEO_BASIC_TAGS, "-o", str(tmp_path), str(src)]
+                
+                print("Applying optimization...")
+                result = run_tool(basic_cmd)
+                
+                if not tmp_path.exists():
+                    # Formato não gravável pelo exiftool: mantém a cópia original SEM conversão
+                    print(f"Metadata write failed, copying original video: {result.stderr.strip()}")
+                    shutil.copyfile(src, tmp_path)
+                make_faststart(tmp_path)
+                SCRATCH.publish(tmp_path, dst)
             
             print("✅ File processed successfully")
             return result
@@ -489,68 +2109,41 @@ def run_exiftool_write(src: Path, dst: Path, meta: Dict[str, Any], is_video: boo
             traceback.print_exc()
             return subprocess.CompletedProcess(args=[], returncode=1, stdout="", stderr=f"Error: {e}")
     else:
-        # Para imagens, copiamos o arquivo e aplicamos os metadados padrão
-        try:
-            shutil.copy2(src, dst)
-            print(f"Image file copied successfully: {dst}")
-        except Exception as e:
-            print(f"Error copying image file: {e}")
-            return subprocess.CompletedProcess(args=[], returncode=1, stdout="", stderr=f"Error copying image file: {e}")
-        
-        # Para imagens, preservar a orientação original ANTES de aplicar metadados
-        print("Preserving original image orientation...")
-        
-        # Ler a orientação original da imagem
-        orientation_cmd = ["exiftool", "-s", "-s", "-s", "-Orientation", str(dst)]
-        orientation_result = subprocess.run(orientation_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        original_orientation = orientation_result.stdout.strip() if orientation_result.returncode == 0 else "1"
-        print(f"Original image orientation: {original_orientation}")
+        # Para imagens, uma única execução do exiftool lê a origem uma vez e
+        # grava o resultado com -o no scratch (sem cópia prévia nem -overwrite_original);
+        # o arquivo final aparece em processed/ atomicamente
+        # Orientação original copiada da própria origem (@), sem leitura separada
+        tag_args = ["-tagsFromFile", "@", "-Orientation"]
         
-        # Para imagens, usamos a abordagem padrão
-        args = ["exiftool", "-m", "-q", "-overwrite_original"]
-        
-        # Adiciona todos os metadados EXIF (orientação já foi removida do EXIF_MAP)
-        for key, (exif_tag, override_value) in EXIF_MAP.items():
-            value = override_value if override_value is not None else meta.get(key)
-            if value is not None:
-                args.append(f"-{exif_tag}={value}")
-        
-        # Adiciona todos os outros metadados como XMP
-        remaining = {}
-        for k, v in meta.items():
-            if k not in EXIF_MAP:
-                remaining[k] = v
-        
-        # Adiciona o JSON completo como XMP Description
-        desc_json = json.dumps(remaining, ensure_ascii=False)
-        args.append(f"-XMP-dc:Description={desc_json}")
+        # Metadados EXIF (orientação já foi removida do EXIF_MAP) + JSON completo como XMP
+        tag_args.extend(build_exiftool_write_args(meta))
         
         # Adiciona metadados específicos da trend que são críticos
-        args.extend([
+        tag_args.extend([
             f"-Make={meta.get('make', 'Meta View')}",
             f"-Model={meta.get('model', 'Ray-Ban Meta Smart Glasses')}",
-            f"-GPSLatitude={meta.get('gps_latitude', '22 deg 58\' 46.24\" S')}",
-            f"-GPSLongitude={meta.get('gps_longitude', '43 deg 24\' 42.09\" W')}",
+            f"-GPSLatitude={meta.get('gps_latitude', DEFAULT_GPS_LATITUDE)}",
+            f"-GPSLongitude={meta.get('gps_longitude', DEFAULT_GPS_LONGITUDE)}",
             f"-GPSLatitudeRef={meta.get('gps_latitude_ref', 'South')}",
             f"-GPSLongitudeRef={meta.get('gps_longitude_ref', 'West')}"
         ])
         
-        # IMPORTANTE: Preservar a orientação original
-        if original_orientation and original_orientation != "":
-            args.append(f"-Orientation={original_orientation}")
-            print(f"Preserving original orientation: {original_orientation}")
-        
-        # Aplica no arquivo de destino
-        args.append(str(dst))
-        
-        print(f"Applying image metadata with command: {' '.join(args)}")
         try:
-            result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            print(f"Image metadata application completed with return code: {result.returncode}")
+            with SCRATCH.path(suffix=dst.suffix, size_hint=src.stat().st_size) as tmp_path:
+                args = ["exiftool", "-m", "-q", *tag_args, "-o", str(tmp_path), str(src)]
+                # Mesmo processo relê o arquivo recém-gravado para a verificação
+                args.extend(["-execute", "-json", *[f"-{tag}" for tag in IMAGE_VERIFY_TAGS], str(tmp_path)])
+                
+                print(f"Applying image metadata with command: {' '.join(args)}")
+                result = run_tool(args)
+                print(f"Image metadata application completed with return code: {result.returncode}")
+                if not tmp_path.exists():
+                    return subprocess.CompletedProcess(args=args, returncode=1, stdout="", stderr=result.stderr or "exiftool did not create output file")
+                SCRATCH.publish(tmp_path, dst)
             
-            # Verificar os metadados aplicados para imagens também
+            # Verificar os metadados aplicados a partir da saída da mesma execução
             print("\nImage metadata verification:")
-            verify_metadata(dst)
+            print_verified_tags(parse_exiftool_json(result.stdout))
             
             return result
         except Exception as e:
@@ -582,63 +2175,61 @@ def apply_exact_video_metadata(video_path: Path, meta: Dict[str, Any]) -> subpro
         # - Base: Vídeo dos óculos (estrutura/metadados que funcionam)
         # - Overlay: Vídeo do usuário (conteúdo visual)
         
-        temp_composite = video_path.with_suffix('.composite_temp.mov')
-        
-        # Comando ffmpeg para criar composite
-        composite_cmd = [
-            "ffmpeg", "-y",
-            "-i", str(base_video),      # Base: vídeo dos óculos
-            "-i", str(video_path),      # Overlay: vídeo do usuário
-            
-            # Configurar overlay do vídeo do usuário sobre a base
-            "-filter_complex", 
-            "[1:v]scale=iw*0.8:ih*0.8[overlay]; [0:v][overlay]overlay=(W-w)/2:(H-h)/2:enable='between(t,0,20)'",
-            
-            # Manter áudio do usuário
-            "-map", "0:a",  # Áudio da base (ou do usuário)
-            
-            # Manter EXATAMENTE os metadados do vídeo dos óculos
-            "-map_metadata", "0",  # Metadados da base
-            
-            # Mesmo codec da base
-            "-c:v", "libx265",
-            "-tag:v", "hvc1",
-            "-preset", "fast",
-            "-crf", "23",
-            
-            # Mesmo áudio da base
-            "-c:a", "aac",
-            
-            str(temp_composite)
-        ]
-        
-        print(f"Creating composite: {' '.join(composite_cmd)}")
-        composite_proc = subprocess.run(composite_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        
-        if composite_proc.returncode == 0:
-            print("✅ Composite created successfully!")
-            
-            # Substituir o arquivo original pelo composite
-            import shutil
-            shutil.move(str(temp_composite), str(video_path))
-            
-            # Verificar se manteve os metadados corretos
-            verify_cmd = ["exiftool", "-s", "-s", "-s", "-Keys:Copyright", "-Keys:Model", "-MediaDataOffset", str(video_path)]
-            verify_result = subprocess.run(verify_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            print(f"Composite metadata verification: {verify_result.stdout.strip()}")
-            
-            return composite_proc
-        else:
-            print(f"❌ Composite creation failed: {composite_proc.stderr}")
-            
-            # Limpar arquivo temporário
-            if temp_composite.exists():
-                temp_composite.unlink()
+        # Composite temporário no scratch (tmpfs quando couber no orçamento)
+        composite_size_hint = base_video.stat().st_size + video_path.stat().st_size
+        with SCRATCH.path(suffix='.composite_temp.mov', size_hint=composite_size_hint) as temp_composite:
+            # Comando ffmpeg para criar composite
+            composite_cmd = [
+                "ffmpeg", "-y",
+                "-i", str(base_video),      # Base: vídeo dos óculos
+                "-i", str(video_path),      # Overlay: vídeo do usuário
+                
+                # Configurar overlay do vídeo do usuário sobre a base
+                "-filter_complex", 
+                "[1:v]scale=iw*0.8:ih*0.8[overlay]; [0:v][overlay]overlay=(W-w)/2:(H-h)/2:enable='between(t,0,20)'",
+                
+                # Manter áudio do usuário
+                "-map", "0:a",  # Áudio da base (ou do usuário)
+                
+                # Manter EXATAMENTE os metadados do vídeo dos óculos
+                "-map_metadata", "0",  # Metadados da base
+                
+                # Mesmo codec da base
+                "-c:v", "libx265",
+                "-tag:v", "hvc1",
+                "-preset", "fast",
+                "-crf", "23",
+                
+                # Mesmo áudio da base
+                "-c:a", "aac",
+                
+                # moov antes do mdat
+                "-movflags", "+faststart",
+                
+                str(temp_composite)
+            ]
             
-            # Fallback: pelo menos aplicar metadados
-            print("Falling back to metadata-only approach...")
-            return fallback_video_conversion(video_path)
+            print(f"Creating composite: {' '.join(composite_cmd)}")
+            composite_proc = run_tool(composite_cmd)
             
+            if composite_proc.returncode == 0:
+                print("✅ Composite created successfully!")
+                
+                # Substituir o arquivo original pelo composite (atômico)
+                SCRATCH.publish(temp_composite, video_path)
+                
+                # Verificar se manteve os metadados corretos
+                composite_probe = quick_probe(video_path)
+                print(f"Composite metadata verification: {composite_probe.tag('Keys:Copyright')} {composite_probe.tag('Keys:Model')} {composite_probe.tag('MediaDataOffset')}")
+                
+                return composite_proc
+            else:
+                print(f"❌ Composite creation failed: {composite_proc.stderr}")
+                
+                # Fallback: pelo menos aplicar metadados
+                print("Falling back to metadata-only approach...")
+                return fallback_video_conversion(video_path)
+                
     except Exception as e:
         print(f"Exception creating composite: {e}")
         import traceback
@@ -649,20 +2240,12 @@ def fallback_video_conversion(video_path: Path) -> subprocess.CompletedProcess:
     """Método de fallback se a clonagem falhar"""
     print("Using fallback method: simple copy with basic metadata...")
     
-    # Se tudo falhar, apenas copia e aplica metadados básicos
-    fallback_cmd = [
-        "exiftool", "-m", "-overwrite_original",
-        "-Keys:Copyright=Meta AI",
-        "-Keys:Model=2Q37S02H6H006X", 
-        "-Keys:Comment=app=Meta AI&device=Ray-Ban Meta Smart Glasses&id=31602281-4A5C-417D-A0F4-108B7FD05B0E",
-        str(video_path)
-    ]
-    
-    print(f"Fallback command: {' '.join(fallback_cmd)}")
-    fallback_proc = subprocess.run(fallback_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # Se tudo falhar, apenas aplica metadados básicos
+    print(f"Fallback tags: {' '.join(VIDEO_BASIC_TAGS)}")
+    fallback_proc = run_exiftool_rewrite(video_path, VIDEO_BASIC_TAGS)
     return fallback_proc
 
-def apply_video_metadata(video_path: Path, meta: Dict[str, Any]) -> subprocess.CompletedProcess:
+def apply_video_metadata(video_path: Path, meta: Dict[str, Any], probe: Optional[MediaProbe] = None) -> subprocess.CompletedProcess:
     """Aplica metadados específicos para vídeos da trend baseado no arquivo IMG_5975.MOV"""
     print(f"Applying trend metadata to video {video_path}")
     
@@ -673,19 +2256,11 @@ def apply_video_metadata(video_path: Path, meta: Dict[str, Any]) -> subprocess.C
     current_date = datetime.now().strftime('%Y:%m:%d %H:%M:%S')
     
     # Primeiro, vamos verificar se é um arquivo MOV ou MP4
-    file_type_proc = subprocess.run(
-        ["exiftool", "-s", "-s", "-s", "-FileType", str(video_path)], 
-        stdout=subprocess.PIPE, 
-        stderr=subprocess.PIPE, 
-        text=True
-    )
-    file_type = file_type_proc.stdout.strip()
+    file_type = (probe or probe_media(video_path)).file_type
     print(f"File type: {file_type}")
     
     # Metadados exatos do IMG_5975.MOV
     exact_metadata_args = [
-        "exiftool", "-m", "-overwrite_original",
-        
         # Metadados básicos
         "-Copyright=Meta AI",
         "-Model=Ray-Ban Meta Smart Glasses",
@@ -730,16 +2305,13 @@ def apply_video_metadata(video_path: Path, meta: Dict[str, Any]) -> subprocess.C
         "-XResolution=72",
         "-YResolution=72",
         "-BitDepth=24",
-        
-        # Alvo
-        str(video_path)
     ]
     
     print("Applying exact metadata from IMG_5975.MOV:")
     print(f"Command: {' '.join(exact_metadata_args)}")
     
     # Executar o comando com os metadados exatos
-    exact_proc = subprocess.run(exact_metadata_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    exact_proc = run_exiftool_rewrite(video_path, exact_metadata_args)
     print(f"Exact metadata result: {exact_proc.returncode}")
     if exact_proc.stderr:
         print(f"Exact metadata stderr: {exact_proc.stderr}")
@@ -750,7 +2322,6 @@ def apply_video_metadata(video_path: Path, meta: Dict[str, Any]) -> subprocess.C
         
         # Aplicar apenas os metadados essenciais
         essential_args = [
-            "exiftool", "-m", "-overwrite_original",
             "-Copyright=Meta AI",
             "-Model=Ray-Ban Meta Smart Glasses",
             f"-Comment=app=Meta AI&device=Ray-Ban Meta Smart Glasses&id={device_id}",
@@ -758,11 +2329,10 @@ def apply_video_metadata(video_path: Path, meta: Dict[str, Any]) -> subprocess.C
             "-GPSLongitude=47 deg 53' 3.48\" W",
             "-GPSLatitudeRef=South",
             "-GPSLongitudeRef=West",
-            str(video_path)
         ]
         
         print(f"Essential metadata command: {' '.join(essential_args)}")
-        essential_proc = subprocess.run(essential_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        essential_proc = run_exiftool_rewrite(video_path, essential_args)
         print(f"Essential metadata result: {essential_proc.returncode}")
         if essential_proc.stderr:
             print(f"Essential metadata stderr: {essential_proc.stderr}")
@@ -777,20 +2347,204 @@ def apply_video_metadata(video_path: Path, meta: Dict[str, Any]) -> subprocess.C
     
     return exact_proc
         
-def convert_to_mov_format(src: Path, dst: Path) -> bool:
+@dataclass
+class EncodingPlan:
+    """Parâmetros escolhidos para uma transcodificação e o custo previsto"""
+    preset: str
+    crf: int
+    max_height: Optional[int]
+    estimated_seconds: float
+    queue_wait_seconds: float
+    segments: int = 1
+    source_duration: float = 0.0
+    
+    @property
+    def predicted_completion(self) -> datetime:
+        return datetime.now() + timedelta(seconds=self.queue_wait_seconds + self.estimated_seconds)
+    
+    def video_args(self) -> List[str]:
+        args = ["-preset", self.preset, "-crf", str(self.crf)]
+        if self.max_height:
+            # Reduz apenas quando a origem é maior; largura par mantendo a proporção
+            args.extend(["-vf", f"scale=-2:'min({self.max_height},ih)'"])
+        return args
+
+# Degraus do mais caro (melhor qualidade) ao mais barato: (preset, crf, altura máxima)
+ENCODING_LADDER = [
+    ('fast', 23, None),
+    ('faster', 25, 1080),
+    ('veryfast', 27, 720),
+    ('ultrafast', 28, 540),
+]
+# Encode segmentado: clipes longos são cortados em keyframes e codificados em paralelo,
+# com os núcleos divididos entre os slots de processamento
+SEGMENT_MIN_SECONDS = float(os.environ.get('SEGMENT_MIN_SECONDS', 10))
+ENCODE_WORKERS = int(os.environ.get('ENCODE_WORKERS', max(1, (os.cpu_count() or 1) // PROCESSING_SCHEDULER.slots)))
+# Vazão aproximada do libx265 por preset, em pixels codificados por segundo
+ENCODE_PIXEL_RATE = {'fast': 8e6, 'faster': 12e6, 'veryfast': 20e6, 'ultrafast': 45e6}
+# Fração do timeout do gunicorn que uma requisição pode gastar na fila + encode
+ENCODE_TIME_BUDGET = 0.8 * int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Correção aprendida (observado / previsto) e duração média recente dos encodes
+_encode_stats = {'calibration': 1.0, 'avg_seconds': 20.0}
+
+def parse_frame_rate(value: Any) -> float:
+    """'30000/1001' -> 29.97 (ffprobe r_frame_rate)"""
+    try:
+        num, _, den = str(value).partition('/')
+        return float(num) / float(den or 1)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return 0.0
+
+def estimate_encode_seconds(probe: MediaProbe, preset: str, max_height: Optional[int]) -> float:
+    width, height = probe.width, probe.height
+    if max_height and height > max_height:
+        width, height = width * max_height / height, max_height
+    fps = parse_frame_rate((probe.video_stream or {}).get('r_frame_rate')) or 30.0
+    frames = probe.duration * fps
+    return frames * width * height / ENCODE_PIXEL_RATE[preset] * _encode_stats['calibration']
+
+def segment_count(duration: float) -> int:
+    return max(1, min(ENCODE_WORKERS, int(duration // SEGMENT_MIN_SECONDS)))
+
+def plan_encoding(probe: MediaProbe, queue_depth: Optional[int] = None) -> EncodingPlan:
+    """Escolhe preset, CRF e redução pela resolução, duração e fila atual.
+    Levanta ProcessingRejected se nem o degrau mais barato termina a tempo."""
+    slots = PROCESSING_SCHEDULER.slots
+    if queue_depth is None:
+        queue_depth = PROCESSING_SCHEDULER.queue_depth()
+    # Fila cheia começa em degraus mais baratos
+    load = queue_depth / slots
+    start_rung = 0 if load <= 1 else 1 if load <= 2 else 2
+    queue_wait = max(0, queue_depth - slots) * _encode_stats['avg_seconds'] / slots
+    segments = segment_count(probe.duration)
+    
+    for preset, crf, max_height in ENCODING_LADDER[start_rung:]:
+        estimate = estimate_encode_seconds(probe, preset, max_height) / segments
+        if queue_wait + estimate <= ENCODE_TIME_BUDGET:
+            return EncodingPlan(preset, crf, max_height, estimate, queue_wait, segments, probe.duration)
+    
+    print(f"Rejecting encode: {probe.duration:.1f}s {probe.width}x{probe.height} would need ~{queue_wait + estimate:.0f}s")
+    raise ProcessingRejected('Vídeo longo demais para processar agora. Envie um trecho menor ou tente mais tarde.')
+
+def record_encode(plan: EncodingPlan, elapsed: float) -> None:
+    """Ajusta a calibração com o tempo observado (média móvel exponencial)"""
+    if plan.estimated_seconds > 1:
+        ratio = elapsed / (plan.estimated_seconds / _encode_stats['calibration'])
+        _encode_stats['calibration'] = 0.8 * _encode_stats['calibration'] + 0.2 * ratio
+    _encode_stats['avg_seconds'] = 0.8 * _encode_stats['avg_seconds'] + 0.2 * elapsed
+
+def convert_to_mov_format(src: Path, dst: Path, probe: Optional[MediaProbe] = None) -> bool:
     """
     Converte qualquer vídeo para o formato exato do IMG_5975.MOV usando ffmpeg.
+    Os parâmetros vêm de plan_encoding (pode levantar ProcessingRejected antes de começar).
+    A codificação é feita no scratch e o resultado publicado atomicamente em dst.
     Retorna True se a conversão for bem-sucedida, False caso contrário.
     """
+    plan = None
+    has_audio = True
+    if src.exists():
+        probe = probe or probe_media(src, with_streams=True)
+        plan = plan_encoding(probe)
+        has_audio = probe.audio_stream is not None
+        print(f"Encoding plan: preset={plan.preset} crf={plan.crf} max_height={plan.max_height} "
+              f"segments={plan.segments} estimate={plan.estimated_seconds:.1f}s completion={plan.predicted_completion:%H:%M:%S}")
+    size_hint = src.stat().st_size if src.exists() else 0
+    with SCRATCH.path(suffix=dst.suffix or '.mov', size_hint=size_hint) as tmp_dst:
+        started = time.monotonic()
+        if not encode_to_mov(src, tmp_dst, plan, has_audio):
+            return False
+        if plan is not None:
+            record_encode(plan, time.monotonic() - started)
+        # Encodes já saem com +faststart; o fallback de cópia simples não
+        make_faststart(tmp_dst)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        SCRATCH.publish(tmp_dst, dst)
+        return True
+
+def encode_hevc_segmented(src: Path, dst: Path, plan: EncodingPlan, has_audio: bool, timeout: float) -> bool:
+    """
+    Corta src em keyframes (cópia sem perdas), codifica os trechos em paralelo com os
+    mesmos parâmetros e concatena sem recodificar num MOV hvc1. O áudio é codificado uma vez.
+    Levanta subprocess.TimeoutExpired se o conjunto passar de timeout.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    deadline = time.monotonic() + timeout
+    # As threads do pool não herdam o job da requisição: repassa explicitamente
+    job = current_tool_job()
+    
+    def run(cmd: List[str]) -> subprocess.CompletedProcess:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        return run_tool(cmd, timeout=remaining, job=job)
+    
+    with SCRATCH.directory() as workdir:
+        split_proc = run([
+            "ffmpeg", "-y", "-i", str(src),
+            "-map", "0:v:0", "-c", "copy",
+            "-f", "segment", "-segment_time", f"{plan.source_duration / plan.segments:.3f}",
+            "-reset_timestamps", "1",
+            str(workdir / "in_%03d.mov")
+        ])
+        parts = sorted(workdir.glob("in_*.mov"))
+        if split_proc.returncode != 0 or not parts:
+            print(f"Error splitting video into segments: {split_proc.stderr}")
+            return False
+        
+        # Cada trecho usa só a sua fatia de núcleos
+        pool_threads = max(1, ENCODE_WORKERS // len(parts))
+        jobs = []
+        for part in parts:
+            jobs.append([
+                "ffmpeg", "-y", "-i", str(part),
+                "-c:v", "libx265", "-tag:v", "hvc1",
+                *plan.video_args(),
+                "-x265-params", f"pools={pool_threads}",
+                "-pix_fmt", "yuv420p", "-an",
+                str(part.with_name(part.name.replace("in_", "out_")))
+            ])
+        audio_path = workdir / "audio.m4a"
+        if has_audio:
+            jobs.append(["ffmpeg", "-y", "-i", str(src), "-vn", "-map", "0:a:0",
+                         "-c:a", "aac", "-b:a", "128k", str(audio_path)])
+        
+        print(f"Encoding {len(parts)} segments in parallel ({pool_threads} threads each)")
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            results = list(pool.map(run, jobs))
+        failed = [r for r in results if r.returncode != 0]
+        if failed:
+            print(f"Error encoding segment: {failed[0].stderr}")
+            return False
+        
+        concat_list = workdir / "segments.txt"
+        concat_list.write_text("".join(
+            f"file '{part.with_name(part.name.replace('in_', 'out_'))}'\n" for part in parts
+        ))
+        concat_cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(concat_list)]
+        if has_audio:
+            concat_cmd.extend(["-i", str(audio_path), "-map", "0:v:0", "-map", "1:a:0"])
+        concat_cmd.extend(["-c", "copy", "-tag:v", "hvc1", "-movflags", "+faststart", str(dst)])
+        concat_proc = run(concat_cmd)
+        if concat_proc.returncode != 0:
+            print(f"Error concatenating segments: {concat_proc.stderr}")
+            return False
+    
+    print(f"Segmented HEVC encode successful ({len(parts)} segments)")
+    return True
+
+def encode_to_mov(src: Path, dst: Path, plan: Optional[EncodingPlan] = None,
+                  has_audio: bool = True) -> bool:
+    """Codifica src em dst (HEVC, fallback H.264, por último cópia simples)"""
     print(f"Converting video to MOV format: {src} -> {dst}")
+    video_args = plan.video_args() if plan else ["-preset", "fast", "-crf", "23"]
+    # Nunca deixa o ffmpeg passar do timeout do gunicorn
+    encode_timeout = min(300, ENCODE_TIME_BUDGET / 0.8)
     
     # Verificar se o ffmpeg está instalado
     try:
-        ffmpeg_check = subprocess.run(
+        ffmpeg_check = run_tool(
             ["ffmpeg", "-version"], 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, 
-            text=True,
             timeout=5  # Timeout de 5 segundos para evitar travamentos
         )
         if ffmpeg_check.returncode != 0:
@@ -820,28 +2574,28 @@ def convert_to_mov_format(src: Path, dst: Path) -> bool:
     
     # Converter o vídeo para o formato MOV com codec hvc1 (HEVC)
     try:
+        # Clipes longos: trechos em paralelo; se falhar, segue para o encode único
+        if plan is not None and plan.segments > 1:
+            if encode_hevc_segmented(src, dst, plan, has_audio, encode_timeout):
+                return True
+            print("Segmented encode failed, falling back to single-pass encode...")
+        
         # Primeiro, tente com libx265 (HEVC)
         print("Attempting conversion with libx265 codec...")
         ffmpeg_cmd = [
             "ffmpeg", "-y", "-i", str(src),
             "-c:v", "libx265",  # Use HEVC codec
             "-tag:v", "hvc1",   # Tag como hvc1
-            "-preset", "fast",  # Preset de codificação
-            "-crf", "23",       # Qualidade
+            *video_args,        # Preset, qualidade e redução (plan_encoding)
             "-pix_fmt", "yuv420p",  # Formato de pixel
             "-c:a", "aac",      # Codec de áudio
             "-b:a", "128k",     # Bitrate de áudio
+            "-movflags", "+faststart",  # moov antes do mdat
             str(dst)
         ]
         
         print(f"Running ffmpeg command: {' '.join(ffmpeg_cmd)}")
-        ffmpeg_proc = subprocess.run(
-            ffmpeg_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=300  # Timeout de 5 minutos para conversão
-        )
+        ffmpeg_proc = run_tool(ffmpeg_cmd, timeout=encode_timeout)
         
         if ffmpeg_proc.returncode != 0:
             print(f"Error converting video with libx265: {ffmpeg_proc.stderr}")
@@ -851,22 +2605,16 @@ def convert_to_mov_format(src: Path, dst: Path) -> bool:
             fallback_cmd = [
                 "ffmpeg", "-y", "-i", str(src),
                 "-c:v", "h264",       # Use H.264 codec
-                "-preset", "fast",     # Preset de codificação
-                "-crf", "23",          # Qualidade
+                *video_args,           # Preset, qualidade e redução (plan_encoding)
                 "-pix_fmt", "yuv420p", # Formato de pixel
                 "-c:a", "aac",         # Codec de áudio
                 "-b:a", "128k",        # Bitrate de áudio
+                "-movflags", "+faststart",  # moov antes do mdat
                 str(dst)
             ]
             
             print(f"Running fallback ffmpeg command: {' '.join(fallback_cmd)}")
-            fallback_proc = subprocess.run(
-                fallback_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=300  # Timeout de 5 minutos para conversão
-            )
+            fallback_proc = run_tool(fallback_cmd, timeout=encode_timeout)
             
             if fallback_proc.returncode != 0:
                 print(f"Error converting video with h264: {fallback_proc.stderr}")
@@ -888,7 +2636,7 @@ def convert_to_mov_format(src: Path, dst: Path) -> bool:
             print("Video conversion with libx265 successful")
             return True
     except subprocess.TimeoutExpired:
-        print("ERROR: ffmpeg conversion timed out after 5 minutes")
+        print(f"ERROR: ffmpeg conversion timed out after {encode_timeout:.0f} seconds")
         return False
     except Exception as e:
         print(f"Error during video conversion: {e}")
@@ -906,9 +2654,10 @@ def convert_to_mov_format(src: Path, dst: Path) -> bool:
             print(f"Error copying original video: {copy_error}")
             return False
 
-def verify_metadata(file_path: Path) -> None:
+def verify_metadata(file_path: Path, probe: Optional[MediaProbe] = None) -> None:
     """Verifica e exibe os metadados aplicados a um arquivo"""
     print(f"\nVerifying metadata for {file_path}:")
+    probe = probe or quick_probe(file_path)
     
     # Verificar metadados críticos usando Keys: para vídeos
     critical_fields = [
@@ -917,87 +2666,831 @@ def verify_metadata(file_path: Path) -> None:
     ]
     
     for field in critical_fields:
-        cmd = ["exiftool", "-s", "-s", "-s", f"-{field}", str(file_path)]
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode == 0 and result.stdout.strip():
-            print(f"  ✓ {field}: {result.stdout.strip()}")
+        value = probe.tag(field)
+        if value not in (None, ""):
+            print(f"  ✓ {field}: {value}")
         else:
             print(f"  ✗ {field}: Not found or empty")
     
     # Verificar metadados alternativos (sem Keys:) para imagens
     alt_fields = ["Copyright", "Model", "Comment", "GPSLatitude", "GPSLongitude"]
     for field in alt_fields:
-        cmd = ["exiftool", "-s", "-s", "-s", f"-{field}", str(file_path)]
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode == 0 and result.stdout.strip():
-            print(f"  ✓ {field}: {result.stdout.strip()}")
+        value = probe.tag(field)
+        if value not in (None, ""):
+            print(f"  ✓ {field}: {value}")
     
     # Verificar tipo de arquivo e formato
-    file_type_cmd = ["exiftool", "-s", "-s", "-s", "-FileType", "-MajorBrand", "-FileTypeExtension", "-CompressorID", "-CompressorName", str(file_path)]
-    file_type_result = subprocess.run(file_type_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if file_type_result.returncode == 0:
-        print(f"  • File info: {file_type_result.stdout.strip()}")
+    file_info = " ".join(
+        str(probe.tag(field)) for field in ["FileType", "MajorBrand", "FileTypeExtension", "CompressorID", "CompressorName"]
+        if probe.tag(field) not in (None, "")
+    )
+    print(f"  • File info: {file_info}")
     
     # Para vídeos, verificar especificamente se é HEVC (hvc1)
     if str(file_path).lower().endswith(('.mov', '.mp4')):
         print("  📹 Video-specific checks:")
-        if "hvc1" in file_type_result.stdout:
+        if "hvc1" in file_info:
             print("  ✅ Codec: HEVC (hvc1) - CORRETO para trend!")
-        elif "avc1" in file_type_result.stdout or "H.264" in file_type_result.stdout:
+        elif "avc1" in file_info or "H.264" in file_info:
             print("  ❌ Codec: H.264 (avc1) - PROBLEMA! Deveria ser HEVC (hvc1)")
         else:
             print("  ⚠️  Codec: Desconhecido")
+        faststart = is_faststart(file_path)
+        if faststart:
+            print("  ✅ Faststart: moov antes do mdat")
+        elif faststart is False:
+            print("  ❌ Faststart: moov depois do mdat - reprodução só começa após o download completo")
     
     print("Metadata verification completed.\n")
 
-@app.route('/mysql-status')
-def mysql_status():
-    """Detailed MySQL status check"""
-    if not MYSQL_AVAILABLE:
-        return {'status': 'error', 'message': 'MySQL module not available'}
+# Previews (poster/clip para vídeos, miniatura JPEG para imagens) gerados sob demanda
+PREVIEW_DIR = PROCESSED_DIR / '.previews'
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get('PREVIEW_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+PREVIEW_MAX_WIDTH = 480
+PREVIEW_CACHE_SECONDS = 365 * 24 * 3600
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', '3gp', 'mkv'}
+PREVIEW_KINDS = {
+    # kind: (extensão do arquivo gerado, mimetype)
+    'poster': ('.jpg', 'image/jpeg'),
+    'clip': ('.mp4', 'video/mp4'),
+    'thumb': ('.jpg', 'image/jpeg'),
+}
+
+def preview_cache_path(source: Path, kind: str) -> Path:
+    """Caminho do preview em cache; tamanho e mtime do original invalidam a entrada"""
+    stat = source.stat()
+    suffix = PREVIEW_KINDS[kind][0]
+    return PREVIEW_DIR / f"{source.name}.{stat.st_size}-{stat.st_mtime_ns}.{kind}{suffix}"
+
+def build_preview_cmd(source: Path, kind: str, target: Path) -> List[str]:
+    """Comando ffmpeg que gera o preview pedido"""
+    scale = f"scale='min({PREVIEW_MAX_WIDTH},iw)':-2"
+    if kind == 'clip':
+        return [
+            "ffmpeg", "-y", "-v", "error", "-i", str(source),
+            "-t", "10", "-vf", scale,
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "32", "-maxrate", "400k", "-bufsize", "800k",
+            "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "64k", "-ac", "1",
+            "-movflags", "+faststart", "-f", "mp4", str(target)
+        ]
+    # poster (primeiro quadro útil do vídeo) e thumb (imagem reduzida)
+    return [
+        "ffmpeg", "-y", "-v", "error", "-i", str(source),
+        "-frames:v", "1", "-vf", scale, "-q:v", "5", "-f", "image2", str(target)
+    ]
+
+def generate_preview(source: Path, kind: str, target: Path) -> bool:
+    """Gera o preview em arquivo temporário e publica atomicamente"""
+    os.makedirs(PREVIEW_DIR, exist_ok=True)
+    tmp_target = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        proc = run_tool(build_preview_cmd(source, kind, tmp_target), timeout=60)
+        if (proc.returncode != 0 or not tmp_target.exists()) and kind == 'thumb':
+            # ffmpeg sem suporte ao formato (ex.: HEIC): usa a prévia embutida
+            print(f"ffmpeg thumbnail failed for {source}, trying embedded preview: {proc.stderr.strip()[:200]}")
+            with open(tmp_target, 'wb') as out:
+                proc = run_tool(["exiftool", "-b", "-PreviewImage", str(source)], stdout=out, timeout=30)
+        if proc.returncode != 0 or not tmp_target.exists() or tmp_target.stat().st_size == 0:
+            print(f"Preview generation failed for {source} ({kind})")
+            return False
+        os.replace(tmp_target, target)
+        return True
+    except Exception as e:
+        print(f"Error generating preview for {source}: {e}")
+        return False
+    finally:
+        if tmp_target.exists():
+            tmp_target.unlink()
+
+def evict_previews(max_bytes: int = PREVIEW_CACHE_MAX_BYTES, directory: Path = PREVIEW_DIR) -> None:
+    """Remove os arquivos menos usados recentemente até caber no orçamento; o último
+    acesso é o maior entre mtime e atime (o cache do S3 marca acessos só no atime)"""
+    # Recursivo: as chaves do cache do S3 ficam em subdiretórios (layout por hash do ID)
+    entries = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((max(stat.st_mtime, stat.st_atime), stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+def get_preview(source: Path, kind: str, username: str, deadline: float) -> Optional[Path]:
+    """Retorna o preview em cache, gerando na primeira requisição. A geração passa pela
+    fila justa e pelo prazo das ferramentas como o processamento (ProcessingRejected se
+    não houver vez); size 0 não consome a cota diária"""
+    target = preview_cache_path(source, kind)
+    if target.exists():
+        # mtime marca o último acesso para a política LRU
+        os.utime(target)
+        return target
+    with processing_slot(username, kind != 'thumb', 0, deadline, calibrate=False):
+        # Outro request pode ter gerado o mesmo preview enquanto esperávamos a vez
+        if not target.exists() and not generate_preview(source, kind, target):
+            return None
+    evict_previews()
+    return target if target.exists() else None
+
+# Armazenamento dos arquivos processados: disco local (padrão) ou bucket S3-compatível
+# (AWS, MinIO, R2), para que qualquer instância sirva qualquer download
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local').lower()
+STORAGE_STREAM_CHUNK = 1024 * 1024
+
+class LocalStorage:
+    """Arquivos processados em um diretório local"""
+    
+    def __init__(self, root: Path):
+        self.root = root
+    
+    def publish(self, path: Path, key: str) -> None:
+        """Move o arquivo gerado para o armazenamento sob key"""
+        target = self.root / key
+        if path != target:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            SCRATCH.publish(path, target)
+    
+    def exists(self, key: str) -> bool:
+        return (self.root / key).is_file()
+    
+    def local_path(self, key: str) -> Optional[Path]:
+        """Caminho local para ferramentas que precisam do arquivo (ex.: previews)"""
+        path = self.root / key
+        return path if path.is_file() else None
+    
+    def download_response(self, key: str, download_name: str):
+        return send_from_directory(str(self.root), key, as_attachment=True, download_name=download_name)
+
+class S3Storage:
+    """Bucket S3-compatível: upload multipart em streaming, download em streaming e
+    cache local limitado para as ferramentas que precisam de caminho em disco"""
+    
+    def __init__(self, bucket: str, prefix: str, cache_dir: Path, cache_max_bytes: int,
+                 part_size: int, endpoint_url: Optional[str] = None, region: Optional[str] = None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.endpoint_url = endpoint_url
+        self.region = region
+        # boto3 só é importado com STORAGE_BACKEND=s3 (fora do cold start do backend local)
+        from boto3.s3.transfer import TransferConfig
+        self.transfer_config = TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size)
+        self._client = None
+        self._client_pid = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+    
+    def _s3(self):
+        # Clientes boto3 não sobrevivem ao fork: um por processo
+        if self._client is None or self._client_pid != os.getpid():
+            import boto3
+            self._client = boto3.client('s3', endpoint_url=self.endpoint_url, region_name=self.region)
+            self._client_pid = os.getpid()
+        return self._client
+    
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+    
+    def publish(self, path: Path, key: str) -> None:
+        """Envia em partes de part_size sem carregar o arquivo na memória; a cópia local
+        vira entrada do cache (o preview da página de resultado vem logo em seguida)"""
+        self._s3().upload_file(str(path), self.bucket, self._object_key(key), Config=self.transfer_config)
+        cached = self.cache_dir / key
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(path, cached)
+        evict_previews(self.cache_max_bytes, directory=self.cache_dir)
+    
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self._s3().head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+    
+    def local_path(self, key: str) -> Optional[Path]:
+        from botocore.exceptions import ClientError
+        cached = self.cache_dir / key
+        try:
+            stat = cached.stat()
+        except FileNotFoundError:
+            stat = None
+        if stat is not None:
+            # Acesso marcado só no atime: o mtime faz parte da chave do cache de previews
+            os.utime(cached, ns=(time.time_ns(), stat.st_mtime_ns))
+            return cached
+        tmp_path = cached.with_name(f".{cached.name}.{uuid.uuid4().hex}.tmp")
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self._s3().download_file(self.bucket, self._object_key(key), str(tmp_path), Config=self.transfer_config)
+            os.replace(tmp_path, cached)
+        except ClientError as e:
+            print(f"Storage fetch failed for {key}: {e}")
+            return None
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        evict_previews(self.cache_max_bytes, directory=self.cache_dir)
+        return cached
+    
+    def download_response(self, key: str, download_name: str):
+        from botocore.exceptions import ClientError
+        try:
+            obj = self._s3().get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError:
+            abort(404)
+        body = obj['Body']
+        
+        def stream() -> Iterator[bytes]:
+            try:
+                yield from body.iter_chunks(STORAGE_STREAM_CHUNK)
+            finally:
+                body.close()
+        
+        response = app.response_class(
+            stream(), mimetype=obj.get('ContentType') or 'application/octet-stream', direct_passthrough=True
+        )
+        response.content_length = obj['ContentLength']
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        return response
+
+def create_storage(root: Path, prefix: str):
+    if STORAGE_BACKEND == 's3':
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3")
+        return S3Storage(
+            bucket=os.environ['S3_BUCKET'],
+            prefix=os.environ.get('S3_PREFIX', '') + prefix,
+            cache_dir=root / '.storage-cache',
+            cache_max_bytes=int(os.environ.get('STORAGE_CACHE_MAX_BYTES', 1024 * 1024 * 1024)),
+            part_size=int(os.environ.get('S3_PART_SIZE', 8 * 1024 * 1024)),
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+            region=os.environ.get('S3_REGION'),
+        )
+    return LocalStorage(root)
+
+STORAGE = create_storage(PROCESSED_DIR, 'processed/')
+# Originais enviados, lidos pelos workers quando PROCESSING_MODE=queue
+SOURCE_STORAGE = create_storage(UPLOAD_DIR, 'uploads/')
+
+# Layout dos arquivos: ID único (ULID, ordenado no tempo) em diretórios aninhados pelo hash
+# do ID; o índice liga o nome público (URL de download) à chave no armazenamento
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+def new_file_id() -> str:
+    """ULID: 48 bits de timestamp (ms) + 80 bits aleatórios em 26 caracteres base32"""
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), 'big')
+    return ''.join(CROCKFORD_ALPHABET[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+def sharded_key(file_id: str, suffix: str) -> str:
+    """ab/cd/<id><suffix>: o hash espalha por 65536 diretórios (o prefixo do ULID é o tempo)"""
+    digest = hashlib.sha1(file_id.encode()).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{file_id}{suffix}"
+
+# Histórico de processamento por usuário: nome público -> chave no armazenamento, mais
+# status, tamanhos e tempos. Fica no MySQL (tabela processed_files) quando disponível;
+# se o MySQL falhar, grava e lê de um SQLite local até a próxima tentativa
+PROCESSED_FILE_COLUMNS = ['public_name', 'storage_key', 'username', 'status', 'is_video',
+                          'source_size', 'output_size', 'created_at', 'started_at', 'finished_at', 'error',
+                          'source_sha256', 'profile']
+FILES_PAGE_SIZE = int(os.environ.get('FILES_PAGE_SIZE', 24))
+FILES_MYSQL_RETRY_SECONDS = float(os.environ.get('FILES_MYSQL_RETRY_SECONDS', 30))
+
+class ProcessedFiles(ABC):
+    """Acesso à tabela processed_files. SQL escrito com '?'; subclasses fornecem a transação.
+    A paginação é por keyset em (created_at, public_name), servida pelo índice (username, created_at)."""
+    
+    def _execute(self, cursor: Any, sql: str, params: tuple) -> None:
+        cursor.execute(sql, params)
+    
+    @abstractmethod
+    def _cursor(self) -> ContextManager[Any]:
+        """Cursor dentro de uma transação (commit ao sair sem erro)"""
+    
+    def _row(self, row: Optional[tuple]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        record = dict(zip(PROCESSED_FILE_COLUMNS, row))
+        record['is_video'] = bool(record['is_video'])
+        return record
+    
+    def register(self, public_name: str, storage_key: str, username: str, is_video: bool, source_size: int,
+                 source_sha256: Optional[str] = None, profile: Optional[str] = None) -> bool:
+        with self._cursor() as cursor:
+            self._execute(
+                cursor,
+                "INSERT INTO processed_files (public_name, storage_key, username, status, is_video, "
+                "source_size, created_at, source_sha256, profile) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (public_name, storage_key, username, int(is_video), source_size, time.time(), source_sha256, profile)
+            )
+            return cursor.rowcount == 1
+    
+    def mark_started(self, public_name: str) -> bool:
+        with self._cursor() as cursor:
+            self._execute(
+                cursor,
+                "UPDATE processed_files SET status = 'processing', started_at = ? WHERE public_name = ?",
+                (time.time(), public_name)
+            )
+            return cursor.rowcount == 1
     
+    def mark_finished(self, public_name: str, status: str, output_size: Optional[int] = None,
+                      error: Optional[str] = None) -> bool:
+        with self._cursor() as cursor:
+            self._execute(
+                cursor,
+                "UPDATE processed_files SET status = ?, output_size = ?, error = ?, finished_at = ? "
+                "WHERE public_name = ?",
+                (status, output_size, error, time.time(), public_name)
+            )
+            return cursor.rowcount == 1
+    
+    def get(self, public_name: str) -> Optional[Dict[str, Any]]:
+        with self._cursor() as cursor:
+            self._execute(
+                cursor,
+                f"SELECT {', '.join(PROCESSED_FILE_COLUMNS)} FROM processed_files WHERE public_name = ?",
+                (public_name,)
+            )
+            return self._row(cursor.fetchone())
+    
+    def find_by_hash(self, username: str, source_sha256: str, profile: str) -> Optional[Dict[str, Any]]:
+        """Saída pronta mais recente do usuário para o mesmo original e perfil"""
+        with self._cursor() as cursor:
+            self._execute(
+                cursor,
+                f"SELECT {', '.join(PROCESSED_FILE_COLUMNS)} FROM processed_files "
+                "WHERE username = ? AND source_sha256 = ? AND profile = ? AND status = 'done' "
+                "ORDER BY created_at DESC LIMIT 1",
+                (username, source_sha256, profile)
+            )
+            return self._row(cursor.fetchone())
+    
+    def list_for_user(self, username: str, before: Optional[Tuple[float, str]] = None,
+                      limit: int = FILES_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """Até `limit` arquivos do usuário, do mais recente para o mais antigo"""
+        where = "username = ?"
+        params: List[Any] = [username]
+        if before:
+            where += " AND (created_at < ? OR (created_at = ? AND public_name < ?))"
+            params.extend([before[0], before[0], before[1]])
+        params.append(limit)
+        with self._cursor() as cursor:
+            self._execute(
+                cursor,
+                f"SELECT {', '.join(PROCESSED_FILE_COLUMNS)} FROM processed_files WHERE {where} "
+                "ORDER BY created_at DESC, public_name DESC LIMIT ?",
+                tuple(params)
+            )
+            return [self._row(row) for row in cursor.fetchall()]
+
+class SQLiteProcessedFiles(SharedSQLiteStore, ProcessedFiles):
+    """Tabela local, usada sem MySQL ou enquanto ele estiver fora"""
+    
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS processed_files ("
+        "public_name TEXT PRIMARY KEY, storage_key TEXT NOT NULL, username TEXT NOT NULL, "
+        "status TEXT NOT NULL, is_video INTEGER NOT NULL, source_size INTEGER NOT NULL, "
+        "output_size INTEGER, created_at REAL NOT NULL, started_at REAL, finished_at REAL, error TEXT, "
+        "source_sha256 TEXT, profile TEXT)",
+        "CREATE INDEX IF NOT EXISTS idx_files_user_created ON processed_files (username, created_at)",
+    ]
+    
+    # Colunas adicionadas depois da criação da tabela
+    ADDED_COLUMNS = [('source_sha256', 'TEXT'), ('profile', 'TEXT')]
+    
+    def _pending_migrations(self, conn: sqlite3.Connection) -> Tuple[bool, List[Tuple[str, str]], bool]:
+        legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'files'").fetchone()
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(processed_files)")}
+        hash_index = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_files_user_hash'"
+        ).fetchone()
+        return legacy is not None, [c for c in self.ADDED_COLUMNS if c[0] not in existing], hash_index is None
+    
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """Colunas novas, índice por hash e o índice anterior (tabela files, só nome -> chave),
+        aplicados uma vez só"""
+        legacy, columns, hash_index = self._pending_migrations(conn)
+        if not (legacy or columns or hash_index):
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Outro processo pode ter migrado enquanto esperávamos o lock
+            legacy, columns, hash_index = self._pending_migrations(conn)
+            for name, kind in columns:
+                conn.execute(f"ALTER TABLE processed_files ADD COLUMN {name} {kind}")
+            if hash_index:
+                conn.execute("CREATE INDEX idx_files_user_hash ON processed_files (username, source_sha256)")
+            if legacy:
+                conn.execute(
+                    "INSERT OR IGNORE INTO processed_files (public_name, storage_key, username, status, is_video, "
+                    "source_size, created_at) SELECT public_name, storage_key, username, 'done', "
+                    "storage_key LIKE '%.mov', 0, created_at FROM files"
+                )
+                conn.execute("DROP TABLE files")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    @contextmanager
+    def _cursor(self) -> Iterator[Any]:
+        with self.transaction() as conn:
+            yield conn.cursor()
+
+class MySQLProcessedFiles(ProcessedFiles):
+    """Tabela compartilhada entre hosts (criada por migrate_mysql)"""
+    
+    def _execute(self, cursor: Any, sql: str, params: tuple) -> None:
+        cursor.execute(sql.replace('?', '%s'), params)
+    
+    @contextmanager
+    def _cursor(self) -> Iterator[Any]:
+        with MYSQL_POOL.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+class FileHistory:
+    """MySQL como primário e SQLite local como fallback. Depois de uma falha o MySQL fica
+    de fora por FILES_MYSQL_RETRY_SECONDS, para um banco inacessível não travar cada request;
+    leituras consultam os dois, já que linhas gravadas durante a queda ficam no SQLite."""
+    
+    def __init__(self, primary: Optional[ProcessedFiles], fallback: ProcessedFiles):
+        self.primary = primary
+        self.fallback = fallback
+        self._skip_primary_until = 0.0
+    
+    def _stores(self) -> List[ProcessedFiles]:
+        if self.primary is not None and time.time() >= self._skip_primary_until:
+            return [self.primary, self.fallback]
+        return [self.fallback]
+    
+    def _call(self, store: ProcessedFiles, method: str, *args: Any) -> Any:
+        """Executa no store; None (e MySQL suspenso) se o primário falhar"""
+        if store is self.fallback:
+            return getattr(store, method)(*args)
+        try:
+            return getattr(store, method)(*args)
+        except Exception as e:
+            print(f"processed_files on MySQL failed ({e}), using local fallback")
+            self._skip_primary_until = time.time() + FILES_MYSQL_RETRY_SECONDS
+            return None
+    
+    def _write(self, method: str, *args: Any) -> None:
+        for store in self._stores():
+            if self._call(store, method, *args):
+                return
+    
+    def register(self, public_name: str, storage_key: str, username: str, is_video: bool, source_size: int,
+                 source_sha256: Optional[str] = None, profile: Optional[str] = None) -> None:
+        self._write('register', public_name, storage_key, username, is_video, source_size, source_sha256, profile)
+    
+    def mark_started(self, public_name: str) -> None:
+        self._write('mark_started', public_name)
+    
+    def mark_finished(self, public_name: str, status: str, output_size: Optional[int] = None,
+                      error: Optional[str] = None) -> None:
+        self._write('mark_finished', public_name, status, output_size, error)
+    
+    def get(self, public_name: str) -> Optional[Dict[str, Any]]:
+        for store in self._stores():
+            record = self._call(store, 'get', public_name)
+            if record is not None:
+                return record
+        return None
+    
+    def find_by_hash(self, username: str, source_sha256: str, profile: str) -> Optional[Dict[str, Any]]:
+        for store in self._stores():
+            record = self._call(store, 'find_by_hash', username, source_sha256, profile)
+            if record is not None:
+                return record
+        return None
+    
+    def resolve(self, public_name: str) -> Optional[str]:
+        record = self.get(public_name)
+        if record is not None:
+            return record['storage_key']
+        # Arquivos do layout plano antigo continuam acessíveis pelo próprio nome
+        return public_name if '/' not in public_name else None
+    
+    def list_for_user(self, username: str, before: Optional[Tuple[float, str]] = None,
+                      limit: int = FILES_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[Tuple[float, str]]]:
+        """Página do histórico e o cursor da próxima (None na última)"""
+        rows: List[Dict[str, Any]] = []
+        for store in self._stores():
+            rows.extend(self._call(store, 'list_for_user', username, before, limit + 1) or [])
+        rows.sort(key=lambda r: (r['created_at'], r['public_name']), reverse=True)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1]['created_at'], rows[-1]['public_name'])
+        return rows, next_cursor
+
+def find_known_output(username: str, source_sha256: str) -> Optional[Dict[str, Any]]:
+    """Saída já pronta do usuário para o mesmo original (e perfil atual), se ainda existir"""
+    record = FILE_HISTORY.find_by_hash(username, source_sha256, PROCESSING_PROFILE)
+    if record is None or not STORAGE.exists(record['storage_key']):
+        return None
+    return record
+
+# Layout plano antigo: {usuário}_{AAAAmmddHHMMSS}_{nome original}
+LEGACY_NAME_PATTERN = re.compile(r'^(.+)_\d{14}_')
+
+def is_file_owner(public_name: str, record: Optional[Dict[str, Any]]) -> bool:
+    """Dono do arquivo ou admin; arquivos antigos sem registro no índice trazem o
+    usuário no prefixo do nome"""
+    if session.get('is_admin'):
+        return True
+    username = secure_filename(session.get('username', ''))
+    if record is not None:
+        return record['username'] == username
+    legacy = LEGACY_NAME_PATTERN.match(public_name)
+    return legacy is not None and legacy.group(1) == username
+
+def encode_files_cursor(cursor: Optional[Tuple[float, str]]) -> Optional[str]:
+    if not cursor:
+        return None
+    return f"{cursor[0]:.6f}-{cursor[1]}"
+
+def decode_files_cursor(value: Optional[str]) -> Optional[Tuple[float, str]]:
+    """Inverso de encode_files_cursor; valores inválidos voltam para a primeira página"""
+    if not value:
+        return None
     try:
-        conn = pymysql.connect(**DB_CONFIG)
+        stamp, public_name = value.split('-', 1)
+        return float(stamp), public_name
+    except ValueError:
+        return None
+
+_files_backend = os.environ.get('FILES_BACKEND', 'mysql' if MYSQL_AVAILABLE else 'sqlite').lower()
+FILE_HISTORY = FileHistory(
+    MySQLProcessedFiles() if _files_backend == 'mysql' and MYSQL_AVAILABLE else None,
+    SQLiteProcessedFiles(Path(os.environ.get('FILES_DB', str(PROCESSED_DIR / '.index.sqlite3'))))
+)
+
+# Camada de workers: com PROCESSING_MODE=queue o upload só registra o job e a página de
+# status acompanha; `flask --app app worker` processa em outro processo ou máquina
+PROCESSING_MODE = os.environ.get('PROCESSING_MODE', 'inline').lower()
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_DEADLINE = float(os.environ.get('JOB_DEADLINE', 600))
+WORKER_POLL_SECONDS = float(os.environ.get('WORKER_POLL_SECONDS', 1.0))
+JOB_COLUMNS = ['id', 'username', 'upload_name', 'processed_name', 'processed_key', 'is_video', 'size',
+               'status', 'attempts', 'messages', 'error']
+
+class JobQueue(ABC):
+    """Fila durável de processamento com lease: o worker renova o lease com heartbeats e,
+    se morrer, o job volta a ser elegível quando o lease expira (até JOB_MAX_ATTEMPTS).
+    A reivindicação alterna entre usuários (round-robin), como a FairScheduler do modo inline.
+    SQL escrito com '?'; subclasses fornecem a transação e o lock da reivindicação."""
+    
+    CLAIM_LOCK = ""
+    
+    def _execute(self, cursor: Any, sql: str, params: tuple) -> None:
+        cursor.execute(sql, params)
+    
+    @abstractmethod
+    def _cursor(self) -> ContextManager[Any]:
+        """Cursor dentro de uma transação (commit ao sair sem erro)"""
+    
+    def _row(self, row: Optional[tuple]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        job['is_video'] = bool(job['is_video'])
+        job['messages'] = json.loads(job['messages'] or '[]')
+        return job
+    
+    def enqueue(self, username: str, upload_name: str, processed_name: str, processed_key: str,
+                is_video: bool, size: int) -> int:
+        now = time.time()
+        with self._cursor() as cursor:
+            self._execute(
+                cursor,
+                "INSERT INTO processing_jobs (username, upload_name, processed_name, processed_key, is_video, size, "
+                "status, attempts, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, 'queued', 0, ?, ?)",
+                (username, upload_name, processed_name, processed_key, int(is_video), size, now, now)
+            )
+            return cursor.lastrowid
+    
+    def _expire(self, cursor: Any, now: float) -> None:
+        """Falha os jobs que esgotaram as tentativas, junto com a linha do histórico. As
+        tabelas podem estar em bancos diferentes: o histórico é gravado antes do commit da
+        fila, então uma falha no meio refaz as duas na próxima varredura"""
+        self._execute(
+            cursor,
+            f"SELECT id, processed_name FROM processing_jobs "
+            f"WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?{self.CLAIM_LOCK}",
+            (now, JOB_MAX_ATTEMPTS)
+        )
+        for job_id, processed_name in cursor.fetchall():
+            self._execute(
+                cursor,
+                "UPDATE processing_jobs SET status = 'failed', error = 'lease expired too many times', "
+                "lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                (now, job_id)
+            )
+            FILE_HISTORY.mark_finished(processed_name, 'failed', error='lease expired too many times')
+    
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Reivindica um job elegível (novo ou com lease expirado): primeiro o do usuário
+        com menos jobs em execução ou à frente na fila, depois o do usuário atendido há
+        mais tempo (último job reivindicado ou terminado), depois o mais antigo"""
+        now = time.time()
+        with self._cursor() as cursor:
+            self._expire(cursor, now)
+            self._execute(
+                cursor,
+                f"SELECT {', '.join('j.' + column for column in JOB_COLUMNS)} FROM processing_jobs j "
+                "WHERE j.status = 'queued' OR (j.status = 'running' AND j.lease_expires_at < ?) "
+                "ORDER BY (SELECT COUNT(*) FROM processing_jobs p WHERE p.username = j.username AND p.id <> j.id "
+                "AND ((p.status = 'running' AND p.lease_expires_at >= ?) OR "
+                "((p.status = 'queued' OR (p.status = 'running' AND p.lease_expires_at < ?)) AND p.id < j.id))), "
+                "(SELECT COALESCE(MAX(p.updated_at), 0) FROM processing_jobs p "
+                "WHERE p.username = j.username AND p.status <> 'queued'), "
+                f"j.id LIMIT 1{self.CLAIM_LOCK}",
+                (now, now, now)
+            )
+            job = self._row(cursor.fetchone())
+            if job is None:
+                return None
+            self._execute(
+                cursor,
+                "UPDATE processing_jobs SET status = 'running', worker_id = ?, attempts = attempts + 1, "
+                "lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + JOB_LEASE_SECONDS, now, job['id'])
+            )
+            job['attempts'] += 1
+            return job
+    
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Renova o lease; False se outro worker assumiu o job"""
+        now = time.time()
+        with self._cursor() as cursor:
+            self._execute(
+                cursor,
+                "UPDATE processing_jobs SET lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + JOB_LEASE_SECONDS, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+    
+    def finish(self, job_id: int, worker_id: str, status: str, messages: List[str], error: Optional[str] = None) -> None:
+        with self._cursor() as cursor:
+            self._execute(
+                cursor,
+                "UPDATE processing_jobs SET status = ?, messages = ?, error = ?, lease_expires_at = NULL, "
+                "updated_at = ? WHERE id = ? AND worker_id = ?",
+                (status, json.dumps(messages), error, time.time(), job_id, worker_id)
+            )
+    
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._cursor() as cursor:
+            self._execute(cursor, f"SELECT {', '.join(JOB_COLUMNS)} FROM processing_jobs WHERE id = ?", (job_id,))
+            return self._row(cursor.fetchone())
+
+class SQLiteJobQueue(SharedSQLiteStore, JobQueue):
+    """Fila local (um host): BEGIN IMMEDIATE serializa as reivindicações"""
+    
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS processing_jobs ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, upload_name TEXT NOT NULL, "
+        "processed_name TEXT NOT NULL, processed_key TEXT, is_video INTEGER NOT NULL, size INTEGER NOT NULL, "
+        "status TEXT NOT NULL, attempts INTEGER NOT NULL, worker_id TEXT, lease_expires_at REAL, "
+        "messages TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON processing_jobs (status, id)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_user_status ON processing_jobs (username, status, id)",
+    ]
+    
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """Coluna processed_key nas filas criadas antes dela, uma vez só"""
+        def missing() -> bool:
+            return 'processed_key' not in {row[1] for row in conn.execute("PRAGMA table_info(processing_jobs)")}
+        if not missing():
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if missing():
+                conn.execute("ALTER TABLE processing_jobs ADD COLUMN processed_key TEXT")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    @contextmanager
+    def _cursor(self) -> Iterator[Any]:
+        with self.transaction() as conn:
+            yield conn.cursor()
+
+class MySQLJobQueue(JobQueue):
+    """Fila compartilhada entre hosts: FOR UPDATE SKIP LOCKED deixa cada worker pegar
+    um job diferente sem esperar pelos locks dos outros (MySQL 8+)"""
+    
+    CLAIM_LOCK = " FOR UPDATE SKIP LOCKED"
+    
+    def _execute(self, cursor: Any, sql: str, params: tuple) -> None:
+        cursor.execute(sql.replace('?', '%s'), params)
+    
+    @contextmanager
+    def _cursor(self) -> Iterator[Any]:
+        with MYSQL_POOL.connection() as conn:
+            conn.begin()
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+if os.environ.get('JOB_QUEUE_BACKEND', 'sqlite').lower() == 'mysql' and MYSQL_AVAILABLE:
+    JOB_QUEUE: JobQueue = MySQLJobQueue()
+else:
+    JOB_QUEUE = SQLiteJobQueue(Path(os.environ.get('JOB_QUEUE_DB', str(PROCESSED_DIR / '.jobs.sqlite3'))))
+
+# Resumo do banco em cache para que o polling nunca varra a tabela users
+MYSQL_STATUS_TTL = int(os.environ.get('MYSQL_STATUS_TTL', 30))
+_mysql_status_cache: Dict[str, Any] = {'expires_at': 0.0, 'summary': None}
+
+def collect_mysql_summary() -> Dict[str, Any]:
+    """Versão e contagens de linhas (estimativa do information_schema, sem COUNT(*))"""
+    with MYSQL_POOL.connection() as conn:
         cursor = conn.cursor()
         
-        # Check connection
         cursor.execute("SELECT VERSION()")
         version = cursor.fetchone()
         
-        # Check tables
-        cursor.execute("SHOW TABLES")
-        tables = [t[0] for t in cursor.fetchall()]
-        
-        # Check users if users table exists
-        users = []
-        if 'users' in tables:
-            cursor.execute("SELECT username, is_admin FROM users")
-            users = [{'username': u[0], 'is_admin': bool(u[1])} for u in cursor.fetchall()]
+        cursor.execute(
+            "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()"
+        )
+        row_counts = {name: int(rows or 0) for name, rows in cursor.fetchall()}
         
         cursor.close()
-        conn.close()
-        
-        return {
-            'status': 'ok',
-            'mysql_version': version[0] if version else 'unknown',
-            'connected': True,
-            'tables': tables,
-            'users': users
-        }
-    except Exception as e:
-        return {'status': 'error', 'message': str(e)}
+    
+    return {
+        'mysql_version': version[0] if version else 'unknown',
+        'row_counts': row_counts,
+        'row_counts_estimated': True,
+    }
+
+@app.route('/mysql-status')
+def mysql_status():
+    """Aggregated MySQL status, cached for MYSQL_STATUS_TTL seconds"""
+    if not MYSQL_AVAILABLE:
+        return {'status': 'error', 'message': 'MySQL module not available'}
+    
+    now = time.time()
+    cached = _mysql_status_cache['summary']
+    if cached is None or now >= _mysql_status_cache['expires_at']:
+        try:
+            cached = collect_mysql_summary()
+            cached['collected_at'] = datetime.fromtimestamp(now).isoformat(timespec='seconds')
+            _mysql_status_cache['summary'] = cached
+            _mysql_status_cache['expires_at'] = now + MYSQL_STATUS_TTL
+        except Exception as e:
+            return {'status': 'error', 'message': str(e), 'pool': MYSQL_POOL.snapshot()}
+    
+    return {
+        'status': 'ok',
+        'connected': True,
+        **cached,
+        'cache_ttl': MYSQL_STATUS_TTL,
+        'pool': MYSQL_POOL.snapshot(),
+        'query_latency_ms': MYSQL_POOL.latency_percentiles(),
+    }
 
 @app.route('/health')
 def health_check():
     try:
         # Check if exiftool is available
-        result = subprocess.run(['exiftool', '-ver'], capture_output=True, text=True)
+        result = run_tool(['exiftool', '-ver'], timeout=5)
         exiftool_ok = result.returncode == 0
         exiftool_version = result.stdout.strip() if exiftool_ok else "Not available"
         
         # Check if ffmpeg is available
         try:
-            ffmpeg_result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+            ffmpeg_result = run_tool(['ffmpeg', '-version'], timeout=5)
             ffmpeg_ok = ffmpeg_result.returncode == 0
             ffmpeg_version = ffmpeg_result.stdout.split('\n')[0] if ffmpeg_ok else "Not available"
         except Exception as e:
@@ -1011,7 +3504,8 @@ def health_check():
         mysql_status = False
         if MYSQL_AVAILABLE:
             try:
-                mysql_status = init_mysql()
+                with MYSQL_POOL.connection():
+                    mysql_status = True
             except:
                 pass
         
@@ -1033,11 +3527,96 @@ def health_check():
             'mysql_connected': mysql_status,
             'upload_dir': upload_ok,
             'processed_dir': processed_ok,
+            'processing': PROCESSING_SCHEDULER.load(),
             'exiftool_version': result.stdout.strip() if exiftool_ok else 'not found'
         }
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
+def process_media(upload_path: Path, processed_path: Path, is_video: bool, probe: Optional[MediaProbe] = None) -> List[str]:
+    """Aplica os metadados da trend e verifica o resultado.
+    Retorna avisos para o usuário; o chamador confere se processed_path existe."""
+    messages: List[str] = []
+    
+    # Apply metadata with improved function (includes copying the file)
+    write_proc = None
+    try:
+        media_type = "vídeo" if is_video else "imagem"
+        print(f"Applying trend metadata to {upload_path} (type: {media_type})")
+        with memory_stage('metadata'):
+            write_proc = run_exiftool_write(upload_path, processed_path, TREND_META, is_video=is_video, probe=probe)
+        
+        if write_proc.returncode != 0:
+            print(f"ExifTool warning: {write_proc.stderr}")
+            messages.append(f'Metadados aplicados parcialmente ao {media_type}')
+        else:
+            print(f"Metadata applied successfully to {media_type}")
+    except Exception as e:
+        print(f"ExifTool error: {e}")
+        import traceback
+        traceback.print_exc()
+        messages.append(f'Erro ao aplicar metadados ao {media_type}, mas o arquivo foi processado')
+    
+    # Verify the processed file exists
+    if not processed_path.exists():
+        return messages
+        
+    # Verify metadata was applied and fix if needed
+    try:
+        # First verification
+        if not is_video and write_proc is not None and write_proc.stdout.strip():
+            # Imagens: reaproveita a releitura feita na mesma execução do exiftool
+            lookup = parse_exiftool_json(write_proc.stdout).get
+        else:
+            # Vídeos: leitura nativa do moov (exiftool só para containers não suportados)
+            lookup = quick_probe(processed_path).tag
+        
+        # Check if critical metadata is missing
+        if is_video:
+            metadata_ok = (
+                lookup("Make") == "Meta View" and
+                lookup("Model") == "Ray-Ban Meta Smart Glasses"
+            )
+        else:
+            metadata_ok = (
+                lookup("Make") == "Meta View" and
+                lookup("Model") == "Ray-Ban Meta Smart Glasses" and
+                lookup("GPSLatitude") is not None
+            )
+        print(f"Metadata verification: {'ok' if metadata_ok else 'missing critical tags'}")
+        
+        # If metadata is missing for videos, try again with our specialized function
+        if not metadata_ok and is_video:
+            print("Video metadata missing, applying specialized video metadata...")
+            with memory_stage('video-metadata'):
+                apply_video_metadata(processed_path, TREND_META, probe=quick_probe(processed_path))
+            print("Video metadata application completed")
+            
+            # Verificar novamente os metadados após a aplicação especializada
+            print("\nFinal metadata verification after specialized application:")
+            verify_metadata(processed_path)
+        # If metadata is missing for images, try a more direct approach
+        elif not metadata_ok:
+            print("Critical metadata missing, trying direct approach...")
+            # Direct approach for stubborn files
+            direct_args = [
+                "-Make=Meta View",
+                "-Model=Ray-Ban Meta Smart Glasses",
+                "-GPSLatitude=22 deg 58' 46.24\" S",
+                "-GPSLongitude=43 deg 24' 42.09\" W",
+                "-GPSLatitudeRef=South",
+                "-GPSLongitudeRef=West",
+                "-user_comment=34D16852-7110-470A-8B25-D48E3A791E26",
+                "-checksum=89c4e3c64b0175c4de454f5f34504434"
+            ]
+            with memory_stage('direct-metadata'):
+                run_exiftool_rewrite(processed_path, direct_args)
+            print("Direct metadata application completed")
+    except Exception as e:
+        print(f"Metadata verification error: {e}")
+    
+    return messages
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     """Página de cadastro gratuito"""
@@ -1220,8 +3799,11 @@ def admin():
 		return redirect(url_for('admin'))
 	
 	# Get users from MySQL if available, otherwise show hardcoded
+	search = request.args.get('q', '').strip()[:100]
+	next_cursor = None
 	if MYSQL_AVAILABLE:
-		users_list = get_all_mysql_users()
+		before = decode_user_cursor(request.args.get('before'))
+		users_list, next_cursor = get_mysql_users_page(search=search, before=before)
 		mysql_status = "Conectado"
 	else:
 		users_list = []
@@ -1234,22 +3816,114 @@ def admin():
 			})
 		mysql_status = "Não disponível"
 	
-	return render_template('admin.html', users=users_list, mysql_status=mysql_status)
+	return render_template(
+		'admin.html',
+		users=users_list,
+		mysql_status=mysql_status,
+		search=search,
+		next_cursor=encode_user_cursor(next_cursor),
+		is_first_page=not request.args.get('before'),
+		profiles=list_profiles()
+	)
+
+@app.route('/admin/memory')
+@admin_required
+def admin_memory():
+    """Memória deste worker e snapshots do tracemalloc sob demanda:
+    ?tracemalloc=start|stop, ?snapshot=1 (top alocações e diferença para o snapshot anterior)"""
+    import tracemalloc
+    
+    action = request.args.get('tracemalloc')
+    if action == 'start' and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracemalloc_baseline['snapshot'] = None
+    elif action == 'stop' and tracemalloc.is_tracing():
+        tracemalloc.stop()
+        _tracemalloc_baseline['snapshot'] = None
+    
+    memory = read_memory()
+    result: Dict[str, Any] = {
+        'pid': os.getpid(),
+        'rss_mb': round(memory['rss'] / (1024 * 1024), 1),
+        'peak_mb': round(memory['peak'] / (1024 * 1024), 1),
+        'gc_counts': gc.get_count(),
+        'tracemalloc': tracemalloc.is_tracing(),
+    }
+    if request.args.get('snapshot') and tracemalloc.is_tracing():
+        limit = min(int(request.args.get('limit', 25)), 200)
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        result['traced_mb'] = round(current / (1024 * 1024), 2)
+        result['traced_peak_mb'] = round(peak / (1024 * 1024), 2)
+        result['top'] = [
+            {'where': str(stat.traceback[0]), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:limit]
+        ]
+        previous = _tracemalloc_baseline['snapshot']
+        if previous is not None:
+            # Crescimento desde o snapshot anterior: candidatos a vazamento
+            result['growth'] = [
+                {'where': str(stat.traceback[0]), 'size_diff_kb': round(stat.size_diff / 1024, 1), 'count_diff': stat.count_diff}
+                for stat in snapshot.compare_to(previous, 'lineno')[:limit]
+                if stat.size_diff > 0
+            ]
+        _tracemalloc_baseline['snapshot'] = snapshot
+    return result
+
+@app.route('/admin/profiles/<profile_id>')
+@admin_required
+def admin_profile(profile_id: str):
+    """Flame graph e funções mais custosas de um request perfilado"""
+    profile = load_profile(profile_id)
+    if profile is None:
+        abort(404)
+    return render_template(
+        'profile.html',
+        profile=profile,
+        tree=build_flame_tree(profile['stacks']),
+        stats=profile_stats(profile['stacks'])
+    )
 
 @app.route('/', methods=['GET'])
 @login_required
 def index():
-	return render_template('index.html')
+	return render_template(
+		'index.html',
+		client_max_edge=CLIENT_MAX_EDGE,
+		client_jpeg_quality=CLIENT_JPEG_QUALITY,
+		client_recompress_bytes=CLIENT_RECOMPRESS_BYTES
+	)
+
+@app.route('/my-files')
+@login_required
+def my_files():
+    """Histórico do usuário, paginado por keyset (sem varrer processed/)"""
+    username = secure_filename(session.get('username', ''))
+    before = decode_files_cursor(request.args.get('before'))
+    files, next_cursor = FILE_HISTORY.list_for_user(username, before)
+    for record in files:
+        record['created'] = datetime.fromtimestamp(record['created_at'])
+        record['seconds'] = (record['finished_at'] - record['started_at']
+                             if record['finished_at'] and record['started_at'] else None)
+    return render_template('my_files.html', files=files, next_cursor=encode_files_cursor(next_cursor),
+                           is_first_page=before is None)
 
 @app.route('/upload', methods=['POST'])
 @login_required
 def upload():
+    # Orçamento único do request (espera na fila + ferramentas), contado desde a entrada
+    request_deadline = time.monotonic() + TOOL_JOB_DEADLINE
     try:
-        if 'image' not in request.files:
+        # Parsing do multipart (o Flask mantém até 16MB do upload por request)
+        with memory_stage('form'):
+            files = request.files
+        if 'image' not in files:
             flash('Selecione uma imagem')
             return redirect(url_for('index'))
         
-        file = request.files['image']
+        file = files['image']
         if not file or file.filename == '':
             flash('Arquivo inválido')
             return redirect(url_for('index'))
@@ -1308,12 +3982,20 @@ def upload():
             flash('Nome de arquivo inválido')
             return redirect(url_for('index'))
             
-        # Add username and timestamp to prevent filename collisions
+        # Unique ID per upload; files live under hash-sharded directories
         safe_username = secure_filename(session.get('username', 'anonymous'))
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        filename = f"{safe_username}_{timestamp}_{filename}"
+        file_id = new_file_id()
+        upload_key = sharded_key(file_id, Path(filename).suffix.lower())
+        
+        # Daily quota is checked before the upload is written to disk
+        try:
+            PROCESSING_SCHEDULER.check_quota(safe_username, file_size)
+        except ProcessingRejected as e:
+            flash(str(e))
+            return redirect(url_for('index'))
         
-        upload_path = UPLOAD_DIR / filename
+        upload_path = UPLOAD_DIR / upload_key
+        upload_path.parent.mkdir(parents=True, exist_ok=True)
         file.save(str(upload_path))
         
         # Verify file was saved
@@ -1321,111 +4003,83 @@ def upload():
             flash('Erro ao salvar arquivo')
             return redirect(url_for('index'))
 
-        # Prepare output filename
+        # Hash of the file actually received (uploads are capped at 16MB); a hash declared
+        # by the browser can't be checked against it and is never stored
+        with open(upload_path, 'rb') as f:
+            source_sha256 = hashlib.file_digest(f, 'sha256').hexdigest()
+        known = find_known_output(safe_username, source_sha256)
+        if known is not None:
+            upload_path.unlink(missing_ok=True)
+            return redirect(url_for('file_result', filename=known['public_name']))
+        
+        # Prepare output key and the public download name (resolved via FILE_HISTORY)
         if is_video:
             # Para vídeos, sempre usar extensão .mov para compatibilidade com a trend
-            processed_name = f"{upload_path.stem}-trend.mov"
+            processed_suffix = "-trend.mov"
             
-            # Verificar se o vídeo é MOV ou MP4
-            file_type_proc = subprocess.run(
-                ["exiftool", "-s", "-s", "-s", "-FileType", str(upload_path)], 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True
-            )
-            file_type = file_type_proc.stdout.strip()
-            print(f"Original video file type: {file_type}")
         else:
-            processed_name = f"{upload_path.stem}-trend{upload_path.suffix or '.heic'}"
-        processed_path = PROCESSED_DIR / processed_name
+            processed_suffix = f"-trend{upload_path.suffix or '.heic'}"
+        processed_key = sharded_key(file_id, processed_suffix)
+        processed_name = f"{Path(filename).stem}-{file_id.lower()}{processed_suffix}"
+        FILE_HISTORY.register(processed_name, processed_key, safe_username, is_video, file_size,
+                              source_sha256, PROCESSING_PROFILE)
+        processed_path = PROCESSED_DIR / processed_key
+        processed_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Worker tier: persist the job and let the status page follow it
+        if PROCESSING_MODE == 'queue':
+            try:
+                PROCESSING_SCHEDULER.charge(safe_username, file_size)
+            except ProcessingRejected as e:
+                FILE_HISTORY.mark_finished(processed_name, 'failed', error=str(e))
+                upload_path.unlink(missing_ok=True)
+                flash(str(e))
+                return redirect(url_for('index'))
+            SOURCE_STORAGE.publish(upload_path, upload_key)
+            job_id = JOB_QUEUE.enqueue(safe_username, upload_key, processed_name, processed_key, is_video, file_size)
+            return redirect(url_for('job_status', job_id=job_id))
+        
+        # Single inspection of the upload, shared by every processing stage
+        with memory_stage('probe'):
+            source_probe = probe_media(upload_path) if is_video else None
+        if source_probe is not None:
+            print(f"Original video file type: {source_probe.file_type}")
         
-        # Apply metadata with improved function (includes copying the file)
+        # Process inside the per-user fair queue (see FairScheduler), with every
+        # external tool cancelled if the client leaves; queue wait and tools share
+        # the budget that started when the request came in
         try:
-            media_type = "vídeo" if is_video else "imagem"
-            print(f"Applying trend metadata to {upload_path} (type: {media_type})")
-            write_proc = run_exiftool_write(upload_path, processed_path, TREND_META, is_video=is_video)
-            
-            if write_proc.returncode != 0:
-                print(f"ExifTool warning: {write_proc.stderr}")
-                flash(f'Metadados aplicados parcialmente ao {media_type}')
-            else:
-                print(f"Metadata applied successfully to {media_type}")
+            with processing_slot(safe_username, is_video, file_size, request_deadline) as job:
+                watch_client_disconnect(job)
+                FILE_HISTORY.mark_started(processed_name)
+                for message in process_media(upload_path, processed_path, is_video, probe=source_probe):
+                    flash(message)
+        except ProcessingRejected as e:
+            FILE_HISTORY.mark_finished(processed_name, 'failed', error=str(e))
+            flash(str(e))
+            return redirect(url_for('index'))
+        except ToolCancelled:
+            FILE_HISTORY.mark_finished(processed_name, 'failed', error='cancelled')
+            print(f"Processing of {upload_path.name} cancelled: client disconnected")
+            return '', 499
         except Exception as e:
-            print(f"ExifTool error: {e}")
-            import traceback
-            traceback.print_exc()
-            flash(f'Erro ao aplicar metadados ao {media_type}, mas o arquivo foi processado')
+            FILE_HISTORY.mark_finished(processed_name, 'failed', error=str(e))
+            raise
+        if job.cancelled.is_set():
+            FILE_HISTORY.mark_finished(processed_name, 'failed', error='cancelled')
+            print(f"Processing of {upload_path.name} cancelled: client disconnected")
+            return '', 499
         
         # Verify the processed file exists
         if not processed_path.exists():
+            FILE_HISTORY.mark_finished(processed_name, 'failed', error='no output')
             flash('Erro ao processar arquivo')
             return redirect(url_for('index'))
-            
-        # Verify metadata was applied and fix if needed
-        try:
-            # First verification
-            verify_proc = subprocess.run(
-                ["exiftool", "-json", str(processed_path)], 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True
-            )
-            
-            if verify_proc.returncode == 0:
-                print(f"Metadata verification: {verify_proc.stdout[:100]}...")
-                
-                # Check if critical metadata is missing
-                metadata_ok = False
-                try:
-                    import json
-                    metadata = json.loads(verify_proc.stdout)
-                    if metadata and isinstance(metadata, list) and len(metadata) > 0:
-                        metadata = metadata[0]
-                        # Check for critical metadata
-                        if is_video:
-                            metadata_ok = (
-                                metadata.get("Make") == "Meta View" and
-                                metadata.get("Model") == "Ray-Ban Meta Smart Glasses"
-                            )
-                        else:
-                            metadata_ok = (
-                                metadata.get("Make") == "Meta View" and
-                                metadata.get("Model") == "Ray-Ban Meta Smart Glasses" and
-                                metadata.get("GPSLatitude") is not None
-                            )
-                except:
-                    metadata_ok = False
-                
-                # If metadata is missing for videos, try again with our specialized function
-                if not metadata_ok and is_video:
-                    print("Video metadata missing, applying specialized video metadata...")
-                    apply_video_metadata(processed_path, TREND_META)
-                    print("Video metadata application completed")
-                    
-                    # Verificar novamente os metadados após a aplicação especializada
-                    print("\nFinal metadata verification after specialized application:")
-                    verify_metadata(processed_path)
-                # If metadata is missing for images, try a more direct approach
-                elif not metadata_ok:
-                    print("Critical metadata missing, trying direct approach...")
-                    # Direct approach for stubborn files
-                    direct_args = [
-                        "exiftool", "-overwrite_original",
-                        "-Make=Meta View",
-                        "-Model=Ray-Ban Meta Smart Glasses",
-                        "-GPSLatitude=22 deg 58' 46.24\" S",
-                        "-GPSLongitude=43 deg 24' 42.09\" W",
-                        "-GPSLatitudeRef=South",
-                        "-GPSLongitudeRef=West",
-                        "-user_comment=34D16852-7110-470A-8B25-D48E3A791E26",
-                        "-checksum=89c4e3c64b0175c4de454f5f34504434"
-                    ]
-                        
-                    direct_args.append(str(processed_path))
-                    subprocess.run(direct_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    print("Direct metadata application completed")
-        except Exception as e:
-            print(f"Metadata verification error: {e}")
+        
+        # Hand the output to the storage backend (no-op for local disk)
+        output_size = processed_path.stat().st_size
+        STORAGE.publish(processed_path, processed_key)
+        FILE_HISTORY.mark_finished(processed_name, 'done', output_size)
 
         return render_template('result.html', processed_filename=processed_name)
         
@@ -1445,18 +4099,103 @@ def download(filename: str):
         flash('Nome de arquivo inválido')
         return redirect(url_for('index'))
         
-    # Check if file exists
-    file_path = PROCESSED_DIR / filename
-    if not file_path.exists() or not file_path.is_file():
+    # Only the owner (or an admin) may download
+    if not is_file_owner(filename, FILE_HISTORY.get(filename)):
+        flash('Arquivo não encontrado')
+        return redirect(url_for('index'))
+    
+    # Resolve the public name through the index and check the file exists
+    storage_key = FILE_HISTORY.resolve(filename)
+    if storage_key is None or not STORAGE.exists(storage_key):
         flash('Arquivo não encontrado')
         return redirect(url_for('index'))
         
-    # Set secure headers
-    response = send_from_directory(str(PROCESSED_DIR), filename, as_attachment=True)
+    # Set secure headers (body streamed from the storage backend)
+    response = STORAGE.download_response(storage_key, filename)
     response.headers['Content-Security-Policy'] = "default-src 'self'"
     response.headers['X-Content-Type-Options'] = 'nosniff'
     return response
 
+@app.route('/upload/check', methods=['POST'])
+@login_required
+def upload_check():
+    """Handshake antes do upload: se o mesmo original já foi processado com o perfil
+    atual, devolve a página do resultado e o navegador não envia nenhum byte"""
+    data = request.get_json(silent=True) or {}
+    source_sha256 = str(data.get('sha256', '')).lower()
+    if not SHA256_PATTERN.match(source_sha256):
+        return {'error': 'invalid sha256'}, 400
+    known = find_known_output(secure_filename(session.get('username', '')), source_sha256)
+    if known is None:
+        return {'match': False}
+    return {'match': True, 'url': url_for('file_result', filename=known['public_name'])}
+
+@app.route('/files/<path:filename>')
+@login_required
+def file_result(filename: str):
+    """Página de resultado de um arquivo já processado"""
+    filename = secure_filename(filename)
+    record = FILE_HISTORY.get(filename) if filename else None
+    if record is None or not is_file_owner(filename, record) or record['status'] != 'done':
+        flash('Arquivo não encontrado')
+        return redirect(url_for('index'))
+    return render_template('result.html', processed_filename=filename)
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id: int):
+    """Status of a queued job; the pending page refreshes itself until it finishes"""
+    job = JOB_QUEUE.get(job_id)
+    if job is None or (job['username'] != secure_filename(session.get('username', '')) and not session.get('is_admin')):
+        abort(404)
+    
+    if job['status'] == 'failed':
+        print(f"Job {job_id} failed: {job['error']}")
+        flash('Erro ao processar arquivo')
+        return redirect(url_for('index'))
+    if job['status'] != 'done':
+        return render_template('result.html', processed_filename=job['processed_name'], pending=True)
+    
+    for message in job['messages']:
+        flash(message)
+    return render_template('result.html', processed_filename=job['processed_name'])
+
+@app.route('/preview/<kind>/<path:filename>')
+@login_required
+def preview(kind: str, filename: str):
+    filename = secure_filename(filename)
+    if kind not in PREVIEW_KINDS or not filename:
+        abort(404)
+    
+    # Mesma checagem de dono de download() e file_result()
+    record = FILE_HISTORY.get(filename)
+    if not is_file_owner(filename, record):
+        abort(404)
+    storage_key = record['storage_key'] if record is not None else FILE_HISTORY.resolve(filename)
+    file_path = STORAGE.local_path(storage_key) if storage_key else None
+    if file_path is None:
+        abort(404)
+    
+    is_video = file_path.suffix.lstrip('.').lower() in VIDEO_EXTENSIONS
+    if (kind == 'thumb') == is_video:
+        abort(404)
+    
+    try:
+        preview_path = get_preview(file_path, kind, secure_filename(session.get('username', '')),
+                                   time.monotonic() + TOOL_JOB_DEADLINE)
+    except ProcessingRejected as e:
+        response = app.response_class(str(e), status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = '5'
+        return response
+    if preview_path is None:
+        abort(404)
+    
+    # O nome do preview muda junto com o original, então pode ficar em cache indefinidamente
+    response = send_file(str(preview_path), mimetype=PREVIEW_KINDS[kind][1], conditional=True, max_age=PREVIEW_CACHE_SECONDS)
+    response.headers['Cache-Control'] = f'private, max-age={PREVIEW_CACHE_SECONDS}, immutable'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
 @app.errorhandler(500)
 def internal_error(error):
     print(f"500 error: {error}")
@@ -1468,5 +4207,83 @@ def too_large(error):
     flash('Arquivo muito grande. Máximo 16MB.')
     return redirect(url_for('index'))
 
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply the MySQL schema and seed users (run once per deploy, before gunicorn)"""
+    if not MYSQL_AVAILABLE:
+        print("MySQL not available, nothing to migrate")
+        return
+    ok = migrate_mysql()
+    # O processo do CLI não deve deixar conexões abertas para trás
+    MYSQL_POOL.reset()
+    if not ok:
+        raise SystemExit(1)
+
+def run_job(job: Dict[str, Any], worker_id: str) -> None:
+    """Executa um job reivindicado, renovando o lease até terminar"""
+    upload_path = SOURCE_STORAGE.local_path(job['upload_name'])
+    if upload_path is None:
+        JOB_QUEUE.finish(job['id'], worker_id, 'failed', [], 'upload not found')
+        FILE_HISTORY.mark_finished(job['processed_name'], 'failed', error='upload not found')
+        return
+    # Jobs enfileirados antes da coluna processed_key caem no índice de arquivos
+    processed_key = job['processed_key'] or FILE_HISTORY.resolve(job['processed_name'])
+    processed_path = PROCESSED_DIR / processed_key
+    processed_path.parent.mkdir(parents=True, exist_ok=True)
+    FILE_HISTORY.mark_started(job['processed_name'])
+    
+    with tool_job(JOB_DEADLINE) as tool:
+        def heartbeat() -> None:
+            while not tool.finished.wait(JOB_LEASE_SECONDS / 3):
+                if not JOB_QUEUE.heartbeat(job['id'], worker_id):
+                    print(f"Lost lease on job {job['id']}, cancelling")
+                    tool.cancel()
+                    return
+        threading.Thread(target=heartbeat, daemon=True).start()
+        
+        try:
+            probe = probe_media(upload_path) if job['is_video'] else None
+            messages = process_media(upload_path, processed_path, job['is_video'], probe=probe)
+        except ToolCancelled:
+            return
+        except Exception as e:
+            print(f"Job {job['id']} failed: {e}")
+            JOB_QUEUE.finish(job['id'], worker_id, 'failed', [], str(e))
+            FILE_HISTORY.mark_finished(job['processed_name'], 'failed', error=str(e))
+            return
+
+    # process_media engole exceções; lease perdido = outro worker assume o job
+    if tool.cancelled.is_set():
+        print(f"Job {job['id']} abandoned: lease lost")
+        return
+    if not processed_path.exists():
+        JOB_QUEUE.finish(job['id'], worker_id, 'failed', messages, 'no output')
+        FILE_HISTORY.mark_finished(job['processed_name'], 'failed', error='no output')
+        return
+    output_size = processed_path.stat().st_size
+    STORAGE.publish(processed_path, processed_key)
+    JOB_QUEUE.finish(job['id'], worker_id, 'done', messages)
+    FILE_HISTORY.mark_finished(job['processed_name'], 'done', output_size)
+    print(f"Job {job['id']} done: {job['processed_name']}")
+
+@app.cli.command('worker')
+def worker_command():
+    """Process queued jobs until SIGTERM/SIGINT (encode tier for PROCESSING_MODE=queue)"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        # Termina o job atual antes de sair; o lease cobre quedas bruscas
+        signal.signal(signum, lambda *_: stopping.set())
+    
+    print(f"Worker {worker_id} started ({type(JOB_QUEUE).__name__})")
+    while not stopping.is_set():
+        job = JOB_QUEUE.claim(worker_id)
+        if job is None:
+            stopping.wait(WORKER_POLL_SECONDS)
+            continue
+        print(f"Claimed job {job['id']} (attempt {job['attempts']}): {job['upload_name']}")
+        run_job(job, worker_id)
+    print(f"Worker {worker_id} stopped")
+
 if __name__ == '__main__':
 	app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5173)), debug=True)
\ No newline at end of file
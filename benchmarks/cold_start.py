@@ -0,0 +1,67 @@
+"""Cold-start benchmark: time to import app.py and serve the first request.
+
+Each sample runs in a fresh interpreter, as a freshly forked/booted gunicorn
+worker would. Usage:
+
+    python benchmarks/cold_start.py [--runs 10]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Executed in a child interpreter; prints one JSON line with the timings
+PROBE = r"""
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.get('/login')
+first_response = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': (first_response - imported) * 1000,
+    'total_ms': (first_response - start) * 1000,
+    'status': response.status_code,
+}))
+"""
+
+
+def run_once() -> dict:
+    proc = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        cwd=str(PROJECT_ROOT),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        timeout=120,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip())
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def summarize(values: list) -> str:
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return f"median {statistics.median(ordered):8.1f} ms   p95 {p95:8.1f} ms   max {ordered[-1]:8.1f} ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    print(f"cold start over {args.runs} fresh interpreters")
+    for key in ('import_ms', 'first_request_ms', 'total_ms'):
+        print(f"  {key:<17} {summarize([s[key] for s in samples])}")
+
+
+if __name__ == '__main__':
+    main()
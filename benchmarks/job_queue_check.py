@@ -0,0 +1,103 @@
+"""Job queue check (PROCESSING_MODE=queue) on the SQLite backends in a temporary directory.
+
+Covers per-user round-robin claims, the stored processed_key, the lease-expiry
+sweep failing the matching file-history row, the processed_key migration of an
+older queue, and the daily quota charged for queued uploads. Usage:
+
+    python benchmarks/job_queue_check.py
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+work_dir = Path(tempfile.mkdtemp(prefix='trend-queue-'))
+os.environ['FILES_BACKEND'] = 'sqlite'
+os.environ['FILES_DB'] = str(work_dir / 'index.sqlite3')
+os.environ['JOB_QUEUE_BACKEND'] = 'sqlite'
+
+import app  # noqa: E402
+
+
+def check(label: str, ok: bool) -> None:
+    print(f"  {'ok  ' if ok else 'FAIL'} {label}")
+    if not ok:
+        raise SystemExit(1)
+
+
+def enqueue(queue: app.SQLiteJobQueue, username: str, name: str) -> int:
+    app.FILE_HISTORY.register(name, f'ab/cd/{name}', username, False, 100)
+    return queue.enqueue(username, f'up/{name}', name, f'ab/cd/{name}', False, 100)
+
+
+def main() -> None:
+    print("job queue")
+    queue = app.SQLiteJobQueue(work_dir / 'fair.sqlite3')
+    for name in ('a1', 'a2', 'a3'):
+        enqueue(queue, 'alice', name)
+    enqueue(queue, 'bob', 'b1')
+
+    # Workers em paralelo: o segundo pega o job do bob, não o segundo da alice
+    concurrent = [queue.claim(f'w{i}') for i in range(3)]
+    check(f"concurrent claims alternate users {[j['processed_name'] for j in concurrent]}",
+          [j['processed_name'] for j in concurrent] == ['a1', 'b1', 'a2'])
+    check("claim returns the stored processed_key", concurrent[0]['processed_key'] == 'ab/cd/a1')
+    for i, job in enumerate(concurrent):
+        queue.finish(job['id'], f'w{i}', 'done', [])
+
+    # Um worker só: a fila de um usuário não passa na frente da chegada do outro
+    queue = app.SQLiteJobQueue(work_dir / 'serial.sqlite3')
+    for name in ('s-a1', 's-a2', 's-a3'):
+        enqueue(queue, 'alice', name)
+    enqueue(queue, 'bob', 's-b1')
+    order = []
+    while (job := queue.claim('w')) is not None:
+        order.append(job['processed_name'])
+        queue.finish(job['id'], 'w', 'done', [])
+    check(f"serial claims round-robin {order}", order == ['s-a1', 's-b1', 's-a2', 's-a3'])
+
+    # Lease esgotado: job e histórico falham juntos
+    queue = app.SQLiteJobQueue(work_dir / 'expire.sqlite3')
+    job_id = enqueue(queue, 'alice', 'expired')
+    queue.claim('dead-worker')
+    conn = queue._connection()
+    conn.execute("UPDATE processing_jobs SET attempts = ?, lease_expires_at = 0 WHERE id = ?",
+                 (app.JOB_MAX_ATTEMPTS, job_id))
+    check("exhausted job is not claimed again", queue.claim('w') is None)
+    check("exhausted job is failed", queue.get(job_id)['status'] == 'failed')
+    check("its file-history row is failed", app.FILE_HISTORY.get('expired')['status'] == 'failed')
+
+    # Fila criada antes da coluna processed_key
+    old_db = work_dir / 'old.sqlite3'
+    old = sqlite3.connect(old_db)
+    old.execute("CREATE TABLE processing_jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, "
+                "upload_name TEXT NOT NULL, processed_name TEXT NOT NULL, is_video INTEGER NOT NULL, "
+                "size INTEGER NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL, worker_id TEXT, "
+                "lease_expires_at REAL, messages TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)")
+    old.execute("INSERT INTO processing_jobs (username, upload_name, processed_name, is_video, size, status, "
+                "attempts, created_at, updated_at) VALUES ('alice', 'up/x', 'legacy', 0, 1, 'queued', 0, 0, 0)")
+    old.commit()
+    old.close()
+    job = app.SQLiteJobQueue(old_db).claim('w')
+    check("older queue gains processed_key (NULL for old jobs)", job is not None and job['processed_key'] is None)
+
+    # Cota diária debitada no enfileiramento
+    scheduler = app.FairScheduler(work_dir / 'scheduler.sqlite3', slots=1, daily_byte_quota=150)
+
+    def charged(username: str) -> bool:
+        try:
+            scheduler.charge(username, 100)
+            return True
+        except app.ProcessingRejected:
+            return False
+    check("first queued upload fits the daily quota", charged('alice'))
+    check("second one is rejected (usage was charged)", not charged('alice'))
+    check("quota is per user", charged('bob'))
+
+
+if __name__ == '__main__':
+    main()
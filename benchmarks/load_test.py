@@ -0,0 +1,328 @@
+"""Load test: concurrent mobile sessions against the running app.
+
+Each arrival (open-loop, Poisson at --rate sessions/s) is one session: log in,
+upload an image or video from a generated corpus (with a random trailer, so the
+app's same-hash reuse doesn't skip processing), follow the queued job page if
+the app is in queue mode, and download the result. Latency, throughput and
+error rate are reported per endpoint. Usage:
+
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --rate 2 --duration 60
+    python benchmarks/load_test.py --spawn --stub-tools --workers 4 --rate 10
+
+--spawn boots gunicorn with gunicorn.conf.py on a free port (rate limiting off,
+per-user concurrency lifted so a single account does not serialize the run).
+--stub-tools puts fast stand-in exiftool/ffmpeg/ffprobe first on its PATH to
+measure the web tier alone.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Stand-ins: same outputs the app reads back, no real media work
+STUB_EXIFTOOL = r"""
+import json, shutil, sys
+args = sys.argv[1:]
+if args == ['-ver']:
+    print('12.76'); sys.exit(0)
+commands = [[]]
+for arg in args:
+    if arg == '-execute':
+        commands.append([])
+    else:
+        commands[-1].append(arg)
+for command in commands:
+    if '-o' in command:
+        shutil.copyfile(command[-1], command[command.index('-o') + 1])
+    elif '-json' in command:
+        tags = {'File:FileType': 'JPEG', 'IFD0:Make': 'Meta View', 'IFD0:Model': 'Ray-Ban Meta Smart Glasses',
+                'GPS:GPSLatitude': '22 deg 58\' 46.24" S', 'Keys:Make': 'Meta View'}
+        if '-G1' not in command:
+            tags = {name.split(':')[-1]: value for name, value in tags.items()}
+        print(json.dumps([dict(tags, SourceFile=command[-1])]))
+"""
+STUB_FFMPEG = r"""
+import shutil, sys
+args = sys.argv[1:]
+if '-version' in args:
+    print('ffmpeg version stub'); sys.exit(0)
+out = args[-1]
+if '%03d' in out:
+    for i in range(3):
+        open(out.replace('%03d', f'{i:03d}'), 'wb').close()
+elif '-i' in args:
+    shutil.copyfile(args[args.index('-i') + 1], out)
+"""
+STUB_FFPROBE = r"""
+import json
+print(json.dumps({'streams': [{'codec_type': 'video', 'width': 1280, 'height': 720,
+                               'r_frame_rate': '30/1'}], 'format': {'duration': '5.0'}}))
+"""
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Redirects are timed as their own requests"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.sessions = {'ok': 0, 'failed': 0}
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def session(self, ok: bool) -> None:
+        with self.lock:
+            self.sessions['ok' if ok else 'failed'] += 1
+
+
+def percentile(ordered: list, pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def write_stub_tools(directory: Path) -> None:
+    for name, source in (('exiftool', STUB_EXIFTOOL), ('ffmpeg', STUB_FFMPEG), ('ffprobe', STUB_FFPROBE)):
+        path = directory / name
+        path.write_text(f"#!{sys.executable}\n{source}")
+        path.chmod(0o755)
+
+
+def build_corpus(directory: Path, images: int, videos: int, real_media: bool) -> list:
+    """Real clips/photos via ffmpeg testsrc when available, otherwise files that only
+    pass the app's signature checks (enough with --stub-tools)"""
+    corpus = []
+    for i in range(images):
+        path = directory / f"photo_{i}.jpg"
+        if real_media:
+            subprocess.run(['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', f'testsrc=size=3024x4032:rate=1',
+                            '-frames:v', '1', '-q:v', '3', str(path)], check=True)
+        else:
+            path.write_bytes(b'\xff\xd8\xff\xe0' + os.urandom(random.randint(200, 3000) * 1024) + b'\xff\xd9')
+        corpus.append((path, 'image/jpeg'))
+    for i in range(videos):
+        path = directory / f"clip_{i}.mov"
+        if real_media:
+            subprocess.run(['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i',
+                            f'testsrc=duration={random.randint(3, 15)}:size=1280x720:rate=30',
+                            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', str(path)], check=True)
+        else:
+            path.write_bytes(b'\x00\x00\x00\x18ftypqt  ' + os.urandom(random.randint(1000, 12000) * 1024))
+        corpus.append((path, 'video/quicktime'))
+    return corpus
+
+
+def multipart(field: str, path: Path, content_type: str, trailer: bytes = b'') -> tuple:
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f'--{boundary}\r\n'.encode(),
+        f'Content-Disposition: form-data; name="{field}"; filename="{path.name}"\r\n'.encode(),
+        f'Content-Type: {content_type}\r\n\r\n'.encode(),
+        path.read_bytes(),
+        trailer,
+        f'\r\n--{boundary}--\r\n'.encode(),
+    ])
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def timed(recorder: Recorder, opener, endpoint: str, request: urllib.request.Request, timeout: float):
+    """Returns (status, headers, body); redirects count as success"""
+    start = time.perf_counter()
+    try:
+        with opener.open(request, timeout=timeout) as response:
+            status, headers, body = response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        status, headers, body = e.code, e.headers, e.read()
+    except (urllib.error.URLError, OSError):
+        recorder.record(endpoint, time.perf_counter() - start, False)
+        return None, None, b''
+    recorder.record(endpoint, time.perf_counter() - start, status < 400)
+    return status, headers, body
+
+
+def run_session(base_url: str, args, corpus: list, recorder: Recorder) -> None:
+    opener = urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect()
+    )
+    username, password = random.choice(args.accounts)
+    ok = False
+    try:
+        form = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        status, _, _ = timed(recorder, opener, 'login', urllib.request.Request(f"{base_url}/login", data=form), args.timeout)
+        if status is None or status >= 400:
+            return
+
+        images = [item for item in corpus if item[1] == 'image/jpeg']
+        videos = [item for item in corpus if item[1] != 'image/jpeg']
+        path, content_type = random.choice(videos if videos and random.random() < args.video_ratio else images)
+        # The app reuses the result of an identical upload (same SHA-256); a random
+        # trailer keeps every upload distinct so each one is really processed
+        trailer = b'' if args.reuse_uploads else uuid.uuid4().bytes
+        body, header = multipart('image', path, content_type, trailer)
+        request = urllib.request.Request(f"{base_url}/upload", data=body, headers={'Content-Type': header})
+        endpoint = 'upload_video' if content_type != 'image/jpeg' else 'upload_image'
+        status, headers, page = timed(recorder, opener, endpoint, request, args.timeout)
+        if status is None:
+            return
+
+        # Queue mode: follow /jobs/<id> until the result page shows a download link
+        location = headers.get('Location', '') if status in (301, 302, 303) else ''
+        deadline = time.monotonic() + args.timeout
+        while '/jobs/' in location and time.monotonic() < deadline:
+            status, _, page = timed(recorder, opener, 'job_poll', urllib.request.Request(urllib.parse.urljoin(base_url, location)), args.timeout)
+            if status != 200 or b'http-equiv="refresh"' not in page:
+                break
+            time.sleep(args.poll_interval)
+        # Known upload (--reuse-uploads): redirected straight to the existing result
+        if '/files/' in location:
+            status, _, page = timed(recorder, opener, 'result_page', urllib.request.Request(urllib.parse.urljoin(base_url, location)), args.timeout)
+
+        links = re.findall(rb'href="(/download/[^"]+)"', page or b'')
+        if not links:
+            recorder.record('processing', 0.0, False)
+            return
+        if args.download:
+            status, _, _ = timed(recorder, opener, 'download', urllib.request.Request(base_url + links[0].decode()), args.timeout)
+            if status != 200:
+                return
+        ok = True
+    finally:
+        recorder.session(ok)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(args, stub_dir: Path) -> tuple:
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(args.workers), RATE_LIMIT_ENABLED='0',
+               PER_USER_CONCURRENCY=os.environ.get('PER_USER_CONCURRENCY', '1000'))
+    if args.stub_tools:
+        env['PATH'] = f"{stub_dir}{os.pathsep}{env['PATH']}"
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                            cwd=str(PROJECT_ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            urllib.request.urlopen(f"{base_url}/login", timeout=1).read()
+            return proc, base_url
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError('gunicorn exited during startup')
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError('gunicorn did not come up')
+
+
+def report(recorder: Recorder, wall: float, as_json: bool) -> None:
+    rows = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        errors = recorder.errors.get(endpoint, 0)
+        rows[endpoint] = {
+            'requests': len(ordered),
+            'throughput_rps': round(len(ordered) / wall, 2),
+            'error_rate': round(errors / len(ordered), 4),
+            'p50_ms': round(percentile(ordered, 50) * 1000, 1),
+            'p95_ms': round(percentile(ordered, 95) * 1000, 1),
+            'p99_ms': round(percentile(ordered, 99) * 1000, 1),
+            'mean_ms': round(statistics.mean(ordered) * 1000, 1),
+        }
+    if as_json:
+        print(json.dumps({'wall_seconds': round(wall, 1), 'sessions': recorder.sessions, 'endpoints': rows}, indent=2))
+        return
+    print(f"{sum(recorder.sessions.values())} sessions in {wall:.1f}s "
+          f"({recorder.sessions['ok']} ok, {recorder.sessions['failed']} failed)")
+    print(f"  {'endpoint':<14} {'reqs':>6} {'req/s':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, row in rows.items():
+        print(f"  {endpoint:<14} {row['requests']:>6} {row['throughput_rps']:>7} {row['error_rate']:>7.1%} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='running app (default: --spawn)')
+    parser.add_argument('--spawn', action='store_true', help='boot gunicorn for the run')
+    parser.add_argument('--workers', type=int, default=2, help='WEB_CONCURRENCY with --spawn')
+    parser.add_argument('--stub-tools', action='store_true', help='fast stand-in exiftool/ffmpeg/ffprobe')
+    parser.add_argument('--rate', type=float, default=2.0, help='session arrivals per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of arrivals')
+    parser.add_argument('--video-ratio', type=float, default=0.2)
+    parser.add_argument('--images', type=int, default=8, help='corpus images')
+    parser.add_argument('--videos', type=int, default=4, help='corpus videos')
+    parser.add_argument('--account', action='append', default=[], help='user:password (repeatable)')
+    parser.add_argument('--no-download', dest='download', action='store_false')
+    parser.add_argument('--reuse-uploads', action='store_true',
+                        help='send corpus files unchanged, so repeats hit the already-processed result')
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--timeout', type=float, default=180.0)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    args.accounts = [tuple(a.split(':', 1)) for a in args.account] or [('admin', 'admin123')]
+    random.seed(args.seed)
+
+    work_dir = Path(tempfile.mkdtemp(prefix='trend-load-'))
+    server = None
+    try:
+        stub_dir = work_dir / 'bin'
+        stub_dir.mkdir()
+        write_stub_tools(stub_dir)
+        real_media = not args.stub_tools and shutil.which('ffmpeg') is not None
+        corpus = build_corpus(work_dir, args.images, args.videos, real_media)
+
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            server, base_url = spawn_server(args, stub_dir)
+
+        recorder = Recorder()
+        threads = []
+        start = time.perf_counter()
+        next_arrival = start
+        while next_arrival - start < args.duration:
+            time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            thread = threading.Thread(target=run_session, args=(base_url, args, corpus, recorder), daemon=True)
+            thread.start()
+            threads.append(thread)
+            next_arrival += random.expovariate(args.rate)
+        for thread in threads:
+            thread.join(args.timeout)
+        report(recorder, time.perf_counter() - start, args.json)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Ownership check: /files, /download and /preview only serve a file to its owner or an admin.
+
+Uses the Flask test client with the SQLite file index in a temporary database and a
+pre-rendered preview, so it needs neither MySQL nor ffmpeg/exiftool. Usage:
+
+    python benchmarks/ownership_check.py
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+work_dir = Path(tempfile.mkdtemp(prefix='trend-owner-'))
+os.environ['FILES_BACKEND'] = 'sqlite'
+os.environ['FILES_DB'] = str(work_dir / 'index.sqlite3')
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+
+import app  # noqa: E402
+
+
+def check(label: str, ok: bool) -> None:
+    print(f"  {'ok  ' if ok else 'FAIL'} {label}")
+    if not ok:
+        raise SystemExit(1)
+
+
+def as_user(client, username: str, is_admin: bool = False) -> None:
+    with client.session_transaction() as session:
+        session.clear()
+        session.update(auth=True, username=username, is_admin=is_admin)
+
+
+def main() -> None:
+    file_id = app.new_file_id()
+    key = app.sharded_key(file_id, '-trend.jpg')
+    name = f"photo-{file_id.lower()}-trend.jpg"
+    legacy_name = f"bob_20240101120000_{file_id.lower()}-trend.jpg"
+    created = []
+    try:
+        for storage_key in (key, legacy_name):
+            path = app.PROCESSED_DIR / storage_key
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b'\xff\xd8\xff\xe0' + os.urandom(512))
+            created.append(path)
+            # Preview já renderizado: a rota não precisa de ffmpeg
+            preview = app.preview_cache_path(path, 'thumb')
+            preview.parent.mkdir(parents=True, exist_ok=True)
+            preview.write_bytes(b'\xff\xd8\xff\xe0')
+            created.append(preview)
+        app.FILE_HISTORY.register(name, key, 'alice', False, 516)
+        app.FILE_HISTORY.mark_finished(name, 'done', 516)
+
+        client = app.app.test_client()
+        print("ownership")
+        for user, is_admin, allowed in (('alice', False, True), ('bob', False, False), ('root', True, True)):
+            as_user(client, user, is_admin)
+            label = f"{user}{' (admin)' if is_admin else ''}"
+            result = client.get(f'/files/{name}')
+            check(f"{label}: /files {'allowed' if allowed else 'denied'}", (result.status_code == 200) == allowed)
+            download = client.get(f'/download/{name}')
+            check(f"{label}: /download {'allowed' if allowed else 'denied'}", (download.status_code == 200) == allowed)
+            preview = client.get(f'/preview/thumb/{name}')
+            expected = 200 if allowed else 404
+            check(f"{label}: /preview {preview.status_code}", preview.status_code == expected)
+
+        # Layout plano antigo sem registro no índice: dono pelo prefixo do nome
+        for user, allowed in (('bob', True), ('alice', False)):
+            as_user(client, user)
+            download = client.get(f'/download/{legacy_name}')
+            check(f"{user}: legacy /download {'allowed' if allowed else 'denied'}", (download.status_code == 200) == allowed)
+            preview = client.get(f'/preview/thumb/{legacy_name}')
+            check(f"{user}: legacy /preview {preview.status_code}", preview.status_code == (200 if allowed else 404))
+    finally:
+        for path in created:
+            path.unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    main()
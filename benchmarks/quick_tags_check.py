@@ -0,0 +1,101 @@
+"""Native tag reader check: valid HEIF/QuickTime samples parse, crafted ones fail fast.
+
+Builds the files in memory (no fixtures). Malformed boxes must make the reader
+give up (None, so the caller falls back to exiftool) in well under a second.
+Usage:
+
+    python benchmarks/quick_tags_check.py
+"""
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import app  # noqa: E402
+
+# Anything slower than this means a loop is driven by a count read from the file
+MAX_SECONDS = 0.5
+
+
+def box(box_type: bytes, body: bytes) -> bytes:
+    return struct.pack('>I', 8 + len(body)) + box_type + body
+
+
+def full_box(box_type: bytes, version: int, body: bytes) -> bytes:
+    return box(box_type, bytes([version, 0, 0, 0]) + body)
+
+
+def tiff_with_make(make: bytes) -> bytes:
+    """TIFF big-endian com um IFD0 de uma entrada (Make)"""
+    value = make + b'\0'
+    return (b'MM\0\x2a' + struct.pack('>I', 8) + struct.pack('>H', 1)
+            + struct.pack('>HHII', 0x010F, 2, len(value), 26) + struct.pack('>I', 0) + value)
+
+
+def heif(iloc_body: bytes, iloc_version: int = 1, mdat: bytes = b'') -> bytes:
+    infe = full_box(b'infe', 2, struct.pack('>HH', 1, 0) + b'Exif' + b'\0')
+    iinf = full_box(b'iinf', 0, struct.pack('>H', 1) + infe)
+    meta = full_box(b'meta', 0, iinf + full_box(b'iloc', iloc_version, iloc_body))
+    return box(b'ftyp', b'heic\0\0\0\0mif1heic') + meta + mdat
+
+
+def valid_heif() -> bytes:
+    payload = struct.pack('>I', 0) + tiff_with_make(b'Meta View')
+    # Tamanho fixo do cabeçalho até o mdat: calcula com offset provisório e refaz
+    def build(offset: int) -> bytes:
+        iloc = (bytes([0x44, 0x00]) + struct.pack('>H', 1)
+                + struct.pack('>HHH', 1, 0, 0) + struct.pack('>H', 1)
+                + struct.pack('>II', offset, len(payload)))
+        return heif(iloc)
+    head = build(0)
+    return build(len(head) + 8) + box(b'mdat', payload)
+
+
+def quicktime_huge_keys() -> bytes:
+    keys = full_box(b'keys', 0, struct.pack('>I', 0xFFFFFFFF) + struct.pack('>I', 0) + b'mdta')
+    meta = box(b'meta', full_box(b'hdlr', 0, b'\0' * 20) + keys)
+    return box(b'ftyp', b'qt  \0\0\0\0') + box(b'moov', meta)
+
+
+def read(data: bytes):
+    with tempfile.NamedTemporaryFile(suffix='.bin') as f:
+        f.write(data)
+        f.flush()
+        start = time.perf_counter()
+        tags = app.read_quick_tags(Path(f.name))
+        return tags, time.perf_counter() - start
+
+
+def check(label: str, ok: bool) -> None:
+    print(f"  {'ok  ' if ok else 'FAIL'} {label}")
+    if not ok:
+        raise SystemExit(1)
+
+
+def main() -> None:
+    print("read_quick_tags")
+    tags, _ = read(valid_heif())
+    check("valid HEIF exposes the Exif Make", tags is not None and tags.get('IFD0:Make') == 'Meta View')
+
+    samples = {
+        # iloc v1 cortado logo após item_count = 65535
+        'truncated iloc v1, item_count 65535': heif(bytes([0x44, 0x00]) + struct.pack('>H', 0xFFFF)),
+        # iloc v2 com item_count = 2^32 - 1 e tamanhos de campo zerados
+        'truncated iloc v2, item_count 2^32-1': heif(bytes([0x00, 0x00]) + struct.pack('>I', 0xFFFFFFFF), 2),
+        # Um item com 65535 extensões de 0 bytes cada (offset/length/index sem tamanho)
+        'iloc item with 65535 empty extents': heif(
+            bytes([0x00, 0x00]) + struct.pack('>H', 1) + struct.pack('>HHH', 2, 0, 0) + struct.pack('>H', 0xFFFF)
+        ),
+        'QuickTime keys count 2^32-1': quicktime_huge_keys(),
+    }
+    for label, data in samples.items():
+        tags, seconds = read(data)
+        check(f"{label}: gives up in {seconds * 1000:.1f} ms", seconds < MAX_SECONDS and 'IFD0:Make' not in (tags or {}))
+
+
+if __name__ == '__main__':
+    main()
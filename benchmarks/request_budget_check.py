@@ -0,0 +1,96 @@
+"""Request budget check: the queue wait for a processing slot is taken out of the tool deadline.
+
+Holds the only scheduler slot from another thread, then asks processing_slot() for
+one with a fixed budget. The tool deadline must shrink by the time spent waiting,
+a budget too small to wait in is refused up front, and a first-time preview
+waits for the same slot instead of starting ffmpeg next to it. Usage:
+
+    python benchmarks/request_budget_check.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+work_dir = Path(tempfile.mkdtemp(prefix='trend-budget-'))
+os.environ['SCHEDULER_DB'] = str(work_dir / 'scheduler.sqlite3')
+os.environ['PROCESSING_SLOTS'] = '1'
+os.environ['SECONDS_PER_COST'] = '1.0'
+
+import app  # noqa: E402
+
+HOLD_SECONDS = 1.5
+BUDGET = 10.0
+
+
+def check(label: str, ok: bool) -> None:
+    print(f"  {'ok  ' if ok else 'FAIL'} {label}")
+    if not ok:
+        raise SystemExit(1)
+
+
+def hold_slot(granted: threading.Event) -> None:
+    with app.PROCESSING_SCHEDULER.slot('holder', is_video=False, size=0):
+        granted.set()
+        time.sleep(HOLD_SECONDS)
+
+
+def main() -> None:
+    print("request budget")
+    granted = threading.Event()
+    holder = threading.Thread(target=hold_slot, args=(granted,))
+    holder.start()
+    granted.wait()
+
+    started = time.monotonic()
+    deadline = started + BUDGET
+    with app.processing_slot('late', False, 0, deadline) as job:
+        waited = time.monotonic() - started
+        remaining = job.remaining()
+    holder.join()
+    check(f"slot granted late (waited {waited:.2f}s)", waited >= HOLD_SECONDS * 0.8)
+    check(f"tool deadline shrank to {remaining:.2f}s of {BUDGET:.0f}s",
+          remaining <= BUDGET - waited + 0.05 and abs(job.deadline - deadline) < 0.05)
+
+    # Sem orçamento para esperar (menos que o custo de uma foto): recusa na hora
+    granted.clear()
+    holder = threading.Thread(target=hold_slot, args=(granted,))
+    holder.start()
+    granted.wait()
+    started = time.monotonic()
+    try:
+        with app.processing_slot('late', False, 0, started + 0.5):
+            rejected = False
+    except app.ProcessingRejected:
+        rejected = True
+    elapsed = time.monotonic() - started
+    holder.join()
+    check(f"budget below one photo is refused in {elapsed:.2f}s", rejected and elapsed < HOLD_SECONDS)
+
+    # Preview ainda não gerado: sem vez na fila, nenhuma ferramenta é iniciada
+    source = work_dir / 'photo.jpg'
+    source.write_bytes(b'\xff\xd8\xff\xe0' + os.urandom(256))
+    spawned = []
+    spawn_tool = app.spawn_tool
+    app.spawn_tool = lambda cmd, **kwargs: spawned.append(cmd) or spawn_tool(cmd, **kwargs)
+    granted.clear()
+    holder = threading.Thread(target=hold_slot, args=(granted,))
+    holder.start()
+    granted.wait()
+    try:
+        app.get_preview(source, 'thumb', 'viewer', time.monotonic() + 0.5)
+        rejected = False
+    except app.ProcessingRejected:
+        rejected = True
+    holder.join()
+    app.spawn_tool = spawn_tool
+    check("first-time preview waits for a scheduler slot (no tool started)", rejected and not spawned)
+
+
+if __name__ == '__main__':
+    main()
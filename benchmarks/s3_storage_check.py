@@ -0,0 +1,87 @@
+"""S3Storage check against an in-process moto S3: publish, exists, local_path, download_response.
+
+Needs boto3 and moto (pip install "moto[s3]"); no real bucket or credentials.
+Usage:
+
+    python benchmarks/s3_storage_check.py
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import boto3  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+import app  # noqa: E402
+
+BUCKET = 'storage-check'
+PART_SIZE = 5 * 1024 * 1024
+
+
+def check(label: str, ok: bool) -> None:
+    print(f"  {'ok  ' if ok else 'FAIL'} {label}")
+    if not ok:
+        raise SystemExit(1)
+
+
+def main() -> None:
+    with mock_aws(), tempfile.TemporaryDirectory() as tmp:
+        boto3.client('s3').create_bucket(Bucket=BUCKET)
+        cache_dir = Path(tmp) / 'cache'
+        storage = app.S3Storage(BUCKET, 'processed/', cache_dir, cache_max_bytes=3 * PART_SIZE + 4096,
+                                part_size=PART_SIZE)
+        print("S3Storage on moto")
+
+        # Acima de part_size: exercita o upload multipart
+        payload = os.urandom(PART_SIZE + 1234)
+        source = Path(tmp) / 'out.mp4'
+        source.write_bytes(payload)
+        storage.publish(source, 'ab/cd/one.mp4')
+        check("publish moves the file into the cache", not source.exists() and (cache_dir / 'ab/cd/one.mp4').is_file())
+        check("exists() for a published key", storage.exists('ab/cd/one.mp4'))
+        check("exists() for a missing key", not storage.exists('ab/cd/missing.mp4'))
+        head = boto3.client('s3').head_object(Bucket=BUCKET, Key='processed/ab/cd/one.mp4')
+        check("object stored under the prefix", head['ContentLength'] == len(payload))
+
+        (cache_dir / 'ab/cd/one.mp4').unlink()
+        path = storage.local_path('ab/cd/one.mp4')
+        check("local_path() refetches after a cache miss", path is not None and path.read_bytes() == payload)
+        check("local_path() for a missing key", storage.local_path('ab/cd/missing.mp4') is None)
+
+        with app.app.test_request_context():
+            response = storage.download_response('ab/cd/one.mp4', 'video.mp4')
+            body = b''.join(response.response)
+            check("download_response() streams the object", body == payload)
+            check("download_response() sets length and name",
+                  response.content_length == len(payload)
+                  and 'filename="video.mp4"' in response.headers['Content-Disposition'])
+
+        # LRU: um acerto no cache protege a entrada da próxima evicção
+        for name in ('two', 'three'):
+            extra = Path(tmp) / f'{name}.mp4'
+            extra.write_bytes(os.urandom(PART_SIZE))
+            storage.publish(extra, f'ab/cd/{name}.mp4')
+            time.sleep(0.05)
+        mtime_before = (cache_dir / 'ab/cd/one.mp4').stat().st_mtime_ns
+        storage.local_path('ab/cd/one.mp4')
+        check("cache hit keeps mtime (preview cache key)",
+              (cache_dir / 'ab/cd/one.mp4').stat().st_mtime_ns == mtime_before)
+        extra = Path(tmp) / 'four.mp4'
+        extra.write_bytes(os.urandom(PART_SIZE))
+        storage.publish(extra, 'ab/cd/four.mp4')
+        cached = sorted(p.name for p in (cache_dir / 'ab/cd').iterdir())
+        check(f"eviction drops the least recently used entry {cached}",
+              'one.mp4' in cached and 'two.mp4' not in cached)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Threads extras atendem páginas, login e as recusas rápidas (503) enquanto os slots de
+# processamento (PROCESSING_SLOTS, no FairScheduler) estão ocupados com encodes
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# Import the app once in the master; workers share its pages copy-on-write
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+
+def when_ready(server):
+    # Move everything imported so far out of the GC's tracked generations so
+    # collections in the workers don't touch (and copy) the shared pages
+    gc.freeze()
+
+
+# Recicla o worker pelo uso de memória, não por contagem de requests: acima do limite
+# ele termina os requests em andamento e o master sobe um novo (0 desliga)
+worker_max_rss_mb = int(os.environ.get('WORKER_MAX_RSS_MB', 0))
+
+
+def worker_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0
+
+
+def post_request(worker, req, environ, resp):
+    if worker_max_rss_mb and worker.alive:
+        rss = worker_rss_mb()
+        if rss > worker_max_rss_mb:
+            worker.log.info("Worker %s RSS %.0fMB above %sMB, recycling", worker.pid, rss, worker_max_rss_mb)
+            worker.alive = False
@@ -0,0 +1,209 @@
+const uploadArea = document.getElementById('uploadArea');
+const fileInput = document.getElementById('fileInput');
+const mediaPreview = document.getElementById('mediaPreview');
+const imageContainer = document.getElementById('imageContainer');
+const videoContainer = document.getElementById('videoContainer');
+const previewImg = document.getElementById('previewImg');
+const previewVideo = document.getElementById('previewVideo');
+const previewInfo = document.getElementById('previewInfo');
+const submitBtn = document.getElementById('submitBtn');
+const uploadForm = document.getElementById('uploadForm');
+
+// Alvo do pré-processamento (definido pelo servidor no formulário)
+const CLIENT_MAX_EDGE = Number(uploadForm.dataset.maxEdge) || 0;
+const CLIENT_JPEG_QUALITY = Number(uploadForm.dataset.jpegQuality) || 0.9;
+const CLIENT_RECOMPRESS_BYTES = Number(uploadForm.dataset.recompressBytes) || Infinity;
+
+// Click to select file
+uploadArea.addEventListener('click', () => {
+    fileInput.click();
+});
+
+// Drag and drop
+uploadArea.addEventListener('dragover', (e) => {
+    e.preventDefault();
+    uploadArea.classList.add('dragover');
+});
+
+uploadArea.addEventListener('dragleave', () => {
+    uploadArea.classList.remove('dragover');
+});
+
+uploadArea.addEventListener('drop', (e) => {
+    e.preventDefault();
+    uploadArea.classList.remove('dragover');
+    const files = e.dataTransfer.files;
+    if (files.length > 0) {
+        fileInput.files = files;
+        handleFileSelect(files[0]);
+    }
+});
+
+// File selection
+fileInput.addEventListener('change', (e) => {
+    if (e.target.files.length > 0) {
+        handleFileSelect(e.target.files[0]);
+    }
+});
+
+function handleFileSelect(file) {
+    // Reset preview containers
+    imageContainer.style.display = 'none';
+    videoContainer.style.display = 'none';
+
+    // Check if file is image
+    const isImage = file.type.startsWith('image/');
+
+    if (!isImage) {
+        alert('Por favor, selecione apenas imagens.');
+        return;
+    }
+
+    // Show preview based on file type
+    const reader = new FileReader();
+    reader.onload = (e) => {
+        if (isImage) {
+            previewImg.src = e.target.result;
+            imageContainer.style.display = 'block';
+            submitBtn.textContent = 'Processar foto';
+        }
+
+        mediaPreview.style.display = 'block';
+
+        // File info
+        const sizeMB = (file.size / (1024 * 1024)).toFixed(2);
+        previewInfo.textContent = `${file.name} (${sizeMB} MB)`;
+
+        // Enable submit button
+        submitBtn.disabled = false;
+    };
+    reader.readAsDataURL(file);
+}
+
+// Reduce and recompress photos before upload (JPEG/PNG only: HEIC is already the
+// trend's format and most browsers can't decode it). Falls back to the original file.
+async function preprocessImage(file) {
+    if (!CLIENT_MAX_EDGE || !window.createImageBitmap || !['image/jpeg', 'image/png'].includes(file.type)) {
+        return file;
+    }
+
+    const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+    const scale = Math.min(1, CLIENT_MAX_EDGE / Math.max(bitmap.width, bitmap.height));
+    if (scale === 1 && file.type === 'image/jpeg' && file.size <= CLIENT_RECOMPRESS_BYTES) {
+        bitmap.close();
+        return file;
+    }
+
+    const width = Math.round(bitmap.width * scale);
+    const height = Math.round(bitmap.height * scale);
+    const draw = (context) => {
+        // JPEG has no alpha: transparent PNG areas become white, not black
+        context.fillStyle = '#fff';
+        context.fillRect(0, 0, width, height);
+        context.drawImage(bitmap, 0, 0, width, height);
+    };
+
+    let blob;
+    if (typeof OffscreenCanvas !== 'undefined') {
+        const canvas = new OffscreenCanvas(width, height);
+        draw(canvas.getContext('2d'));
+        blob = await canvas.convertToBlob({ type: 'image/jpeg', quality: CLIENT_JPEG_QUALITY });
+    } else {
+        const canvas = document.createElement('canvas');
+        canvas.width = width;
+        canvas.height = height;
+        draw(canvas.getContext('2d'));
+        blob = await new Promise((resolve) => canvas.toBlob(resolve, 'image/jpeg', CLIENT_JPEG_QUALITY));
+    }
+    bitmap.close();
+
+    // Keep the original if recompressing didn't pay off
+    if (!blob || (scale === 1 && blob.size >= file.size)) {
+        return file;
+    }
+    const name = file.name.replace(/\.[^.]+$/, '') + '.jpg';
+    return new File([blob], name, { type: 'image/jpeg', lastModified: file.lastModified });
+}
+
+// SHA-256 of the original file. Web Crypto has no incremental digest, so the file is
+// hashed in one call; uploads are capped at 16MB, which bounds the buffer
+async function sha256Hex(file) {
+    if (!window.crypto || !crypto.subtle) {
+        return null;
+    }
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+// Ask the server whether this exact file was already processed; returns the result URL
+async function findProcessedResult(sha256) {
+    const response = await fetch(uploadForm.dataset.checkUrl, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ sha256 })
+    });
+    if (!response.ok || !(response.headers.get('Content-Type') || '').includes('application/json')) {
+        return null;
+    }
+    const result = await response.json();
+    return result.match ? result.url : null;
+}
+
+uploadForm.addEventListener('submit', async (e) => {
+    const file = fileInput.files[0];
+    if (!file) {
+        return;
+    }
+    e.preventDefault();
+    submitBtn.disabled = true;
+    submitBtn.textContent = 'Preparando...';
+
+    // Hash-first handshake: known files go straight to their result, nothing is uploaded
+    try {
+        const sha256 = await sha256Hex(file);
+        if (sha256) {
+            const resultUrl = await findProcessedResult(sha256);
+            if (resultUrl) {
+                window.location.href = resultUrl;
+                return;
+            }
+        }
+    } catch (err) {
+        console.log('Verificação por hash indisponível, enviando o arquivo', err);
+    }
+
+    try {
+        const prepared = await preprocessImage(file);
+        if (prepared !== file) {
+            const transfer = new DataTransfer();
+            transfer.items.add(prepared);
+            fileInput.files = transfer.files;
+            const sizeMB = (prepared.size / (1024 * 1024)).toFixed(2);
+            const originalMB = (file.size / (1024 * 1024)).toFixed(2);
+            previewInfo.textContent = `${prepared.name} (${sizeMB} MB, otimizada de ${originalMB} MB)`;
+        }
+    } catch (err) {
+        console.log('Pré-processamento indisponível, enviando o original', err);
+    }
+
+    submitBtn.textContent = 'Enviando...';
+    // form.submit() doesn't fire the submit event again
+    uploadForm.submit();
+});
+
+// Mobile menu toggle
+function toggleMobileMenu() {
+    const mobileMenu = document.getElementById('mobileMenu');
+    mobileMenu.classList.toggle('show');
+}
+
+// Close mobile menu when clicking outside
+document.addEventListener('click', function(event) {
+    const mobileMenu = document.getElementById('mobileMenu');
+    const toggleButton = document.querySelector('.mobile-menu-toggle');
+
+    if (!mobileMenu.contains(event.target) && !toggleButton.contains(event.target)) {
+        mobileMenu.classList.remove('show');
+    }
+});
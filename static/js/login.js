@@ -0,0 +1,11 @@
+// Auto-focus no primeiro campo
+document.getElementById('username').focus();
+
+// Animação suave no submit
+document.querySelector('form').addEventListener('submit', function(e) {
+    const btn = document.querySelector('.btn');
+    btn.style.transform = 'scale(0.98)';
+    setTimeout(() => {
+        btn.style.transform = '';
+    }, 150);
+});
@@ -0,0 +1,90 @@
+// Auto-focus no primeiro campo
+document.getElementById('username').focus();
+
+// Validação em tempo real
+const form = document.getElementById('registerForm');
+const username = document.getElementById('username');
+const password = document.getElementById('password');
+const email = document.getElementById('email');
+const instagram = document.getElementById('instagram');
+const whatsapp = document.getElementById('whatsapp');
+
+// Validação de username
+username.addEventListener('input', function() {
+    if (this.value.length >= 3) {
+        this.classList.remove('error');
+    } else {
+        this.classList.add('error');
+    }
+});
+
+// Validação de senha
+password.addEventListener('input', function() {
+    if (this.value.length >= 6) {
+        this.classList.remove('error');
+    } else {
+        this.classList.add('error');
+    }
+});
+
+// Validação de email
+email.addEventListener('input', function() {
+    const emailRegex = /^[^\s@]+@[^\s@]+\.[^\s@]+$/;
+    if (emailRegex.test(this.value)) {
+        this.classList.remove('error');
+    } else {
+        this.classList.add('error');
+    }
+});
+
+// Validação e formatação de Instagram
+instagram.addEventListener('input', function() {
+    let value = this.value.replace(/[^a-zA-Z0-9._]/g, '');
+    if (value && !value.startsWith('@')) {
+        value = '@' + value;
+    }
+    this.value = value;
+
+    // Validação
+    if (value.length >= 2) { // @ + pelo menos 1 caractere
+        this.classList.remove('error');
+    } else {
+        this.classList.add('error');
+    }
+});
+
+// Validação e formatação de WhatsApp
+whatsapp.addEventListener('input', function() {
+    let value = this.value.replace(/\D/g, '');
+    if (value.length > 11) value = value.slice(0, 11);
+
+    if (value.length > 0) {
+        if (value.length <= 2) {
+            value = `(${value}`;
+        } else if (value.length <= 7) {
+            value = `(${value.slice(0,2)}) ${value.slice(2)}`;
+        } else {
+            value = `(${value.slice(0,2)}) ${value.slice(2,7)}-${value.slice(7)}`;
+        }
+    }
+
+    this.value = value;
+
+    // Validação - precisa ter pelo menos 10 dígitos
+    const numbersOnly = value.replace(/\D/g, '');
+    if (numbersOnly.length >= 10) {
+        this.classList.remove('error');
+    } else {
+        this.classList.add('error');
+    }
+});
+
+// Animação suave no submit
+form.addEventListener('submit', function(e) {
+    const btn = document.getElementById('submitBtn');
+    btn.style.transform = 'scale(0.98)';
+    btn.textContent = 'Criando conta...';
+    setTimeout(() => {
+        btn.style.transform = '';
+    }, 150);
+});